@@ -0,0 +1,64 @@
+"""Measure offline enrichment from a CSV GeoIP database, in lookups/s.
+
+Usage: python benchmarks/geoip_lookup.py --ips 100000 --ranges 10000 [--repeat 5]
+
+The database maps ``--ranges`` /24 networks to as many distinct records,
+and every IP looked up is covered by one of them.
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from fail2banmonitoring.services.geoip import GeoIPDatabase
+
+
+def write_database(path: Path, ranges: int) -> None:
+    """Write a CSV database of ``ranges`` networks, 10.x.y.0/24."""
+    rows = ["network,country,countryCode,city,lat,lon,as"]
+    rows.extend(
+        f"10.{i >> 8 & 255}.{i & 255}.0/24,Country {i % 200},C{i % 100:02},City {i},"
+        f"{i % 90},{i % 180},AS{i} Net {i}"
+        for i in range(ranges)
+    )
+    path.write_text("\n".join(rows) + "\n")
+
+
+def measure(name: str, ips: int, repeat: int, lookup: Callable[[], object]) -> None:
+    """Time ``lookup`` ``repeat`` times and print the throughput of the fastest run."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        lookup()
+        runs.append(time.perf_counter() - start)
+    elapsed = min(runs)
+    print(f"{name:<12} {ips / elapsed:>12,.0f} lookups/s {elapsed:>7.2f}s best of {repeat}")  # noqa: T201
+
+
+def main() -> None:
+    """Run the benchmark and print the throughput of lookup() and lookup_many()."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ips", type=int, default=100_000)
+    parser.add_argument("--ranges", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5, help="runs, the fastest is kept")
+    args = parser.parse_args()
+
+    rng = random.Random(0)  # noqa: S311
+    ips = [
+        f"10.{(n := rng.randrange(args.ranges)) >> 8 & 255}.{n & 255}.{rng.randrange(256)}"
+        for _ in range(args.ips)
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "geoip.csv"
+        write_database(path, args.ranges)
+        database = GeoIPDatabase([str(path)])
+        measure("lookup_many", len(ips), args.repeat, lambda: database.lookup_many(ips))
+        measure("lookup", len(ips), args.repeat, lambda: [database.lookup(ip) for ip in ips])
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Generate synthetic fail2ban logs of any size, for benchmarks.
+
+Usage: python -m benchmarks.loggen --lines 100000000 --output fail2ban.log \
+    --jails sshd=6 nginx-http-auth=3 postfix=1 --ipv6-ratio 0.2 --duplicate-rate 0.7
+
+Lines are written in blocks, so memory stays bounded whatever the size.
+Most lines are filter matches (``Found``) as in real logs, the others are
+Ban and Unban actions. The log is the same for the same profile and seed.
+"""
+
+import argparse
+import random
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Lines generated per block
+BLOCK_LINES = 10_000
+# Banned IPs remembered for repeat bans and unbans
+POOL_SIZE = 100_000
+# Multiplier spreading consecutive IP numbers over the address space, odd so it is a bijection
+_SPREAD = 2_654_435_761
+# First octets of private, loopback and multicast ranges, skipped for IPv4
+_SKIPPED_OCTETS = frozenset({0, 10, 127, *range(224, 256)})
+
+DEFAULT_JAILS = {"sshd": 6.0, "nginx-http-auth": 2.0, "postfix-sasl": 1.0, "recidive": 1.0}
+
+ACTION = "%s fail2ban.actions        [1234]: NOTICE  [%s] %s %s\n"
+FOUND = "%s fail2ban.filter         [1234]: INFO    [%s] Found %s - %s\n"
+
+
+@dataclass(frozen=True)
+class LogProfile:
+    """What a synthetic log looks like.
+
+    Attributes
+    ----------
+    lines : int
+        Lines in the log.
+    jails : dict[str, float]
+        Relative weight of each jail.
+    ipv6_ratio : float
+        Share of new IPs that are IPv6.
+    duplicate_rate : float
+        Share of bans of an IP banned before rather than a new one.
+    event_ratio : float
+        Share of lines that are Ban or Unban actions, the others being ``Found`` lines.
+    unban_ratio : float
+        Share of actions that are Unbans.
+    seed : int
+        Seed of the random generator.
+
+    """
+
+    lines: int = 1_000_000
+    jails: dict[str, float] = field(default_factory=lambda: dict(DEFAULT_JAILS))
+    ipv6_ratio: float = 0.2
+    duplicate_rate: float = 0.5
+    event_ratio: float = 0.25
+    unban_ratio: float = 0.3
+    seed: int = 0
+
+
+@dataclass
+class LogSummary:
+    """What a generated log holds, to check the parser against.
+
+    Attributes
+    ----------
+    lines : int
+        Lines written.
+    bytes : int
+        Size of the log.
+    events : int
+        Ban and Unban lines.
+    bans : int
+        Ban lines.
+    distinct_ips : int
+        Distinct IPs banned.
+
+    """
+
+    lines: int = 0
+    bytes: int = 0
+    events: int = 0
+    bans: int = 0
+    distinct_ips: int = 0
+
+
+class LogGenerator:
+    """Produce the lines of a log following a ``LogProfile``, counting them in ``summary``."""
+
+    def __init__(self, profile: LogProfile, start: datetime | None = None) -> None:
+        """Prepare a log whose first line is timestamped ``start``."""
+        self.profile = profile
+        self.summary = LogSummary()
+        self.random = random.Random(profile.seed)  # noqa: S311
+        self.time = start or datetime(2024, 6, 1)  # noqa: DTZ001
+        self.second = f"{self.time:%Y-%m-%d %H:%M:%S}"
+        self.ms = 0
+        self.jails = list(profile.jails)
+        weights = list(profile.jails.values())
+        self.cum_weights = [sum(weights[: i + 1]) for i in range(len(weights))]
+        self.pool: list[str] = []
+        self._counter = 0
+
+    def _new_ip(self) -> str:
+        """Return an IP never returned before."""
+        while True:
+            self._counter += 1
+            spread = self._counter * _SPREAD % (1 << 32)
+            if self.random.random() < self.profile.ipv6_ratio:
+                return f"2a0{spread >> 28:x}:{spread >> 12 & 0xFFFF:x}:{spread & 0xFFF:x}::{self._counter & 0xFFFF:x}"
+            if spread >> 24 not in _SKIPPED_OCTETS:
+                return f"{spread >> 24}.{spread >> 16 & 255}.{spread >> 8 & 255}.{spread & 255}"
+
+    def _banned_ip(self) -> str:
+        """Return the IP of a ban, a repeat offender with ``duplicate_rate``."""
+        if self.pool and self.random.random() < self.profile.duplicate_rate:
+            return self.random.choice(self.pool)
+        ip = self._new_ip()
+        self.summary.distinct_ips += 1
+        if len(self.pool) < POOL_SIZE:
+            self.pool.append(ip)
+        else:
+            self.pool[self.random.randrange(POOL_SIZE)] = ip
+        return ip
+
+    def _stamp(self, step_ms: int) -> tuple[str, str]:
+        """Advance the clock by ``step_ms`` and return the timestamp and its second."""
+        self.ms += step_ms
+        if self.ms >= 1000:
+            self.time += timedelta(seconds=self.ms // 1000)
+            self.ms %= 1000
+            self.second = f"{self.time:%Y-%m-%d %H:%M:%S}"
+        return f"{self.second},{self.ms:03d}", self.second
+
+    def block(self, lines: int) -> str:
+        """Return the next ``lines`` lines."""
+        rng = self.random
+        profile = self.profile
+        out = []
+        jails = rng.choices(self.jails, cum_weights=self.cum_weights, k=lines)
+        for jail in jails:
+            # A few lines per second
+            stamp, second = self._stamp(rng.randrange(1, 500))
+            if rng.random() >= profile.event_ratio:
+                ip = rng.choice(self.pool) if self.pool else self._new_ip()
+                out.append(FOUND % (stamp, jail, ip, second))
+                continue
+            self.summary.events += 1
+            if self.pool and rng.random() < profile.unban_ratio:
+                action, ip = "Unban", rng.choice(self.pool)
+            else:
+                action, ip = "Ban", self._banned_ip()
+                self.summary.bans += 1
+            out.append(ACTION % (stamp, jail, action, ip))
+        text = "".join(out)
+        self.summary.lines += lines
+        self.summary.bytes += len(text)
+        return text
+
+    def blocks(self) -> Iterator[str]:
+        """Yield the whole log, ``BLOCK_LINES`` lines at a time."""
+        remaining = self.profile.lines
+        while remaining > 0:
+            lines = min(remaining, BLOCK_LINES)
+            remaining -= lines
+            yield self.block(lines)
+
+
+def write_log(path: Path, profile: LogProfile) -> LogSummary:
+    """Write the log of ``profile`` to ``path`` and return its summary."""
+    generator = LogGenerator(profile)
+    with path.open("w") as log_file:
+        log_file.writelines(generator.blocks())
+    return generator.summary
+
+
+def parse_jails(values: list[str]) -> dict[str, float]:
+    """Turn ``name=weight`` arguments into jail weights, a missing weight being 1."""
+    jails = {}
+    for value in values:
+        name, _, weight = value.partition("=")
+        jails[name] = float(weight or 1)
+    return jails
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the options describing a ``LogProfile`` to ``parser``."""
+    defaults = LogProfile()
+    parser.add_argument("--lines", type=int, default=defaults.lines)
+    parser.add_argument(
+        "--jails",
+        nargs="+",
+        default=[f"{name}={weight:g}" for name, weight in defaults.jails.items()],
+        help="jails as name=weight",
+    )
+    parser.add_argument("--ipv6-ratio", type=float, default=defaults.ipv6_ratio)
+    parser.add_argument("--duplicate-rate", type=float, default=defaults.duplicate_rate)
+    parser.add_argument("--event-ratio", type=float, default=defaults.event_ratio)
+    parser.add_argument("--unban-ratio", type=float, default=defaults.unban_ratio)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def profile_from_arguments(args: argparse.Namespace) -> LogProfile:
+    """Return the ``LogProfile`` given on the command line."""
+    return LogProfile(
+        lines=args.lines,
+        jails=parse_jails(args.jails),
+        ipv6_ratio=args.ipv6_ratio,
+        duplicate_rate=args.duplicate_rate,
+        event_ratio=args.event_ratio,
+        unban_ratio=args.unban_ratio,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    """Write a log and print its summary."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_profile_arguments(parser)
+    parser.add_argument("--output", type=Path, required=True)
+    args = parser.parse_args()
+    summary = write_log(args.output, profile_from_arguments(args))
+    print(  # noqa: T201
+        f"{summary.lines:,} lines, {summary.bytes / 1e6:,.1f} MB, {summary.events:,} events, "
+        f"{summary.bans:,} bans of {summary.distinct_ips:,} IPs",
+    )
+
+
+if __name__ == "__main__":
+    main()
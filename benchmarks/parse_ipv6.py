@@ -0,0 +1,73 @@
+"""Compare event scanning throughput on IPv4-only and mixed IPv4/IPv6 logs.
+
+The bare IPv4-only findall the parser used to run is printed as the floor;
+it extracts no jail, action or timestamp.
+
+Usage: python benchmarks/parse_ipv6.py --lines 1000000 --ipv6-ratio 0.2
+"""
+
+import argparse
+import random
+import re
+import time
+from collections.abc import Callable
+
+from fail2banmonitoring.fail2ban.events import TimestampParser, scan_events
+
+LINE = "2024-06-01 12:00:00,000 fail2ban.actions        [1234]: NOTICE  [sshd] {action} {ip}\n"
+# The pattern the parser used before IPv6 support, as the reference
+IPV4_ONLY = re.compile(rb"Ban\s+(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})")
+
+
+def make_log(lines: int, ipv6_ratio: float) -> bytes:
+    """Return a synthetic log where one line in four is a ban."""
+    rng = random.Random(0)  # noqa: S311
+    out = []
+    for i in range(lines):
+        if rng.random() < ipv6_ratio:
+            ip = f"2001:db8:{rng.randrange(65536):x}::{rng.randrange(65536):x}"
+        else:
+            ip = f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}"
+        out.append(LINE.format(action="Ban" if i % 4 == 0 else "Found", ip=ip))
+    return "".join(out).encode()
+
+
+def measure(name: str, lines: int, scan: Callable[[], int]) -> float:
+    """Time ``scan`` and print its throughput."""
+    start = time.perf_counter()
+    found = scan()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {lines / elapsed:>12,.0f} lines/s {found:>9} bans")  # noqa: T201
+    return elapsed
+
+
+def main() -> None:
+    """Run the benchmark and print the cost of IPv6 support."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--ipv6-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    ipv4_log = make_log(args.lines, 0.0)
+    mixed_log = make_log(args.lines, args.ipv6_ratio)
+    reference = measure(
+        "ipv4-only regex, ipv4 log",
+        args.lines,
+        lambda: len(IPV4_ONLY.findall(ipv4_log)),
+    )
+    ipv4 = measure(
+        "events, ipv4 log",
+        args.lines,
+        lambda: len(scan_events(ipv4_log, TimestampParser())),
+    )
+    mixed = measure(
+        f"events, {args.ipv6_ratio:.0%} ipv6 log",
+        args.lines,
+        lambda: len(scan_events(mixed_log, TimestampParser())),
+    )
+    print(f"ipv6 cost: {mixed / ipv4:.2f}x the ipv4 log")  # noqa: T201
+    print(f"vs bare findall: {ipv4 / reference:.2f}x ipv4, {mixed / reference:.2f}x mixed")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Measure how Fail2BanLogParser throughput scales with worker processes.
+
+Usage: python benchmarks/parse_parallel.py --lines 5000000 --workers 1 2 4 8
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from fail2banmonitoring.fail2ban.log_parser import Fail2BanLogParser
+
+LINE = "2024-06-01 12:00:00,000 fail2ban.actions        [1234]: NOTICE  [sshd] {action} {ip}\n"
+
+
+def write_log(path: Path, lines: int) -> None:
+    """Write a synthetic log where one line in four is a ban."""
+    rng = random.Random(0)  # noqa: S311
+    with path.open("w") as log_file:
+        for i in range(lines):
+            ip = f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}"
+            action = "Ban" if i % 4 == 0 else "Found"
+            log_file.write(LINE.format(action=action, ip=ip))
+
+
+def main() -> None:
+    """Run the benchmark and print one result line per worker count."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=2_000_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_path = Path(tmp_dir) / "fail2ban.log"
+        write_log(log_path, args.lines)
+        size_mb = log_path.stat().st_size / 1e6
+        baseline = None
+        for workers in args.workers:
+            log_parser = Fail2BanLogParser(
+                log_path=str(log_path),
+                output_file=None,
+                workers=workers,
+            )
+            start = time.perf_counter()
+            counts = log_parser.count_banned_ips()
+            elapsed = time.perf_counter() - start
+            baseline = baseline or counts
+            if counts != baseline:
+                msg = f"Result with {workers} workers differs from the serial path"
+                raise RuntimeError(msg)
+            print(  # noqa: T201
+                f"workers={workers:<3} {args.lines / elapsed:>12,.0f} lines/s "
+                f"{size_mb / elapsed:>8.1f} MB/s {elapsed:>7.2f}s",
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Measure the startup of a one-shot run that finds nothing new, as most cron runs do.
+
+Usage: python -m benchmarks.startup [--lines 10000] [--repeat 5] [--top 10]
+
+A synthetic log is ingested up to a checkpoint in process, then lines without
+any Ban or Unban action are appended, and ``python -X importtime -m
+fail2banmonitoring`` is run on it in a subprocess. The best wall time and the
+import time of the best run are reported, with the modules that took longest
+to import. No database or network is needed, since such a run must not reach
+them.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+
+from benchmarks.loggen import LogGenerator, LogProfile
+from fail2banmonitoring.fail2ban.log_parser import Fail2BanLogParser
+
+# self and cumulative microseconds, then the module indented by its nesting
+_IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+@dataclass
+class StartupRun:
+    """What one run of the entry point cost.
+
+    Attributes
+    ----------
+    seconds : float
+        Wall time of the process.
+    import_seconds : float
+        Time spent importing modules, as reported by ``-X importtime``.
+    modules : int
+        Modules imported.
+    slowest : list[tuple[str, float]]
+        Top-level imports and their cumulative seconds, slowest first.
+
+    """
+
+    seconds: float
+    import_seconds: float
+    modules: int
+    slowest: list[tuple[str, float]] = field(default_factory=list)
+
+
+def parse_importtime(stderr: str) -> tuple[float, int, list[tuple[str, float]]]:
+    """Return the total import seconds, the module count and the top-level imports of ``-X importtime`` output."""
+    total = 0.0
+    modules = 0
+    top_level = []
+    for line in stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match is None:
+            continue
+        modules += 1
+        # Nested imports are already counted in the cumulative time of their parent
+        if not match[3]:
+            cumulative = int(match[2]) / 1e6
+            total += cumulative
+            top_level.append((match[4], cumulative))
+    top_level.sort(key=lambda item: item[1], reverse=True)
+    return total, modules, top_level
+
+
+def prepare_log(directory: Path, lines: int) -> dict[str, str]:
+    """Write a log ingested up to a checkpoint followed by lines without events, and return the environment to run on it."""
+    log_path = directory / "fail2ban.log"
+    checkpoint_path = directory / "checkpoint.json"
+    profile = LogProfile(lines=lines)
+    generator = LogGenerator(profile)
+    log_path.write_text(generator.block(lines))
+    parser = Fail2BanLogParser(str(log_path), None, checkpoint_path=str(checkpoint_path))
+    parser.read_events()
+    parser.commit_checkpoint()
+    # Matches of the filters only, as fail2ban writes between two bans
+    generator.profile = replace(profile, event_ratio=0.0)
+    with log_path.open("a") as log_file:
+        log_file.write(generator.block(lines))
+    return {
+        "LOG_PATH": str(log_path),
+        "CHECKPOINT_PATH": str(checkpoint_path),
+        # Required, but never used by a run that finds nothing new
+        "DRIVER": "sqlite+aiosqlite",
+        "HOST": "unused",
+        "USERNAME": "unused",
+        "PASSWORD": "unused",
+        "DATABASE": str(directory / "unused.db"),
+    }
+
+
+def run_once(environment: dict[str, str], checkpoint: bytes, checkpoint_path: Path) -> StartupRun:
+    """Run the entry point on the prepared log, from the same checkpoint each time."""
+    checkpoint_path.write_bytes(checkpoint)
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "fail2banmonitoring"],
+        env={**os.environ, **environment},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    seconds = time.perf_counter() - start
+    import_seconds, modules, slowest = parse_importtime(result.stderr)
+    return StartupRun(seconds, import_seconds, modules, slowest)
+
+
+def main() -> None:
+    """Parse the arguments, run the entry point and print the measurements."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=10_000, help="lines ingested, then lines appended without events")
+    parser.add_argument("--repeat", type=int, default=5, help="runs, the fastest is kept")
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level imports shown")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        environment = prepare_log(Path(tmp_dir), args.lines)
+        checkpoint_path = Path(environment["CHECKPOINT_PATH"])
+        checkpoint = checkpoint_path.read_bytes()
+        runs = [run_once(environment, checkpoint, checkpoint_path) for _ in range(args.repeat)]
+    best = min(runs, key=lambda run: run.seconds)
+    print(  # noqa: T201
+        f"wall {best.seconds * 1000:.0f} ms, imports {best.import_seconds * 1000:.0f} ms "
+        f"for {best.modules} modules, best of {args.repeat}",
+    )
+    for name, seconds in best.slowest[: args.top]:
+        print(f"  {seconds * 1000:8.1f} ms  {name}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
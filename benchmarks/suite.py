@@ -0,0 +1,221 @@
+"""Measure parsing, enrichment and IP writes on a synthetic log, and save the results as JSON.
+
+Usage: python -m benchmarks.suite --lines 1000000 --output results.json [--baseline previous.json]
+
+The log is generated with the options of ``benchmarks.loggen``. Enrichment
+queries a local ip-api stand-in, and IP records are written to a temporary
+SQLite database, so nothing leaves the machine. With ``--baseline``, each
+throughput is compared with a previous result file and the exit code is 1
+if any dropped by more than ``--tolerance``.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import aiohttp
+
+from benchmarks.loggen import (
+    LogProfile,
+    LogSummary,
+    add_profile_arguments,
+    profile_from_arguments,
+    write_log,
+)
+from fail2banmonitoring.db.config import SqlConnectorConfig, SqlEngine
+from fail2banmonitoring.fail2ban.events import BanEvent
+from fail2banmonitoring.fail2ban.log_parser import Fail2BanLogParser
+from fail2banmonitoring.models.ip import IpModel
+from fail2banmonitoring.services.ip import IPMetadata
+from fail2banmonitoring.services.providers import IPAPIProvider
+from fail2banmonitoring.services.rate_limit import RateLimiter
+from fail2banmonitoring.services.standin import IPAPIStandIn
+
+# Version of the result file layout, bumped when it changes
+RESULTS_VERSION = 1
+# Requests per minute allowed by the stand-in, high enough not to be measured
+STANDIN_RATE_LIMIT = (1_000_000, 60.0)
+
+
+def git_commit() -> str | None:
+    """Return the commit the benchmarks run on, None outside a git checkout."""
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"],  # noqa: S607
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def bench_parse(
+    log_path: Path,
+    summary: LogSummary,
+    workers: int,
+    repeat: int,
+) -> tuple[dict[str, Any], list[BanEvent]]:
+    """Parse the whole log ``repeat`` times and return the best measurement with the events found."""
+    parser = Fail2BanLogParser(str(log_path), None, workers=workers)
+    elapsed = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        events = parser.read_events()
+        elapsed = min(elapsed, time.perf_counter() - start)
+    return {
+        "seconds": elapsed,
+        "lines_per_second": summary.lines / elapsed,
+        "mb_per_second": summary.bytes / 1e6 / elapsed,
+        "events": len(events),
+        "workers": workers,
+        "repeat": repeat,
+    }, events
+
+
+async def bench_enrich(ips: list[str], latency: float) -> tuple[dict[str, Any], list[IPMetadata]]:
+    """Enrich ``ips`` against a local stand-in and return the measurement with the records."""
+    async with (
+        IPAPIStandIn(latency=latency, rate_limit=STANDIN_RATE_LIMIT) as standin,
+        aiohttp.ClientSession() as session,
+    ):
+        provider = IPAPIProvider(session, url=standin.url, hedge_after=None)
+        provider.limiter = RateLimiter(*STANDIN_RATE_LIMIT)
+        start = time.perf_counter()
+        result = await provider.lookup(ips)
+        elapsed = time.perf_counter() - start
+    return {
+        "seconds": elapsed,
+        "ips_per_second": len(ips) / elapsed,
+        "ips": len(ips),
+        "failed": len(result.failed),
+        "requests": standin.requests,
+        "latency": latency,
+    }, result.records
+
+
+async def _timed_writes(records: list[IPMetadata], batch_size: int) -> tuple[float, float]:
+    """Return the seconds inserting the records into a new SQLite database takes, then upserting them again."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sql_engine = SqlEngine(
+            SqlConnectorConfig(drivername="sqlite+aiosqlite", database=str(Path(tmp_dir) / "benchmark.db")),
+            write_batch_size=batch_size,
+        )
+        try:
+            await IpModel.create_table(sql_engine)
+            start = time.perf_counter()
+            await IpModel.insert(records, sql_engine)
+            inserted = time.perf_counter() - start
+            start = time.perf_counter()
+            await IpModel.insert(records, sql_engine)
+            updated = time.perf_counter() - start
+        finally:
+            await sql_engine.dispose()
+    return inserted, updated
+
+
+async def bench_write(records: list[IPMetadata], batch_size: int, repeat: int) -> dict[str, Any]:
+    """Write the records as new IPs, then as repeat sightings, keeping the best of ``repeat`` runs."""
+    timings = [await _timed_writes(records, batch_size) for _ in range(repeat)]
+    inserted = min(timing[0] for timing in timings)
+    updated = min(timing[1] for timing in timings)
+    return {
+        "insert_rows_per_second": len(records) / inserted,
+        "upsert_rows_per_second": len(records) / updated,
+        "rows": len(records),
+        "batch_size": batch_size,
+        "repeat": repeat,
+    }
+
+
+async def run(args: argparse.Namespace, profile: LogProfile) -> dict[str, Any]:
+    """Run every benchmark and return the result document."""
+    results: dict[str, Any] = {
+        "version": RESULTS_VERSION,
+        "commit": git_commit(),
+        "date": datetime.now(UTC).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "profile": asdict(profile),
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_path = Path(tmp_dir) / "fail2ban.log"
+        start = time.perf_counter()
+        summary = write_log(log_path, profile)
+        results["log"] = {**asdict(summary), "generated_in": time.perf_counter() - start}
+        print(f"log: {summary.lines:,} lines, {summary.bytes / 1e6:,.1f} MB", file=sys.stderr)  # noqa: T201
+        results["parse"], events = bench_parse(log_path, summary, args.workers, args.repeat)
+    if results["parse"]["events"] != summary.events:
+        msg = f"Parsed {results['parse']['events']} events, the log holds {summary.events}"
+        raise RuntimeError(msg)
+
+    ips = list(dict.fromkeys(event.ip for event in events if event.is_ban))[: args.enrich_ips]
+    results["enrich"], records = await bench_enrich(ips, args.latency)
+    results["write"] = await bench_write(records, args.batch_size, args.repeat)
+    return results
+
+
+def throughputs(results: dict[str, Any]) -> dict[str, float]:
+    """Return the per-second metrics of a result document, by ``benchmark.metric``."""
+    return {
+        f"{name}.{metric}": value
+        for name in ("parse", "enrich", "write")
+        for metric, value in results.get(name, {}).items()
+        if metric.endswith("_per_second")
+    }
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any], tolerance: float) -> bool:
+    """Print each throughput next to the baseline and return False on a regression."""
+    if results["profile"] != baseline.get("profile"):
+        print("warning: the baseline was measured on a different log profile", file=sys.stderr)  # noqa: T201
+    previous = throughputs(baseline)
+    ok = True
+    for name, value in throughputs(results).items():
+        if name not in previous:
+            continue
+        ratio = value / previous[name]
+        regressed = ratio < 1 - tolerance
+        ok = ok and not regressed
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<32} {previous[name]:>14,.0f} -> {value:>14,.0f} {ratio:>6.2f}x{flag}")  # noqa: T201
+    return ok
+
+
+def main() -> None:
+    """Parse the arguments, run the benchmarks and write the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_profile_arguments(parser)
+    parser.add_argument("--workers", type=int, default=1, help="parser worker processes")
+    parser.add_argument("--enrich-ips", type=int, default=10_000, help="distinct IPs enriched")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the stand-in takes per request")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per insert statement")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of the parse and write benchmarks, the fastest is kept")
+    parser.add_argument("--output", type=Path, help="JSON file the results are written to")
+    parser.add_argument("--baseline", type=Path, help="JSON results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="slowdown reported as a regression")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args, profile_from_arguments(args)))
+    document = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(document + "\n")
+    else:
+        print(document)  # noqa: T201
+    if args.baseline and not compare(results, json.loads(args.baseline.read_text()), args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
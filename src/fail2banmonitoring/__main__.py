@@ -1,61 +1,156 @@
+import argparse
 import asyncio
+import contextlib
 import logging
+import time
+from datetime import timedelta
 
-import aiohttp
-
-from fail2banmonitoring.db.config import SqlConnectorConfig, SqlEngine
-from fail2banmonitoring.fail2ban.log_parser import Fail2BanLogParser
-from fail2banmonitoring.models.ip import IpModel
-from fail2banmonitoring.services.ip import IPMetadata
+# Only what a run with nothing new needs is imported here: the database and
+# HTTP stacks take most of the startup time and are imported by _ingest()
+from fail2banmonitoring.fail2ban.sources import LogReader, build_parser
+from fail2banmonitoring.utils import metrics
 from fail2banmonitoring.utils.environment_variables import EnvironmentVariables
+from fail2banmonitoring.utils.profiling import (
+    DEFAULT_LOOP_THRESHOLD,
+    DEFAULT_MODES,
+    ProfilingSession,
+)
 
 logger = logging.getLogger(__name__)
 
 
-async def main() -> None:
-    """Read Fail2ban logs, enrich IPs with metadata, and store results in the database."""
-    try:
-        environment_variables = EnvironmentVariables()
-        fail2ban_log_parser = Fail2BanLogParser(
-            log_path=environment_variables.log_path or "/var/log/fail2ban.log",
-            output_file=environment_variables.export_ip_path,
+def _profiling(
+    environment_variables: EnvironmentVariables,
+) -> ProfilingSession | contextlib.nullcontext[None]:
+    """Return the profiling session configured by PROFILE_DIR, or a no-op without it."""
+    if not environment_variables.profile_dir:
+        return contextlib.nullcontext()
+    return ProfilingSession(
+        environment_variables.profile_dir,
+        tuple(environment_variables.profile_modes) or DEFAULT_MODES,
+        environment_variables.profile_loop_threshold or DEFAULT_LOOP_THRESHOLD,
+    )
+
+
+def _nothing_new(parser: LogReader) -> bool:
+    """Return True, having moved the checkpoint past the lines read, if the log holds nothing to ingest."""
+    if parser.has_new_events():
+        return False
+    parser.commit_checkpoint()
+    logger.info("No new events since the last run")
+    metrics.INGEST_RUNS.inc(1, "success")
+    metrics.INGEST_LAST_SUCCESS.set(time.time())
+    return True
+
+
+async def _ingest(
+    environment_variables: EnvironmentVariables,
+    fail2ban_log_parser: LogReader,
+    *,
+    daemon: bool,
+    metrics_port: int | None,
+) -> None:
+    """Enrich and store the new events, once or, with ``daemon``, as they come."""
+    import aiohttp  # noqa: PLC0415
+
+    from fail2banmonitoring.daemon import (  # noqa: PLC0415
+        DEFAULT_BATCH_BYTES,
+        DEFAULT_BATCH_WINDOW,
+        run_daemon,
+    )
+    from fail2banmonitoring.fail2ban.watch import DEFAULT_POLL_INTERVAL  # noqa: PLC0415
+    from fail2banmonitoring.ingest import build_chain, build_sql_engine, ingest  # noqa: PLC0415
+    from fail2banmonitoring.models.retention import (  # noqa: PLC0415
+        DEFAULT_RETENTION_BATCH_SIZE,
+        apply_retention,
+    )
+    from fail2banmonitoring.subnets import SubnetIndex  # noqa: PLC0415
+
+    sql_engine = build_sql_engine(environment_variables)
+    retention_days = environment_variables.retention_days
+    retention = timedelta(days=retention_days) if retention_days else None
+    retention_batch_size = (
+        environment_variables.retention_batch_size or DEFAULT_RETENTION_BATCH_SIZE
+    )
+    subnets = (
+        SubnetIndex(environment_variables.subnet_index_path)
+        if environment_variables.subnet_index_path
+        else None
+    )
+    async with aiohttp.ClientSession() as session, _profiling(environment_variables):
+        chain = await build_chain(environment_variables, session)
+        metrics_server = (
+            await metrics.serve_metrics(
+                metrics_port,
+                environment_variables.metrics_host or metrics.DEFAULT_METRICS_HOST,
+            )
+            if metrics_port
+            else None
         )
-        local_ips = fail2ban_log_parser.read_logs()
-
-        enriched_ips = None
-        async with aiohttp.ClientSession() as session:
-            if len(local_ips) == 0:
-                logger.info("No Ips to fetch")
-            elif len(local_ips) == 1:
-                enriched_ips = [
-                    await IPMetadata.get_ip_metadata(
-                        next(iter(local_ips)),
-                        session,
-                    ),
-                ]
+        try:
+            if daemon:
+                await run_daemon(
+                    fail2ban_log_parser,
+                    chain,
+                    sql_engine,
+                    batch_window=environment_variables.daemon_batch_window
+                    or DEFAULT_BATCH_WINDOW,
+                    batch_bytes=environment_variables.daemon_batch_bytes
+                    or DEFAULT_BATCH_BYTES,
+                    poll_interval=environment_variables.daemon_poll_interval
+                    or DEFAULT_POLL_INTERVAL,
+                    retention=retention,
+                    retention_batch_size=retention_batch_size,
+                    subnets=subnets,
+                )
             else:
-                enriched_ips = await IPMetadata.get_ips_metadata_batch(
-                    list(local_ips),
-                    session,
+                # Before ingesting, so that upcoming partitions exist even
+                # after a long stretch of runs that found nothing new
+                await apply_retention(sql_engine, retention, batch_size=retention_batch_size)
+                await ingest(fail2ban_log_parser, chain, sql_engine, subnets=subnets)
+        finally:
+            if metrics_server is not None:
+                await metrics_server.cleanup()
+            await chain.close()
+            await sql_engine.dispose()
+            if subnets is not None:
+                subnets.close()
+
+
+async def main(*, daemon: bool = False) -> None:
+    """Read Fail2ban logs, enrich IPs with metadata, and store results in the database.
+
+    With ``daemon``, keep following the log and ingest new events as they
+    come. Otherwise, when the log holds nothing new, exit before loading the
+    database and HTTP stacks.
+    """
+    try:
+        environment_variables = EnvironmentVariables()
+        fail2ban_log_parser = build_parser(environment_variables)
+        metrics_port = environment_variables.metrics_port if daemon else None
+        metrics_textfile = None if daemon else environment_variables.metrics_textfile
+        metrics.REGISTRY.enabled = bool(metrics_port or metrics_textfile)
+        try:
+            if daemon or not _nothing_new(fail2ban_log_parser):
+                await _ingest(
+                    environment_variables,
+                    fail2ban_log_parser,
+                    daemon=daemon,
+                    metrics_port=metrics_port,
                 )
-        if enriched_ips is not None:
-            sql_engine = SqlEngine(
-                SqlConnectorConfig(
-                    drivername=environment_variables.driver,
-                    username=environment_variables.username,
-                    password=environment_variables.password,
-                    host=environment_variables.host,
-                    database=environment_variables.database,
-                ),
-            )
-            await IpModel.create_table(sql_engine)
-            await IpModel.insert(
-                enriched_ips,
-                sql_engine,
-            )
+        finally:
+            if metrics_textfile:
+                # Written on failures too, with the failed run counted
+                metrics.write_textfile(metrics_textfile)
     except Exception:
         logger.exception("An unexpected error occurred in the main workflow")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    arguments = argparse.ArgumentParser(description="Store and enrich fail2ban bans.")
+    arguments.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep following the log instead of exiting after one run",
+    )
+    asyncio.run(main(daemon=arguments.parse_args().daemon))
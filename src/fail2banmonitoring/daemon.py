@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import signal
+from datetime import timedelta
+
+from fail2banmonitoring.db.config import SqlEngine
+from fail2banmonitoring.fail2ban.sources import LogReader
+from fail2banmonitoring.fail2ban.watch import DEFAULT_POLL_INTERVAL, LogWatchers
+from fail2banmonitoring.ingest import ingest
+from fail2banmonitoring.models.ip import IpModel
+from fail2banmonitoring.models.retention import (
+    DEFAULT_RETENTION_BATCH_SIZE,
+    apply_retention,
+)
+from fail2banmonitoring.services.providers import EnrichmentProvider
+from fail2banmonitoring.subnets import SubnetIndex
+
+logger = logging.getLogger(__name__)
+
+# Longest a ban waits in the log before being ingested
+DEFAULT_BATCH_WINDOW = 2.0
+# Unread log bytes that trigger an ingestion before the window ends
+DEFAULT_BATCH_BYTES = 256 * 1024
+# Seconds between two runs of the retention job, which also creates upcoming partitions
+DEFAULT_MAINTENANCE_INTERVAL = 3600.0
+
+
+async def _maintain(
+    sql_engine: SqlEngine,
+    retention: timedelta | None,
+    batch_size: int,
+    interval: float,
+) -> None:
+    """Run the retention job, a failure being retried on the next interval."""
+    try:
+        await apply_retention(sql_engine, retention, batch_size=batch_size)
+    except Exception:
+        logger.exception("Retention failed, retrying in %.0fs", interval)
+
+
+async def run_daemon(
+    parser: LogReader,
+    chain: EnrichmentProvider,
+    sql_engine: SqlEngine,
+    *,
+    batch_window: float = DEFAULT_BATCH_WINDOW,
+    batch_bytes: int = DEFAULT_BATCH_BYTES,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    retention: timedelta | None = None,
+    retention_batch_size: int = DEFAULT_RETENTION_BATCH_SIZE,
+    maintenance_interval: float = DEFAULT_MAINTENANCE_INTERVAL,
+    subnets: SubnetIndex | None = None,
+    stop: asyncio.Event | None = None,
+) -> None:
+    """Follow the logs and ingest new events in micro-batches until ``stop`` is set.
+
+    The logs themselves buffer the events: once one changes, ingestion waits up
+    to ``batch_window`` seconds, or until ``batch_bytes`` were appended, then
+    reads everything since the checkpoints in one go. The engine, the HTTP
+    session behind ``chain`` and the tables are set up once for the lifetime
+    of the daemon. Every ``maintenance_interval`` seconds, data older than
+    ``retention`` is removed, see apply_retention. Bans are also counted in
+    ``subnets``, if given. SIGTERM and SIGINT stop it after a last ingestion.
+    """
+    if not parser.checkpoint_path:
+        msg = "Daemon mode requires CHECKPOINT_PATH to remember its position in the log"
+        raise ValueError(msg)
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    # The parser matches the LOG_PATH globs and loads checkpoints, in a thread like below
+    watcher = LogWatchers(await asyncio.to_thread(lambda: parser.log_paths), poll_interval=poll_interval)
+
+    def request_stop() -> None:
+        logger.info("Stopping after the current batch")
+        stop.set()
+        watcher.wake()
+
+    handled = []
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(signum, request_stop)
+        except (NotImplementedError, RuntimeError, ValueError):
+            # Not supported on this platform or outside the main thread
+            break
+        handled.append(signum)
+    stop_task = asyncio.create_task(stop.wait())
+    stop_task.add_done_callback(lambda _: watcher.wake())
+
+    await IpModel.create_table(sql_engine)
+    # Catch up on what was written while the daemon was not running
+    pending = True
+    next_maintenance = loop.time()
+    try:
+        while True:
+            if pending:
+                try:
+                    await ingest(parser, chain, sql_engine, create_tables=False, subnets=subnets)
+                    pending = False
+                    # Logs may have appeared or gone with a glob in LOG_PATH
+                    watcher.watch(await asyncio.to_thread(lambda: parser.log_paths))
+                except Exception:
+                    logger.exception("Ingestion failed, retrying in %.1fs", batch_window)
+            if loop.time() >= next_maintenance:
+                next_maintenance = loop.time() + maintenance_interval
+                await _maintain(sql_engine, retention, retention_batch_size, maintenance_interval)
+            if stop.is_set():
+                break
+            if pending:
+                await watcher.wait(batch_window)
+                continue
+            await watcher.wait()
+            # Let more lines accumulate, unless enough are already waiting
+            deadline = loop.time() + batch_window
+            while (
+                not stop.is_set()
+                and await asyncio.to_thread(parser.unread_bytes) < batch_bytes
+                and (remaining := deadline - loop.time()) > 0
+            ):
+                await watcher.wait(remaining)
+            pending = True
+    finally:
+        stop_task.cancel()
+        watcher.close()
+        for signum in handled:
+            loop.remove_signal_handler(signum)
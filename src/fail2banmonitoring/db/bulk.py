@@ -0,0 +1,142 @@
+import functools
+import logging
+from collections.abc import Callable, Sequence
+from itertools import batched
+from typing import Any
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.engine import Dialect
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+logger = logging.getLogger(__name__)
+
+# Bound parameters allowed in one statement, SQLite's limit being the lowest
+MAX_PARAMETERS = 32_766
+# Dialects where a single INSERT with many VALUES groups beats executemany
+MULTIROW_DIALECTS = frozenset({"sqlite", "mysql", "mariadb"})
+PLACEHOLDERS = {"qmark": "?", "format": "%s"}
+
+Row = tuple[Any, ...]
+
+
+def build_upsert(
+    dialect: str,
+    table: sa.Table,
+    key: Sequence[str],
+    updates: Callable[[sa.ColumnCollection[str, Any]], dict[str, Any]],
+    *,
+    columns: Sequence[str] = (),
+    source: sa.Select[Any] | None = None,
+) -> sa.Insert:
+    """Return an insert into ``table`` that updates the rows already holding its ``key``.
+
+    ``updates`` receives the columns of the row being inserted and returns
+    the SET clause: ON CONFLICT DO UPDATE on PostgreSQL and SQLite, ON
+    DUPLICATE KEY UPDATE on MySQL and MariaDB. With ``source`` the rows are
+    the ``columns`` selected by it instead of bound parameters.
+
+    Raises:
+        ValueError: If the dialect has no upsert support here.
+
+    """
+    if dialect in {"postgresql", "sqlite"}:
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        statement = insert(table)
+        if source is not None:
+            statement = statement.from_select(columns, source)
+        return statement.on_conflict_do_update(
+            index_elements=[table.c[name] for name in key],
+            set_=updates(statement.excluded),
+        )
+    if dialect in {"mysql", "mariadb"}:
+        duplicate = mysql.insert(table)
+        if source is not None:
+            duplicate = duplicate.from_select(columns, source)
+        return duplicate.on_duplicate_key_update(updates(duplicate.inserted))
+    msg = f"Upserts are not supported on {dialect}"
+    raise ValueError(msg)
+
+
+def uses_copy(conn: AsyncConnection) -> bool:
+    """Return True if rows can be sent to ``conn`` with COPY, i.e. on asyncpg."""
+    return conn.dialect.driver == "asyncpg"
+
+
+async def copy_rows(
+    conn: AsyncConnection,
+    table_name: str,
+    columns: Sequence[str],
+    rows: list[Row],
+) -> None:
+    """Stream ``rows`` into ``table_name`` with PostgreSQL's COPY, in the transaction of ``conn``."""
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(  # type: ignore[union-attr]
+        table_name,
+        records=rows,
+        columns=list(columns),
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def _multirow_template(
+    statement: sa.Insert,
+    columns: tuple[str, ...],
+    dialect: Dialect,
+) -> tuple[str, str, tuple[tuple[int, Callable[[Any], Any] | None], ...]] | None:
+    """Compile ``statement`` for one row, return its SQL, VALUES group and parameter order.
+
+    Returns None if the dialect's parameter style does not allow repeating
+    the VALUES group as plain text.
+    """
+    placeholder = PLACEHOLDERS.get(dialect.paramstyle)
+    if placeholder is None:
+        return None
+    compiled = statement.compile(dialect=dialect, column_keys=list(columns))
+    group = "(" + ", ".join([placeholder] * len(columns)) + ")"
+    if compiled.positiontup is None or compiled.string.count(group) != 1:
+        return None
+    table = statement.table
+    order = tuple(
+        (columns.index(name), table.c[name].type.dialect_impl(dialect).bind_processor(dialect))  # type: ignore[union-attr]
+        for name in compiled.positiontup
+    )
+    return compiled.string, group, order
+
+
+async def insert_rows(
+    conn: AsyncConnection,
+    statement: sa.Insert,
+    columns: tuple[str, ...],
+    rows: list[Row],
+    *,
+    batch_size: int,
+) -> None:
+    """Execute ``statement`` for ``rows``, tuples of ``columns`` values, ``batch_size`` rows at a time.
+
+    On SQLite and MySQL/MariaDB each batch is a single INSERT with one VALUES
+    group per row, compiled once and sent to the driver as is. Elsewhere
+    batches go through Core's executemany.
+    """
+    template = (
+        _multirow_template(statement, columns, conn.dialect)
+        if conn.dialect.name in MULTIROW_DIALECTS
+        else None
+    )
+    if template is None:
+        for batch in batched(rows, batch_size):
+            await conn.execute(statement, [dict(zip(columns, row, strict=True)) for row in batch])
+        return
+
+    sql, group, order = template
+    per_statement = max(1, min(batch_size, MAX_PARAMETERS // len(columns)))
+    for batch in batched(rows, per_statement):
+        parameters = []
+        for row in batch:
+            for position, process in order:
+                value = row[position]
+                parameters.append(value if process is None else process(value))
+        await conn.exec_driver_sql(
+            sql.replace(group, ", ".join([group] * len(batch)), 1),
+            tuple(parameters),
+        )
@@ -10,6 +10,9 @@
 
 logger = logging.getLogger(__name__)
 
+# Rows sent per statement by the bulk writes of the models
+DEFAULT_WRITE_BATCH_SIZE = 5000
+
 
 @dataclass
 class SqlConnectorConfig:
@@ -67,6 +70,7 @@ class SqlEngine:
     echo: bool = False
     pool_size: int = 5
     max_overflow: int = 5
+    write_batch_size: int = DEFAULT_WRITE_BATCH_SIZE
 
     @cached_property
     def engine(
@@ -87,6 +91,11 @@ def engine(
             max_overflow=self.max_overflow,
         )
 
+    async def dispose(self) -> None:
+        """Close the connections of the engine, if it was ever created."""
+        if "engine" in self.__dict__:
+            await self.engine.dispose()
+
     @retry(
         reraise=True,
         stop=stop_after_attempt(5),
@@ -0,0 +1,197 @@
+"""Packed binary forms of IP addresses, for compact sets and indexed range queries.
+
+In the database every IP is stored as 16 bytes, IPv4 addresses in their
+IPv4-mapped IPv6 form (``::ffff:a.b.c.d``), so that byte order is address
+order for both families and a CIDR block is a contiguous range of values,
+see network_range. In memory IPSet keeps IPv4 addresses in 4 bytes.
+"""
+
+import bisect
+import ipaddress
+import socket
+from array import array
+from collections.abc import Iterable, Iterator
+
+PACKED_SIZE = 16
+# Prefix of IPv4-mapped IPv6 addresses, ::ffff:0:0/96
+IPV4_MAPPED_PREFIX = bytes(10) + b"\xff\xff"
+# Unsorted additions an IPSet buffers before merging them into its sorted records
+MERGE_THRESHOLD = 4096
+
+
+def pack_ip(ip: str) -> bytes | None:
+    """Return the 16 bytes stored for ``ip``, as returned by normalize_ip, or None if it is not an IP."""
+    try:
+        if ":" in ip:
+            return socket.inet_pton(socket.AF_INET6, ip)
+        return IPV4_MAPPED_PREFIX + socket.inet_pton(socket.AF_INET, ip)
+    except OSError:
+        return None
+
+
+def unpack_ip(packed: bytes) -> str:
+    """Return the canonical text form of 16 bytes returned by pack_ip."""
+    if packed[:12] == IPV4_MAPPED_PREFIX:
+        return socket.inet_ntop(socket.AF_INET, packed[12:])
+    return ipaddress.IPv6Address(packed).compressed
+
+
+def network_range(network: str) -> tuple[bytes, bytes]:
+    """Return the first and last packed addresses of a CIDR block such as ``45.0.0.0/8``.
+
+    Raises:
+        ValueError: If ``network`` is not a valid network, host bits included.
+
+    """
+    block = ipaddress.ip_network(network)
+    if isinstance(block, ipaddress.IPv4Network):
+        return (
+            IPV4_MAPPED_PREFIX + block.network_address.packed,
+            IPV4_MAPPED_PREFIX + block.broadcast_address.packed,
+        )
+    return block.network_address.packed, block.broadcast_address.packed
+
+
+class _SortedWords:
+    """Distinct unsigned integers of ``words`` machine words, sorted in parallel arrays.
+
+    Word ``k`` of every value sits in ``arrays[k]``, most significant first,
+    so values are found by bisecting each array within the range where the
+    previous words matched. Recent additions wait in a set until the next merge.
+    """
+
+    def __init__(self, typecode: str, words: int) -> None:
+        self.typecode = typecode
+        self.arrays = [array(typecode) for _ in range(words)]
+        self.bits = self.arrays[0].itemsize * 8
+        self.pending: set[int] = set()
+
+    def _split(self, value: int) -> list[int]:
+        mask = (1 << self.bits) - 1
+        shifts = range((len(self.arrays) - 1) * self.bits, -1, -self.bits)
+        return [value >> shift & mask for shift in shifts]
+
+    def _search(self, words: list[int], lo: int = 0) -> tuple[int, bool]:
+        """Return where ``words`` is or would be inserted, from ``lo`` on, and whether it is there."""
+        hi = len(self.arrays[0])
+        for column, word in zip(self.arrays, words, strict=True):
+            lo = bisect.bisect_left(column, word, lo, hi)
+            hi = bisect.bisect_right(column, word, lo, hi)
+            if lo == hi:
+                return lo, False
+        return lo, True
+
+    def __len__(self) -> int:
+        return len(self.arrays[0]) + len(self.pending)
+
+    def __contains__(self, value: int) -> bool:
+        if value in self.pending:
+            return True
+        if len(self.arrays) == 1:
+            column = self.arrays[0]
+            index = bisect.bisect_left(column, value)
+            return index < len(column) and column[index] == value
+        return self._search(self._split(value))[1]
+
+    def add(self, value: int) -> bool:
+        if value in self:
+            return False
+        self.pending.add(value)
+        # A merge copies the arrays, so it waits for more additions as the set grows
+        if len(self.pending) >= max(MERGE_THRESHOLD, len(self.arrays[0]) // 8):
+            self.merge()
+        return True
+
+    def merge(self) -> None:
+        """Move the pending values into the sorted arrays.
+
+        The sorted runs between two pending values are copied whole, so the
+        arrays are copied once and only pending values are handled one by one.
+        """
+        if len(self.arrays) == 1:
+            column = self.arrays[0]
+            merged = array(self.typecode)
+            copied = 0
+            for value in sorted(self.pending):
+                end = bisect.bisect_left(column, value, copied)
+                merged += column[copied:end]
+                merged.append(value)
+                copied = end
+            merged += column[copied:]
+            self.arrays = [merged]
+            self.pending.clear()
+            return
+        targets = [array(self.typecode) for _ in self.arrays]
+        copied = 0
+        for value in sorted(self.pending):
+            words = self._split(value)
+            end, _ = self._search(words, copied)
+            for target, source, word in zip(targets, self.arrays, words, strict=True):
+                target.extend(source[copied:end])
+                target.append(word)
+            copied = end
+        for target, source in zip(targets, self.arrays, strict=True):
+            target.extend(source[copied:])
+        self.arrays = targets
+        self.pending.clear()
+
+    def __iter__(self) -> Iterator[int]:
+        for words in zip(*self.arrays, strict=True):
+            value = 0
+            for word in words:
+                value = value << self.bits | word
+            yield value
+        yield from self.pending
+
+
+class IPSet:
+    """A set of IP addresses kept as packed integers, 4 or 16 bytes each instead of a str object.
+
+    IPs are added and tested in the canonical form returned by
+    normalize_ip, and iterated back in that form, in no particular order.
+    Most of them sit in sorted arrays searched by bisection, the latest
+    additions in a small set merged into them from time to time.
+    """
+
+    def __init__(self, ips: Iterable[str] = ()) -> None:
+        """Create a set holding ``ips``."""
+        self._ipv4 = _SortedWords("I", 1)
+        self._ipv6 = _SortedWords("Q", 2)
+        self.update(ips)
+
+    def _find(self, ip: str) -> tuple[_SortedWords, int]:
+        if ":" in ip:
+            return self._ipv6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip))
+        return self._ipv4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip))
+
+    def add(self, ip: str) -> bool:
+        """Add ``ip`` and return True if it was not in the set yet."""
+        words, value = self._find(ip)
+        return words.add(value)
+
+    def update(self, ips: Iterable[str]) -> None:
+        """Add every IP of ``ips``."""
+        for ip in ips:
+            self.add(ip)
+
+    def __contains__(self, ip: object) -> bool:
+        """Return True if ``ip`` is in the set."""
+        if not isinstance(ip, str):
+            return False
+        words, value = self._find(ip)
+        return value in words
+
+    def __len__(self) -> int:
+        """Return the number of IPs."""
+        return len(self._ipv4) + len(self._ipv6)
+
+    def __repr__(self) -> str:
+        """Return the IPs, for debug logs."""
+        return f"IPSet({list(self)!r})"
+
+    def __iter__(self) -> Iterator[str]:
+        """Yield every IP in its canonical text form."""
+        for value in self._ipv4:
+            yield socket.inet_ntop(socket.AF_INET, value.to_bytes(4))
+        for value in self._ipv6:
+            yield ipaddress.IPv6Address(value).compressed
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import IO, Self
+
+logger = logging.getLogger(__name__)
+
+# How far back from the offset we look for the start of the last consumed line
+TAIL_WINDOW = 4096
+
+
+def tail_line_hash(log_file: IO[bytes], offset: int) -> str:
+    """Return the hash of the last complete line ending at ``offset``.
+
+    Lines longer than ``TAIL_WINDOW`` are hashed on their trailing window only,
+    which is enough to tell whether the file was rewritten under us.
+    """
+    start = max(0, offset - TAIL_WINDOW)
+    log_file.seek(start)
+    window = log_file.read(offset - start).rstrip(b"\n")
+    line = window.rsplit(b"\n", 1)[-1]
+    return hashlib.sha256(line).hexdigest()
+
+
+@dataclass
+class LogCheckpoint:
+    """Position of the last fully ingested line of a log file.
+
+    Attributes
+    ----------
+    device : int
+        Device id of the file the offset refers to.
+    inode : int
+        Inode of the file the offset refers to.
+    offset : int
+        Byte offset just past the last consumed newline.
+    last_line_hash : str
+        Hash of the last consumed line, used to detect in-place rewrites.
+    rotated : list[str]
+        Fingerprints of the rotated files already ingested, oldest first.
+    retry_ips : list[str]
+        IPs whose enrichment failed on the last run, to fetch again.
+
+    """
+
+    device: int
+    inode: int
+    offset: int
+    last_line_hash: str
+    rotated: list[str] = field(default_factory=list)
+    retry_ips: list[str] = field(default_factory=list)
+
+    def same_file(self, stat: os.stat_result) -> bool:
+        """Return True if ``stat`` describes the file this checkpoint was taken on."""
+        return (self.device, self.inode) == (stat.st_dev, stat.st_ino)
+
+    def resume_offset(self, log_file: IO[bytes], stat: os.stat_result) -> int:
+        """Return the offset to resume reading ``log_file`` from.
+
+        Falls back to the beginning of the file when it was rotated, truncated
+        (copytruncate) or rewritten since the checkpoint was taken.
+        """
+        if not self.same_file(stat):
+            logger.info("Log file was rotated, reading it from the beginning")
+            return 0
+        if stat.st_size < self.offset:
+            logger.info("Log file was truncated, reading it from the beginning")
+            return 0
+        if tail_line_hash(log_file, self.offset) != self.last_line_hash:
+            logger.info("Log file was rewritten, reading it from the beginning")
+            return 0
+        return self.offset
+
+    @classmethod
+    def load(cls, path: str) -> Self | None:
+        """Load a checkpoint from ``path``, or return None if there is no usable one."""
+        checkpoint_file = Path(path)
+        if not checkpoint_file.exists():
+            return None
+        try:
+            return cls(**json.loads(checkpoint_file.read_text()))
+        except (ValueError, TypeError):
+            logger.warning("Ignoring corrupt checkpoint file: %s", path)
+            return None
+
+    def save(self, path: str) -> None:
+        """Atomically write the checkpoint to ``path``."""
+        tmp_path = Path(f"{path}.tmp")
+        tmp_path.write_text(json.dumps(asdict(self)))
+        tmp_path.replace(path)
+        logger.debug("Saved checkpoint %s to %s", self, path)
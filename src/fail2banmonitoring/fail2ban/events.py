@@ -0,0 +1,193 @@
+import ipaddress
+import mmap
+import re
+import sys
+from datetime import datetime
+from functools import lru_cache
+from typing import NamedTuple
+
+BAN = "Ban"
+UNBAN = "Unban"
+RESTORE_BAN = "Restore Ban"
+
+# Cheap substring checks, a block containing none of them has no event
+EVENT_MARKERS = (b" Ban ", b" Unban ")
+
+# Event lines come in the native fail2ban format
+#   2024-06-01 12:00:00,000 fail2ban.actions [1234]: NOTICE [sshd] Ban 8.8.8.8
+# or forwarded through syslog
+#   Jan 15 10:26:01 server fail2ban.actions [1]: NOTICE [sshd] Ban 2001:db8::1
+# The pattern is anchored on "] <action> <ip>" so lines without an event are
+# skipped by the regex engine alone; the jail and the line prefix are only
+# looked up for matches. The IP group only screens for IPv4/IPv6 characters,
+# normalize_ip() validates it.
+EVENT_PATTERN = re.compile(
+    rb"\][ \t]+(?P<action>Restore Ban|Unban|Ban)[ \t]+(?P<ip>[0-9A-Fa-f:.]{2,45})(?!\S)",
+)
+TIMESTAMP_PATTERN = re.compile(
+    rb"(?P<native>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:,(?P<ms>\d{3}))?"
+    rb"|(?P<syslog>[A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d) (?P<host>\S+)",
+)
+# Canonical dotted quad, the common case normalize_ip() accepts without parsing
+_OCTET = rb"(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)"
+CANONICAL_IPV4_PATTERN = re.compile(rb"(?:" + _OCTET + rb"\.){3}" + _OCTET)
+# Distinct IPs whose normalized form is kept, attackers repeat a lot
+IP_CACHE_SIZE = 1 << 16
+
+_MONTHS = {
+    month.encode(): number
+    for number, month in enumerate(
+        ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"],
+        start=1,
+    )
+}
+
+
+@lru_cache(maxsize=1024)
+def _intern(raw: bytes) -> str:
+    """Decode a jail, action or host name once and share the string."""
+    return sys.intern(raw.decode())
+
+
+@lru_cache(maxsize=IP_CACHE_SIZE)
+def normalize_ip(token: bytes) -> str | None:
+    """Return the canonical form of an IPv4 or IPv6 address, or None if it is not one.
+
+    Canonical dotted quads are accepted after a single regex check; anything
+    with a colon goes through :mod:`ipaddress`, and IPv4-mapped IPv6 addresses
+    are folded into their IPv4 form so both spellings count as one IP.
+    """
+    if CANONICAL_IPV4_PATTERN.fullmatch(token):
+        return token.decode()
+    text = token.decode()
+    if ":" not in text:
+        # Dotted quad with leading zeros or out of range octets
+        parts = text.split(".")
+        if len(parts) != 4 or not all(
+            part.isdigit() and len(part) <= 3 and int(part) <= 255 for part in parts
+        ):
+            return None
+        return ".".join(str(int(part)) for part in parts)
+    try:
+        address = ipaddress.IPv6Address(text)
+    except ValueError:
+        return None
+    if address.ipv4_mapped is not None:
+        return str(address.ipv4_mapped)
+    return address.compressed
+
+
+class BanEvent(NamedTuple):
+    """A single action fail2ban took on an IP address."""
+
+    timestamp: datetime | None
+    jail: str
+    action: str
+    ip: str
+    host: str | None
+
+    @property
+    def is_ban(self) -> bool:
+        """Return True for Ban and Restore Ban events."""
+        return self.action != UNBAN
+
+
+class TimestampParser:
+    """Turn the timestamps of both log formats into datetimes.
+
+    Syslog timestamps carry no year: a month later than the reference month
+    belongs to the previous year. The year of each month and the last parsed
+    timestamp are cached, since consecutive lines mostly share them.
+    """
+
+    __slots__ = ("_last", "_last_raw", "_years", "now")
+
+    def __init__(self, now: datetime | None = None) -> None:
+        """Initialize the parser with the reference time used for year inference."""
+        self.now = now or datetime.now()  # noqa: DTZ005
+        self._years: dict[int, int] = {}
+        self._last_raw = b""
+        self._last: datetime | None = None
+
+    def _year(self, month: int) -> int:
+        year = self._years.get(month)
+        if year is None:
+            year = self.now.year if month <= self.now.month else self.now.year - 1
+            self._years[month] = year
+        return year
+
+    def parse_native(self, raw: bytes, ms: bytes | None) -> datetime:
+        """Parse ``YYYY-MM-DD HH:MM:SS`` with optional milliseconds."""
+        raw_key = raw + (ms or b"")
+        if raw_key == self._last_raw and self._last is not None:
+            return self._last
+        self._last_raw = raw_key
+        self._last = datetime(  # noqa: DTZ001
+            int(raw[0:4]),
+            int(raw[5:7]),
+            int(raw[8:10]),
+            int(raw[11:13]),
+            int(raw[14:16]),
+            int(raw[17:19]),
+            int(ms) * 1000 if ms else 0,
+        )
+        return self._last
+
+    def parse_syslog(self, raw: bytes) -> datetime:
+        """Parse ``Mon DD HH:MM:SS``, inferring the year."""
+        if raw == self._last_raw and self._last is not None:
+            return self._last
+        month = _MONTHS[raw[0:3]]
+        self._last_raw = raw
+        self._last = datetime(  # noqa: DTZ001
+            self._year(month),
+            month,
+            int(raw[4:6]),
+            int(raw[7:9]),
+            int(raw[10:12]),
+            int(raw[13:15]),
+        )
+        return self._last
+
+
+def scan_events(
+    buffer: bytes | mmap.mmap,
+    timestamps: TimestampParser,
+    start: int = 0,
+    end: int | None = None,
+) -> list[BanEvent]:
+    """Return the events found in ``buffer[start:end]``, which must hold complete lines."""
+    if end is None:
+        end = len(buffer)
+    if all(buffer.find(marker, start, end) == -1 for marker in EVENT_MARKERS):
+        return []
+    events = []
+    for match in EVENT_PATTERN.finditer(buffer, start, end):
+        action, token = match.groups()
+        ip = normalize_ip(token)
+        if ip is None:
+            continue
+        bracket = match.start()
+        line_start = max(buffer.rfind(b"\n", start, bracket) + 1, start)
+        jail_start = buffer.rfind(b"[", line_start, bracket)
+        if jail_start == -1:
+            continue
+        timestamp = host = None
+        prefix = TIMESTAMP_PATTERN.match(buffer, line_start, bracket)
+        if prefix is not None:
+            native, ms, syslog, raw_host = prefix.groups()
+            if native is not None:
+                timestamp = timestamps.parse_native(native, ms)
+            else:
+                timestamp = timestamps.parse_syslog(syslog)
+                host = _intern(raw_host)
+        events.append(
+            BanEvent(
+                timestamp=timestamp,
+                jail=_intern(buffer[jail_start + 1 : bracket]),
+                action=_intern(action),
+                ip=ip,
+                host=host,
+            ),
+        )
+    return events
@@ -1,20 +1,463 @@
+import asyncio
+import dataclasses
 import logging
-import re
+import mmap
+import os
+import time
+from collections import Counter
+from collections.abc import AsyncIterator, Collection, Generator, Iterable, Iterator
+from concurrent.futures import Executor, ThreadPoolExecutor
 from pathlib import Path
+from typing import IO, NamedTuple
+
+from fail2banmonitoring.fail2ban.checkpoint import LogCheckpoint, tail_line_hash
+from fail2banmonitoring.fail2ban.events import (
+    EVENT_MARKERS,
+    EVENT_PATTERN,
+    BanEvent,
+    TimestampParser,
+    scan_events,
+)
+from fail2banmonitoring.fail2ban.parallel import iter_events_parallel, scan_block
+from fail2banmonitoring.fail2ban.rotation import (
+    MAX_FINGERPRINTS,
+    discover_rotated,
+    is_known_rotated,
+    plain_fingerprint,
+    scan_rotated_file,
+    stat_fingerprint,
+)
+from fail2banmonitoring.utils import metrics
 
 logger = logging.getLogger(__name__)
 
+# Bytes read from the log per step, peak memory is about this plus one line
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+def iter_line_blocks(
+    log_file: IO[bytes],
+    offset: int,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    *,
+    include_partial: bool = True,
+) -> Iterator[bytes]:
+    """Yield blocks of complete lines read from ``offset`` in ``chunk_size`` steps.
+
+    Lines split across two reads are carried over to the next block. A last
+    line without a trailing newline is only yielded if ``include_partial``.
+    """
+    log_file.seek(offset)
+    remainder = b""
+    while chunk := log_file.read(chunk_size):
+        data = remainder + chunk
+        cut = data.rfind(b"\n") + 1
+        remainder = data[cut:]
+        if cut:
+            yield data[:cut]
+    if remainder and include_partial:
+        yield remainder
+
+
+def count_lines(buffer: mmap.mmap, start: int, end: int) -> int:
+    """Return the newlines in ``buffer[start:end]``, copying at most one chunk at a time."""
+    return sum(
+        buffer[position : min(position + DEFAULT_CHUNK_SIZE, end)].count(b"\n")
+        for position in range(start, end, DEFAULT_CHUNK_SIZE)
+    )
+
+
+def _count_parsed(size: int, lines: int, events: list[BanEvent]) -> None:
+    """Add a scanned block to the parser metrics."""
+    metrics.LOG_BYTES_READ.inc(size)
+    metrics.LOG_LINES_PARSED.inc(lines)
+    metrics.EVENTS_PARSED.inc(len(events))
+    metrics.BANS_FOUND.inc(sum(event.is_ban for event in events))
+
+
+class ReadPosition(NamedTuple):
+    """How far a read had got when it yielded a block, see Fail2BanLogParser.commit_checkpoint."""
+
+    checkpoint: LogCheckpoint | None
+    # Fingerprints of pending_rotated ingested by then
+    rotated: int
+
 
 class Fail2BanLogParser:
-    """Parse fail2ban logs and extract IP addresses."""
+    """Parse fail2ban logs and extract ban events and IP addresses."""
+
+    def __init__(
+        self,
+        log_path: str | None,
+        output_file: str | None,
+        *,
+        checkpoint_path: str | None = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        workers: int = 1,
+        rotated_glob: str | None = None,
+        host: str | None = None,
+        executor: Executor | None = None,
+    ) -> None:
+        """Initialize the Fail2BanLogParser with log and output file paths.
 
-    def __init__(self, log_path: str | None, output_file: str | None) -> None:
-        """Initialize the Fail2BanLogParser with log and output file paths."""
+        When ``checkpoint_path`` is set, only lines appended since the last
+        committed checkpoint are parsed. The log is read ``chunk_size`` bytes
+        at a time, or split across ``workers`` processes by read_logs().
+        Rotated files matching ``rotated_glob``, plain or compressed, are read
+        in a thread pool alongside the live log, each one only once. Events
+        whose line names no host are given ``host``. With ``executor``, a
+        process pool, blocks are scanned in its processes.
+        """
         self.log_path = log_path
         self.output_file = output_file
-        # Regex pattern to match ban entries with IP addresses
-        # More flexible pattern to catch IPs in different formats of ban messages
-        self.pattern = re.compile(r"Ban\s+(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})")
+        self.checkpoint_path = checkpoint_path
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.rotated_glob = rotated_glob
+        self.host = host
+        self.executor = executor
+        # Checkpoint reached by the last read, persisted by commit_checkpoint()
+        self.pending_checkpoint: LogCheckpoint | None = None
+        # Fingerprints of the rotated files ingested by the last read
+        self.pending_rotated: list[str] = []
+        # Position after each block yielded by iter_event_blocks()
+        self.positions: list[ReadPosition] = []
+        # Regex pattern to match ban, unban and restore ban entries
+        # in both the native and the syslog formats
+        self.pattern = EVENT_PATTERN
+        self.timestamps = TimestampParser()
+
+    @property
+    def log_paths(self) -> list[str]:
+        """Return the log files read, for LogWatchers."""
+        return [self.log_path] if self.log_path else []
+
+    def _validate_log_path(self) -> str:
+        """Return the log path, or raise if it is missing."""
+        if not self.log_path:
+            logger.error("No log path provided")
+            msg = "Log path must be provided"
+            raise ValueError(msg)
+        if not Path(self.log_path).exists():
+            logger.error("Log file not found at path: %s", self.log_path)
+            msg = f"Log file not found: {self.log_path}"
+            raise FileNotFoundError(msg)
+        return self.log_path
+
+    def _iter_rotated_remainder(self, checkpoint: LogCheckpoint) -> Iterator[bytes]:
+        """Yield the unread tail of the file the checkpoint was taken on, if it was renamed to ``<log_path>.1``."""
+        rotated_path = Path(f"{self.log_path}.1")
+        if not rotated_path.exists():
+            return
+        with rotated_path.open("rb") as rotated_file:
+            stat = os.fstat(rotated_file.fileno())
+            if not checkpoint.same_file(stat):
+                return
+            offset = checkpoint.resume_offset(rotated_file, stat)
+            logger.info(
+                "Reading remainder of rotated log %s from offset %d",
+                rotated_path,
+                offset,
+            )
+            end = offset
+            for block in iter_line_blocks(rotated_file, offset, self.chunk_size):
+                end += len(block)
+                # Committed this far, the next run finishes the rotated file
+                self._stage_checkpoint(rotated_file, stat, end)
+                yield block
+            if self.rotated_glob:
+                # Fully read now, so the rotation set must not ingest it again
+                self.pending_rotated.extend(
+                    [
+                        stat_fingerprint(os.fstat(rotated_file.fileno())),
+                        plain_fingerprint(rotated_path, self.chunk_size),
+                    ],
+                )
+
+    def _rotated_files(self, rotated_glob: str, checkpoint: LogCheckpoint | None) -> list[Path]:
+        """Return the rotated files to consider, oldest first."""
+        # The file the checkpoint points into is finished by _iter_rotated_remainder
+        return [
+            path
+            for path in discover_rotated(rotated_glob, exclude=[self.log_path or ""])
+            if checkpoint is None or not checkpoint.same_file(path.stat())
+        ]
+
+    def _scan_rotated(self) -> tuple[list[BanEvent], list[str]]:
+        """Return the events of the rotated files that were not ingested yet, and their fingerprints."""
+        events: list[BanEvent] = []
+        rotated: list[str] = []
+        if not self.rotated_glob:
+            return events, rotated
+        checkpoint = (
+            LogCheckpoint.load(self.checkpoint_path) if self.checkpoint_path else None
+        )
+        known = set(checkpoint.rotated) if checkpoint else set()
+        files = self._rotated_files(self.rotated_glob, checkpoint)
+        if not files:
+            return events, rotated
+        with ThreadPoolExecutor(
+            max_workers=min(len(files), os.cpu_count() or 1),
+        ) as executor:
+            results = executor.map(lambda path: self._scan_rotated_file(path, known), files)
+            for file_events, fingerprints in results:
+                events.extend(file_events)
+                rotated.extend(fingerprints)
+        return events, rotated
+
+    def _scan_rotated_file(self, path: Path, known: set[str]) -> tuple[list[BanEvent], list[str]]:
+        """Scan a rotated file, see scan_rotated_file, in the thread of that file."""
+        # The timestamp cache of the live log is not shared with the threads of rotated files
+        timestamps = TimestampParser(self.timestamps.now)
+        return scan_rotated_file(
+            path,
+            known,
+            iter_blocks=lambda rotated_file: iter_line_blocks(rotated_file, 0, self.chunk_size),
+            scan_block=lambda block: self._scan_block(block, timestamps),
+        )
+
+    def _resume_offset(
+        self,
+        log_file: IO[bytes],
+        stat: os.stat_result,
+    ) -> tuple[int, LogCheckpoint | None]:
+        """Return where to resume ``log_file``, and the checkpoint of a rotated predecessor to finish first."""
+        if not self.checkpoint_path:
+            return 0, None
+        checkpoint = LogCheckpoint.load(self.checkpoint_path)
+        if checkpoint is None:
+            return 0, None
+        offset = checkpoint.resume_offset(log_file, stat)
+        return offset, None if checkpoint.same_file(stat) else checkpoint
+
+    def _stage_checkpoint(self, log_file: IO[bytes], stat: os.stat_result, end: int) -> None:
+        """Remember the position reached by a read, for commit_checkpoint()."""
+        # The file may still be read from where it was
+        position = log_file.tell()
+        self.pending_checkpoint = LogCheckpoint(
+            device=stat.st_dev,
+            inode=stat.st_ino,
+            offset=end,
+            last_line_hash=tail_line_hash(log_file, end),
+        )
+        log_file.seek(position)
+
+    def _iter_new_blocks(self, log_path: str) -> Generator[bytes]:
+        """Yield the line blocks added since the last checkpoint, staging the checkpoint past each one."""
+        with Path(log_path).open("rb") as log_file:
+            stat = os.fstat(log_file.fileno())
+            offset, rotated = self._resume_offset(log_file, stat)
+            if rotated is not None:
+                yield from self._iter_rotated_remainder(rotated)
+            end = offset
+            # With a checkpoint, a partially written last line is left for the next run
+            for block in iter_line_blocks(
+                log_file,
+                offset,
+                self.chunk_size,
+                include_partial=not self.checkpoint_path,
+            ):
+                end += len(block)
+                self._stage_checkpoint(log_file, stat, end)
+                yield block
+            logger.info("Read %d new bytes from offset %d", end - offset, offset)
+            self._stage_checkpoint(log_file, stat, end)
+
+    def _iter_parallel_events(self, log_path: str) -> Generator[list[BanEvent]]:
+        """Yield the events added since the last checkpoint range by range, scanned in ``workers`` processes.
+
+        The checkpoint past each range is staged before its events are yielded.
+        """
+        with Path(log_path).open("rb") as log_file:
+            stat = os.fstat(log_file.fileno())
+            offset, rotated = self._resume_offset(log_file, stat)
+            if rotated is not None:
+                for block in self._iter_rotated_remainder(rotated):
+                    yield self._scan_block(block)
+            end = stat.st_size
+            if end > offset:
+                with mmap.mmap(
+                    log_file.fileno(),
+                    end,
+                    access=mmap.ACCESS_READ,
+                ) as buffer:
+                    if self.checkpoint_path:
+                        # Leave a partially written last line for the next run
+                        end = buffer.rfind(b"\n", offset, end) + 1 or offset
+                    range_start = offset
+                    start = time.perf_counter()
+                    for range_end, found in iter_events_parallel(
+                        log_path,
+                        buffer,
+                        offset,
+                        end,
+                        timestamps=self.timestamps,
+                        workers=self.workers,
+                    ):
+                        if metrics.REGISTRY.enabled:
+                            metrics.LOG_PARSE_SECONDS.inc(time.perf_counter() - start)
+                            _count_parsed(
+                                range_end - range_start,
+                                count_lines(buffer, range_start, range_end),
+                                found,
+                            )
+                        self._stage_checkpoint(log_file, stat, range_end)
+                        yield self._tag(found)
+                        range_start = range_end
+                        start = time.perf_counter()
+            logger.info("Read %d new bytes from offset %d", end - offset, offset)
+            self._stage_checkpoint(log_file, stat, end)
+
+    def _iter_new_events(self, log_path: str) -> Generator[list[BanEvent]]:
+        """Yield the events added since the last checkpoint block by block, see commit_checkpoint()."""
+        if self.workers > 1:
+            yield from self._iter_parallel_events(log_path)
+            return
+        for block in self._iter_new_blocks(log_path):
+            yield self._scan_block(block)
+
+    def _tag(self, events: list[BanEvent]) -> list[BanEvent]:
+        """Give ``host`` to the events whose line names no host."""
+        if not self.host:
+            return events
+        return [event if event.host else event._replace(host=self.host) for event in events]
+
+    def _scan(self, block: bytes, timestamps: TimestampParser) -> list[BanEvent]:
+        if self.executor is None:
+            return scan_events(block, timestamps)
+        return self.executor.submit(scan_block, block, timestamps.now).result()
+
+    def _scan_block(self, block: bytes, timestamps: TimestampParser | None = None) -> list[BanEvent]:
+        """Return the events found in a block of complete lines, with the timestamps of the live log by default."""
+        if timestamps is None:
+            timestamps = self.timestamps
+        if not metrics.REGISTRY.enabled:
+            return self._tag(self._scan(block, timestamps))
+        start = time.perf_counter()
+        events = self._scan(block, timestamps)
+        metrics.LOG_PARSE_SECONDS.inc(time.perf_counter() - start)
+        _count_parsed(len(block), block.count(b"\n"), events)
+        return self._tag(events)
+
+    def _start_read(self) -> str:
+        """Validate the log path and reset the per-read state."""
+        log_path = self._validate_log_path()
+        self.pending_rotated = []
+        self.positions = []
+        self.timestamps = TimestampParser()
+        return log_path
+
+    def iter_events(self) -> Iterator[BanEvent]:
+        """Yield the events added since the last checkpoint, live log first.
+
+        With ``workers`` greater than one the log is memory-mapped and scanned
+        in parallel processes, with the same result as the serial path.
+        """
+        log_path = self._start_read()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            rotated = executor.submit(self._scan_rotated)
+            for events in self._iter_new_events(log_path):
+                yield from events
+            events, fingerprints = rotated.result()
+            self.pending_rotated.extend(fingerprints)
+            yield from events
+
+    def read_events(self) -> list[BanEvent]:
+        """Return the events added since the last checkpoint."""
+        return list(self.iter_events())
+
+    def count_banned_ips(self) -> Counter[str]:
+        """Count the Ban and Restore Ban lines of each IP added since the last checkpoint."""
+        return Counter(event.ip for event in self.iter_events() if event.is_ban)
+
+    def unread_bytes(self) -> int:
+        """Return how many bytes were written to the log since the last committed checkpoint."""
+        try:
+            stat = Path(self._validate_log_path()).stat()
+        except FileNotFoundError:
+            return 0
+        checkpoint = (
+            LogCheckpoint.load(self.checkpoint_path) if self.checkpoint_path else None
+        )
+        if checkpoint is None or not checkpoint.same_file(stat):
+            return stat.st_size
+        return max(0, stat.st_size - checkpoint.offset)
+
+    def has_new_events(self) -> bool:
+        """Return whether a read could find anything to ingest, without parsing the log.
+
+        IPs left to retry and rotated files not known to be ingested count as
+        something to ingest. Otherwise the new lines are only searched for
+        the event markers, stopping at the first one. When nothing is found,
+        the checkpoint past those lines is staged for commit_checkpoint().
+        """
+        if self.retry_ips():
+            return True
+        log_path = self._start_read()
+        if self.rotated_glob:
+            checkpoint = (
+                LogCheckpoint.load(self.checkpoint_path) if self.checkpoint_path else None
+            )
+            known = set(checkpoint.rotated) if checkpoint else set()
+            if not all(
+                is_known_rotated(path, known)
+                for path in self._rotated_files(self.rotated_glob, checkpoint)
+            ):
+                return True
+        blocks = self._iter_new_blocks(log_path)
+        try:
+            for block in blocks:
+                if any(marker in block for marker in EVENT_MARKERS):
+                    return True
+        finally:
+            blocks.close()
+        return False
+
+    def retry_ips(self) -> list[str]:
+        """Return the IPs whose enrichment failed on the last committed run."""
+        if not self.checkpoint_path:
+            return []
+        checkpoint = LogCheckpoint.load(self.checkpoint_path)
+        return checkpoint.retry_ips if checkpoint else []
+
+    def commit_checkpoint(self, retry_ips: Iterable[str] = (), *, blocks: int | None = None) -> None:
+        """Persist the checkpoint reached by the last read.
+
+        Call this once the parsed events have been stored, so that a failed run
+        is parsed again on the next one. ``retry_ips`` are kept for the next
+        run to enrich, since their lines will not be read again. With
+        ``blocks``, only the position reached after the first ``blocks``
+        blocks yielded by iter_event_blocks() is persisted, so that a run
+        storing its events batch by batch resumes after the last batch stored.
+        """
+        if blocks is None:
+            position = ReadPosition(self.pending_checkpoint, len(self.pending_rotated))
+        elif blocks:
+            position = self.positions[blocks - 1]
+        else:
+            return
+        if self.checkpoint_path and position.checkpoint is not None:
+            previous = LogCheckpoint.load(self.checkpoint_path)
+            rotated = (previous.rotated if previous else []) + self.pending_rotated[: position.rotated]
+            dataclasses.replace(
+                position.checkpoint,
+                rotated=list(dict.fromkeys(rotated))[-MAX_FINGERPRINTS:],
+                retry_ips=list(dict.fromkeys(retry_ips)),
+            ).save(self.checkpoint_path)
+
+    def report(self, banned_ips: Collection[str]) -> None:
+        """Log the outcome of a read and export the IPs if an output file is set."""
+        if not banned_ips:
+            logger.warning("No IP addresses found in the log file")
+            # Debug the regex pattern used
+            logger.debug("Regex pattern: %s", self.pattern.pattern)
+        else:
+            logger.info("Found %d unique banned IPs", len(banned_ips))
+            logger.debug("Found IPs: %s", banned_ips)
+        if self.output_file and banned_ips:
+            logger.info("Writing banned IPs to: %s", self.output_file)
+            with Path(self.output_file).open("w") as out_file:
+                out_file.writelines(f"{ip}\n" for ip in banned_ips)
 
     def read_logs(self) -> set[str]:
         """Read logs from the specified file path and extract banned IP addresses.
@@ -28,49 +471,88 @@ def read_logs(self) -> set[str]:
             ValueError: If the log path is not provided
 
         """
-        banned_ips = set()
-
-        if not self.log_path:
-            logger.error("No log path provided")
-            msg = "Log path must be provided"
-            raise ValueError(msg)
-        if not Path(self.log_path).exists():
-            logger.error("Log file not found at path: %s", self.log_path)
-            msg = f"Log file not found: {self.log_path}"
-            raise FileNotFoundError(msg)
+        self._validate_log_path()
         try:
             logger.info("Reading log file from: %s", self.log_path)
-            with Path(self.log_path).open() as log_file:
-                content = log_file.read()
-
-                # Debug log the content for troubleshooting
-                logger.debug("Log file content: %s", content)
-
-                matches = self.pattern.findall(content)
-                for ip in matches:
-                    banned_ips.add(ip)
-                if not banned_ips:
-                    logger.warning("No IP addresses found in the log file")
-                    # Debug the regex pattern used
-                    logger.debug("Regex pattern: %s", self.pattern.pattern)
-                else:
-                    logger.info("Found %d unique banned IPs", len(banned_ips))
-                    logger.debug("Found IPs: %s", banned_ips)
-            if self.output_file and banned_ips:
-                logger.info("Writing banned IPs to: %s", self.output_file)
-                with Path(self.output_file).open("w") as out_file:
-                    for ip in banned_ips:
-                        out_file.write(f"{ip}\n")
-
+            banned_ips = set(self.count_banned_ips())
+            self.report(banned_ips)
         except PermissionError:
             logger.exception("Permission denied when reading log file")
             raise
-        except UnicodeDecodeError as e:
-            logger.exception("Error decoding log file")
-            msg = f"Could not decode log file: {e}"
-            raise ValueError(msg)
         except Exception as e:
             logger.exception("Unexpected error reading log file")
             raise
         else:
             return banned_ips
+
+    async def iter_event_blocks(self) -> AsyncIterator[list[BanEvent]]:
+        """Yield the events of each chunk of the log, without blocking the event loop.
+
+        The log is read and scanned one chunk at a time in a worker thread, and
+        the next chunk is only read once the caller asks for it, so memory
+        stays bounded whatever the file size. With ``workers`` greater than
+        one each block is a byte range scanned in another process, a few
+        ranges ahead of the caller. The position reached after each block is
+        kept in ``positions``, see commit_checkpoint().
+
+        Raises:
+            FileNotFoundError: If the log file does not exist
+            PermissionError: If the log file cannot be accessed due to permissions
+            ValueError: If the log path is not provided
+
+        """
+        log_path = self._start_read()
+        logger.info("Streaming log file from: %s", log_path)
+        rotated = asyncio.create_task(asyncio.to_thread(self._scan_rotated))
+        blocks = self._iter_new_events(log_path)
+        reading: asyncio.Task[list[BanEvent] | None] | None = None
+        try:
+            while True:
+                reading = asyncio.create_task(asyncio.to_thread(next, blocks, None))
+                # Shielded, since cancelling the task would not stop its thread
+                events = await asyncio.shield(reading)
+                if events is None:
+                    break
+                self._add_position()
+                yield events
+            rotated_events, fingerprints = await rotated
+            self.pending_rotated.extend(fingerprints)
+            self._add_position()
+            yield rotated_events
+        finally:
+            # The generator cannot be closed while a thread is still reading from it
+            if reading is not None:
+                await asyncio.gather(reading, return_exceptions=True)
+            await asyncio.to_thread(blocks.close)
+            await asyncio.gather(rotated, return_exceptions=True)
+
+    def _add_position(self) -> None:
+        self.positions.append(ReadPosition(self.pending_checkpoint, len(self.pending_rotated)))
+
+    async def iter_ban_events(self) -> AsyncIterator[BanEvent]:
+        """Yield events as they are found, see :meth:`iter_event_blocks`."""
+        async for events in self.iter_event_blocks():
+            for event in events:
+                yield event
+
+    async def iter_banned_ips(self) -> AsyncIterator[str]:
+        """Yield the IP of every Ban and Restore Ban event, see :meth:`iter_ban_events`."""
+        async for event in self.iter_ban_events():
+            if event.is_ban:
+                yield event.ip
+
+    async def read_events_async(self) -> list[BanEvent]:
+        """Return the events added since the last checkpoint, reporting the banned IPs like :meth:`read_logs`."""
+        events = [event async for event in self.iter_ban_events()]
+        await asyncio.to_thread(
+            self.report,
+            {event.ip for event in events if event.is_ban},
+        )
+        return events
+
+    async def read_logs_async(self) -> set[str]:
+        """Asynchronous counterpart of :meth:`read_logs` built on :meth:`iter_banned_ips`."""
+        banned_ips = {ip async for ip in self.iter_banned_ips()}
+        await asyncio.to_thread(self.report, banned_ips)
+        return banned_ips
+
@@ -0,0 +1,112 @@
+import logging
+import mmap
+import multiprocessing
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from fail2banmonitoring.fail2ban.events import BanEvent, TimestampParser, scan_events
+
+logger = logging.getLogger(__name__)
+
+# Ranges smaller than this are not worth shipping to another process
+MIN_RANGE_SIZE = 4 * 1024 * 1024
+# Larger backlogs are split further, so that their events are handed over as the scan goes
+MAX_RANGE_SIZE = 32 * 1024 * 1024
+
+
+def split_ranges(
+    buffer: mmap.mmap,
+    start: int,
+    end: int,
+    parts: int,
+) -> list[tuple[int, int]]:
+    """Split ``buffer[start:end]`` into at most ``parts`` ranges that end on a newline."""
+    parts = max(1, min(parts, (end - start) // MIN_RANGE_SIZE))
+    step = (end - start) // parts
+    ranges = []
+    range_start = start
+    for _ in range(parts - 1):
+        newline = buffer.find(b"\n", range_start + step, end)
+        if newline == -1:
+            break
+        ranges.append((range_start, newline + 1))
+        range_start = newline + 1
+    if range_start < end:
+        ranges.append((range_start, end))
+    return ranges
+
+
+def _scan_file_range(
+    log_path: str,
+    start: int,
+    end: int,
+    now: datetime,
+) -> list[BanEvent]:
+    """Worker entry point: map the file and scan the events in one range."""
+    with (
+        Path(log_path).open("rb") as log_file,
+        mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer,
+    ):
+        return scan_events(buffer, TimestampParser(now), start, end)
+
+
+def scan_block(block: bytes, now: datetime) -> list[BanEvent]:
+    """Worker entry point: scan the events of a block of complete lines read by another process."""
+    return scan_events(block, TimestampParser(now))
+
+
+def iter_events_parallel(
+    log_path: str,
+    buffer: mmap.mmap,
+    start: int,
+    end: int,
+    *,
+    timestamps: TimestampParser,
+    workers: int,
+) -> Iterator[tuple[int, list[BanEvent]]]:
+    """Yield the end of each range of ``buffer[start:end]`` and its events, scanned across ``workers`` processes.
+
+    ``buffer`` is a read-only map of ``log_path``; each worker maps the file
+    again and scans its own newline-aligned range without copying it. The
+    ranges are yielded in file order as their futures complete, and at most
+    two per worker are in flight, so a caller that stops asking also stops
+    the scan ahead of it.
+    """
+    parts = max(workers, -(-(end - start) // MAX_RANGE_SIZE))
+    ranges = split_ranges(buffer, start, end, parts)
+    if len(ranges) <= 1:
+        yield end, scan_events(buffer, timestamps, start, end)
+        return
+    processes = min(workers, len(ranges))
+    logger.info("Scanning %d byte ranges in %d processes", len(ranges), processes)
+    # The reader runs next to other threads, which makes forking unsafe
+    executor = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    pending: deque[tuple[int, Future[list[BanEvent]]]] = deque()
+    try:
+        for range_start, range_end in ranges:
+            if len(pending) >= 2 * processes:
+                done_end, future = pending.popleft()
+                yield done_end, future.result()
+            pending.append(
+                (
+                    range_end,
+                    executor.submit(
+                        _scan_file_range,
+                        log_path,
+                        range_start,
+                        range_end,
+                        timestamps.now,
+                    ),
+                ),
+            )
+        while pending:
+            done_end, future = pending.popleft()
+            yield done_end, future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
@@ -0,0 +1,123 @@
+import gzip
+import logging
+import lzma
+import os
+import struct
+import zlib
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, cast
+
+from fail2banmonitoring.fail2ban.events import BanEvent
+
+logger = logging.getLogger(__name__)
+
+# Fingerprints remembered across runs; older ones belong to long deleted files
+MAX_FINGERPRINTS = 1024
+
+
+def stat_fingerprint(stat: os.stat_result) -> str:
+    """Fingerprint a file by identity, cheap enough to check on every run."""
+    return f"stat:{stat.st_dev}:{stat.st_ino}:{stat.st_size}"
+
+
+def content_fingerprint(crc: int, size: int) -> str:
+    """Fingerprint uncompressed content, in the form a gzip trailer stores it."""
+    return f"crc32:{crc & 0xFFFFFFFF:08x}:{size & 0xFFFFFFFF}"
+
+
+def gzip_fingerprint(path: Path) -> str:
+    """Return the content fingerprint of a gzip file from its trailer, without decompressing it."""
+    with path.open("rb") as gzip_file:
+        gzip_file.seek(-8, os.SEEK_END)
+        crc, size = struct.unpack("<II", gzip_file.read(8))
+    return content_fingerprint(crc, size)
+
+
+def plain_fingerprint(path: Path, chunk_size: int) -> str:
+    """Return the content fingerprint of an uncompressed file."""
+    crc = size = 0
+    with path.open("rb") as plain_file:
+        while chunk := plain_file.read(chunk_size):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+    return content_fingerprint(crc, size)
+
+
+@contextmanager
+def open_rotated(path: Path) -> Iterator[IO[bytes]]:
+    """Open a rotated log for reading, decompressing ``.gz`` and ``.xz`` members."""
+    if path.suffix == ".gz":
+        with gzip.open(path, "rb") as gzip_file:
+            yield cast("IO[bytes]", gzip_file)
+    elif path.suffix == ".xz":
+        with lzma.open(path, "rb") as xz_file:
+            yield cast("IO[bytes]", xz_file)
+    else:
+        with path.open("rb") as plain_file:
+            yield plain_file
+
+
+def discover_rotated(pattern: str, exclude: list[str]) -> list[Path]:
+    """Return the files matching ``pattern``, oldest first, without those in ``exclude``."""
+    pattern_path = Path(pattern)
+    excluded = {Path(path).resolve() for path in exclude}
+    files = [
+        path
+        for path in pattern_path.parent.glob(pattern_path.name)
+        if path.is_file() and path.resolve() not in excluded
+    ]
+    return sorted(files, key=lambda path: path.stat().st_mtime)
+
+
+def is_known_rotated(path: Path, known: set[str]) -> bool:
+    """Return True if ``path`` is recognized as ingested from its stat or gzip trailer, without reading it.
+
+    A False answer is not final: the file may still turn out to hold known
+    content once scan_rotated_file() has read it.
+    """
+    if stat_fingerprint(path.stat()) in known:
+        return True
+    return path.suffix == ".gz" and gzip_fingerprint(path) in known
+
+
+def scan_rotated_file(
+    path: Path,
+    known: set[str],
+    *,
+    iter_blocks: Callable[[IO[bytes]], Iterator[bytes]],
+    scan_block: Callable[[bytes], list[BanEvent]],
+) -> tuple[list[BanEvent], list[str]]:
+    """Scan the events of a rotated, possibly compressed, file unless it was already ingested.
+
+    Returns the events and the fingerprints to remember for the file. Gzip
+    files are matched against ``known`` from their trailer, before anything is
+    decompressed; other files are fingerprinted while they are scanned and
+    their events dropped if their content was already ingested.
+    """
+    stat = path.stat()
+    fingerprints = [stat_fingerprint(stat)]
+    if fingerprints[0] in known:
+        return [], []
+    if path.suffix == ".gz":
+        fingerprints.append(gzip_fingerprint(path))
+        if fingerprints[1] in known:
+            logger.debug("Skipping already ingested rotated log %s", path)
+            return [], fingerprints
+
+    logger.info("Reading rotated log %s", path)
+    events: list[BanEvent] = []
+    crc = size = 0
+    with open_rotated(path) as rotated_file:
+        for block in iter_blocks(rotated_file):
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+            events.extend(scan_block(block))
+    fingerprint = content_fingerprint(crc, size)
+    if fingerprint in known:
+        logger.debug("Dropping already ingested rotated log %s", path)
+        events = []
+    if fingerprint not in fingerprints:
+        fingerprints.append(fingerprint)
+    return events, fingerprints
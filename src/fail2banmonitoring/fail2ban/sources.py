@@ -0,0 +1,308 @@
+"""Several fail2ban logs read as one, e.g. logs shipped from many hosts to a collector.
+
+LOG_PATH lists comma separated sources, each a path or a glob, optionally
+prefixed with the host that wrote it, e.g.
+``web1=/srv/logs/web1.log,/var/log/remote/*/fail2ban.log``. Each file is a
+Fail2BanLogParser of its own, with its own checkpoint, and MultiLogParser
+reads them concurrently.
+"""
+
+import asyncio
+import glob
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from collections.abc import AsyncIterator, Collection, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import chain
+from pathlib import Path
+
+from fail2banmonitoring.fail2ban.events import BanEvent
+from fail2banmonitoring.fail2ban.log_parser import DEFAULT_CHUNK_SIZE, Fail2BanLogParser
+from fail2banmonitoring.fail2ban.parallel import MIN_RANGE_SIZE
+from fail2banmonitoring.utils.environment_variables import EnvironmentVariables
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG_PATH = "/var/log/fail2ban.log"
+# Replaced with the path of each log in ROTATED_LOG_GLOB, e.g. {log}.*
+LOG_PLACEHOLDER = "{log}"
+
+
+@dataclass(frozen=True)
+class LogSource:
+    """A log file and the host that wrote it, if known."""
+
+    path: str
+    host: str | None = None
+
+
+def split_source(spec: str) -> tuple[str | None, str]:
+    """Return the host and the path or glob of a LOG_PATH entry such as ``web1=/srv/logs/web1.log``."""
+    host, separator, pattern = spec.partition("=")
+    if not separator or "/" in host:
+        return None, spec
+    return host or None, pattern
+
+
+def expand_sources(specs: Iterable[str]) -> list[LogSource]:
+    """Return the log files listed by LOG_PATH entries, globs expanded.
+
+    A file matched by a glob with a wildcard in its directory takes its
+    host from the name of its directory, e.g. ``web1`` for
+    ``/var/log/remote/web1/fail2ban.log`` matched by
+    ``/var/log/remote/*/fail2ban.log``, unless the entry names one. Paths
+    without wildcards are kept even if missing, so that reading them fails.
+    """
+    sources: dict[str, LogSource] = {}
+    for spec in specs:
+        host, pattern = split_source(spec)
+        if not glob.has_magic(pattern):
+            sources.setdefault(pattern, LogSource(pattern, host))
+            continue
+        host_from_directory = glob.has_magic(str(Path(pattern).parent))
+        for path in sorted(glob.glob(pattern)):  # noqa: PTH207
+            if Path(path).is_file():
+                sources.setdefault(
+                    path,
+                    LogSource(path, host or (Path(path).parent.name if host_from_directory else None)),
+                )
+    return list(sources.values())
+
+
+def source_checkpoint_path(checkpoint_path: str, log_path: str) -> str:
+    """Return the checkpoint file of ``log_path``, next to ``checkpoint_path`` and named after it."""
+    digest = hashlib.sha256(os.fsencode(Path(log_path).absolute())).hexdigest()[:16]
+    return f"{checkpoint_path}.{digest}"
+
+
+class MultiLogParser:
+    """Read the logs of several sources concurrently, each one from its own checkpoint.
+
+    Sources are expanded again before each read, so logs matching a glob
+    are picked up as they appear. Each log is streamed in its own worker
+    thread; when ``workers`` is above one and enough was written, their
+    blocks are scanned in a pool of that many processes shared by all
+    sources, so throughput grows with the number of sources. Events whose
+    line names no host are given the host of their source.
+
+    Committing the checkpoints, see commit_checkpoint(), persists the
+    position of every source reached by the blocks stored so far.
+    """
+
+    def __init__(
+        self,
+        specs: list[str],
+        output_file: str | None,
+        *,
+        checkpoint_path: str | None = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        workers: int = 1,
+        rotated_glob: str | None = None,
+    ) -> None:
+        """Read the logs listed by the LOG_PATH entries ``specs``.
+
+        Each log is checkpointed to its own file named after
+        ``checkpoint_path``, see source_checkpoint_path. Rotated files are
+        read for each log if ``rotated_glob`` is set, which must then
+        contain ``{log}``.
+
+        Raises:
+            ValueError: If ``rotated_glob`` does not contain ``{log}``.
+
+        """
+        if rotated_glob and LOG_PLACEHOLDER not in rotated_glob:
+            msg = f"ROTATED_LOG_GLOB must contain {LOG_PLACEHOLDER} when LOG_PATH lists several logs"
+            raise ValueError(msg)
+        self.specs = specs
+        self.output_file = output_file
+        self.checkpoint_path = checkpoint_path
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.rotated_glob = rotated_glob
+        self._parsers: dict[str, Fail2BanLogParser] = {}
+        # Source of each block yielded by iter_event_blocks(), and its blocks read by then
+        self.positions: list[tuple[Fail2BanLogParser, int]] = []
+        # IPs each source banned or had left to retry, which only its checkpoint keeps to retry
+        self._source_ips: dict[Fail2BanLogParser, set[str]] = {}
+        # Readers and the pipeline refresh the sources from different threads
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> list[Fail2BanLogParser]:
+        """Match the sources again, keeping the parsers of the logs still listed."""
+        with self._lock:
+            return self._refresh_locked()
+
+    def _refresh_locked(self) -> list[Fail2BanLogParser]:
+        parsers = {}
+        for source in expand_sources(self.specs):
+            parser = self._parsers.get(source.path)
+            if parser is None:
+                parser = Fail2BanLogParser(
+                    source.path,
+                    None,
+                    checkpoint_path=(
+                        source_checkpoint_path(self.checkpoint_path, source.path)
+                        if self.checkpoint_path
+                        else None
+                    ),
+                    chunk_size=self.chunk_size,
+                    rotated_glob=(
+                        self.rotated_glob.replace(LOG_PLACEHOLDER, source.path)
+                        if self.rotated_glob
+                        else None
+                    ),
+                    host=source.host,
+                )
+                logger.info("Reading log %s, host %s", source.path, source.host or "from its lines")
+            parsers[source.path] = parser
+        self._parsers = parsers
+        return list(parsers.values())
+
+    @property
+    def log_paths(self) -> list[str]:
+        """Return the log files currently listed, for LogWatchers."""
+        return [parser.log_path or "" for parser in self._refresh()]
+
+    def unread_bytes(self) -> int:
+        """Return how many bytes were written to the logs since their last committed checkpoints."""
+        return sum(parser.unread_bytes() for parser in self._refresh())
+
+    def has_new_events(self) -> bool:
+        """Return whether a read could find anything to ingest in any log, see Fail2BanLogParser.has_new_events."""
+        return any(parser.has_new_events() for parser in self._refresh())
+
+    def retry_ips(self) -> list[str]:
+        """Return the IPs whose enrichment failed on the last committed run."""
+        return list(dict.fromkeys(chain.from_iterable(parser.retry_ips() for parser in self._refresh())))
+
+    def commit_checkpoint(self, retry_ips: Iterable[str] = (), *, blocks: int | None = None) -> None:
+        """Persist the checkpoint of every log reached by the last read.
+
+        Each of ``retry_ips`` is kept in the checkpoint of the logs that
+        banned it in the last read, or had it left to retry, and retry_ips()
+        gathers them from all of them. With ``blocks``, each log is committed
+        as far as the first ``blocks`` blocks yielded by iter_event_blocks()
+        read it, see Fail2BanLogParser.commit_checkpoint.
+        """
+        retry_ips = list(retry_ips)
+        reached: dict[Fail2BanLogParser, int | None]
+        if blocks is None:
+            with self._lock:
+                reached = {
+                    parser: None
+                    for parser in self._parsers.values()
+                    if parser.pending_checkpoint is not None
+                }
+        else:
+            # Later blocks of a log come with more of its blocks read
+            reached = dict(self.positions[:blocks])
+        for parser, parser_blocks in reached.items():
+            source_ips = self._source_ips.get(parser, set())
+            parser.commit_checkpoint(
+                [ip for ip in retry_ips if ip in source_ips],
+                blocks=parser_blocks,
+            )
+
+    def report(self, banned_ips: Collection[str]) -> None:
+        """Log the outcome of a read and export the IPs if an output file is set."""
+        logger.info("Found %d unique banned IPs in %d logs", len(banned_ips), len(self._parsers))
+        if self.output_file and banned_ips:
+            logger.info("Writing banned IPs to: %s", self.output_file)
+            with Path(self.output_file).open("w") as out_file:
+                out_file.writelines(f"{ip}\n" for ip in banned_ips)
+
+    async def iter_event_blocks(self) -> AsyncIterator[list[BanEvent]]:
+        """Yield the events of each chunk of every log, as the logs are read concurrently.
+
+        Raises:
+            FileNotFoundError: If a log without wildcards does not exist
+            PermissionError: If a log cannot be accessed due to permissions
+
+        """
+        parsers = await asyncio.to_thread(self._refresh)
+        unread = await asyncio.to_thread(lambda: sum(parser.unread_bytes() for parser in parsers))
+        executor = None
+        # Small reads, such as the batches of the daemon, are not worth starting processes for
+        if self.workers > 1 and unread >= MIN_RANGE_SIZE:
+            # The reader runs next to other threads, which makes forking unsafe
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info("Scanning %d logs in %d processes", len(parsers), self.workers)
+        self.positions = []
+        self._source_ips = await asyncio.to_thread(
+            lambda: {parser: set(parser.retry_ips()) for parser in parsers},
+        )
+        queue: asyncio.Queue[tuple[Fail2BanLogParser, int, list[BanEvent]] | Exception | None] = (
+            asyncio.Queue(len(parsers) or 1)
+        )
+
+        async def drain(parser: Fail2BanLogParser) -> None:
+            parser.executor = executor
+            try:
+                async for events in parser.iter_event_blocks():
+                    # Blocks without events are committed along with the next one
+                    if events:
+                        await queue.put((parser, len(parser.positions), events))
+            except Exception as e:
+                # Raised by the consumer, which then cancels the other readers
+                await queue.put(e)
+                return
+            finally:
+                parser.executor = None
+            await queue.put(None)
+
+        readers = [asyncio.create_task(drain(parser)) for parser in parsers]
+        running = len(readers)
+        try:
+            while running:
+                item = await queue.get()
+                if item is None:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    parser, blocks, events = item
+                    self.positions.append((parser, blocks))
+                    self._source_ips[parser].update(event.ip for event in events if event.is_ban)
+                    yield events
+        finally:
+            for reader in readers:
+                reader.cancel()
+            await asyncio.gather(*readers, return_exceptions=True)
+            if executor is not None:
+                await asyncio.to_thread(executor.shutdown)
+
+
+LogReader = Fail2BanLogParser | MultiLogParser
+
+
+def build_parser(environment_variables: EnvironmentVariables) -> LogReader:
+    """Return the log parser configured by the environment.
+
+    A single log keeps the checkpoint file of CHECKPOINT_PATH itself; globs
+    and lists of logs are read by a MultiLogParser.
+    """
+    specs = environment_variables.log_sources or [DEFAULT_LOG_PATH]
+    host, path = split_source(specs[0])
+    if len(specs) == 1 and not glob.has_magic(path):
+        return Fail2BanLogParser(
+            log_path=path,
+            output_file=environment_variables.export_ip_path,
+            checkpoint_path=environment_variables.checkpoint_path,
+            workers=environment_variables.parser_workers,
+            rotated_glob=environment_variables.rotated_log_glob,
+            host=host,
+        )
+    return MultiLogParser(
+        specs,
+        environment_variables.export_ip_path,
+        checkpoint_path=environment_variables.checkpoint_path,
+        workers=environment_variables.parser_workers,
+        rotated_glob=environment_variables.rotated_log_glob,
+    )
@@ -0,0 +1,252 @@
+import asyncio
+import contextlib
+import ctypes
+import logging
+import os
+import struct
+import sys
+from collections.abc import Callable
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# inotify(7) flags, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# wd, mask, cookie and len of a struct inotify_event, followed by len bytes of name
+EVENT_HEADER = struct.Struct("iIII")
+DEFAULT_POLL_INTERVAL = 1.0
+
+
+# Events of a watched directory that may concern a log in it
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+
+class Inotify:
+    """One inotify instance notifying the changes of many files, on Linux.
+
+    Must be created and used from a running event loop. The directory of
+    each file is watched, once however many files it holds, so that a new
+    file created or moved in place of a file is noticed too. Events are
+    dispatched by directory and name to the callbacks of the file.
+    """
+
+    def __init__(self) -> None:
+        """Start an inotify instance; ``fd`` is None where inotify is unavailable."""
+        self.fd: int | None = None
+        self._libc: ctypes.CDLL | None = None
+        # Watch descriptor of each directory, and the callbacks of each file by watch and name
+        self._watches: dict[str, int] = {}
+        self._callbacks: dict[tuple[int, bytes], list[Callable[[], None]]] = {}
+        if not sys.platform.startswith("linux"):
+            return
+        libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            return
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            logger.warning("inotify_init1 failed: %s", os.strerror(ctypes.get_errno()))
+            return
+        self.fd = fd
+        self._libc = libc
+        asyncio.get_running_loop().add_reader(fd, self._read_events)
+
+    def watch(self, path: Path, callback: Callable[[], None]) -> tuple[int, bytes] | None:
+        """Call ``callback`` whenever ``path`` changes, return the key for unwatch() or None if it cannot be watched."""
+        if self.fd is None or self._libc is None:
+            return None
+        directory = str(path.parent)
+        wd = self._watches.get(directory)
+        if wd is None:
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                logger.warning("inotify_add_watch failed: %s", os.strerror(ctypes.get_errno()))
+                return None
+            self._watches[directory] = wd
+        key = (wd, os.fsencode(path.name))
+        self._callbacks.setdefault(key, []).append(callback)
+        return key
+
+    def unwatch(self, key: tuple[int, bytes], callback: Callable[[], None]) -> None:
+        """Stop calling ``callback``, dropping the watch of the directory once no file in it is watched."""
+        callbacks = self._callbacks.get(key, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if callbacks:
+            return
+        self._callbacks.pop(key, None)
+        wd = key[0]
+        if self.fd is None or self._libc is None or any(other == wd for other, _ in self._callbacks):
+            return
+        self._libc.inotify_rm_watch(self.fd, wd)
+        self._watches = {directory: other for directory, other in self._watches.items() if other != wd}
+
+    def _read_events(self) -> None:
+        """Drain the inotify queue, calling the callbacks of the files concerned."""
+        if self.fd is None:
+            return
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        position = 0
+        while position + EVENT_HEADER.size <= len(data):
+            wd, _, _, length = EVENT_HEADER.unpack_from(data, position)
+            start = position + EVENT_HEADER.size
+            for callback in self._callbacks.get((wd, data[start : start + length].rstrip(b"\0")), []):
+                callback()
+            position = start + length
+
+    def close(self) -> None:
+        """Stop watching every file."""
+        if self.fd is not None:
+            asyncio.get_running_loop().remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+        self._watches.clear()
+        self._callbacks.clear()
+
+
+class LogWatcher:
+    """Wait for a log file to change, with inotify on Linux and polling elsewhere.
+
+    Must be created and used from a running event loop. A rotation, i.e. a
+    new file created or moved in place of the log, counts as a change.
+    Watchers given the same ``inotify`` share its instance.
+    """
+
+    def __init__(
+        self,
+        log_path: str,
+        *,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        use_inotify: bool = True,
+        inotify: Inotify | None = None,
+    ) -> None:
+        """Start watching ``log_path``, with ``inotify`` or an instance of its own."""
+        self.log_path = log_path
+        self.poll_interval = poll_interval
+        self._changed = asyncio.Event()
+        self._own_inotify = inotify is None and use_inotify
+        self._inotify = Inotify() if self._own_inotify else inotify
+        self._key = (
+            self._inotify.watch(Path(log_path), self.wake)
+            if self._inotify is not None and use_inotify
+            else None
+        )
+        self._last_stat = self._stat()
+        if self._key is not None:
+            logger.info("Following %s with inotify", log_path)
+        else:
+            logger.info("Following %s by polling every %.1fs", log_path, poll_interval)
+
+    def _stat(self) -> tuple[int, int, int] | None:
+        try:
+            stat = Path(self.log_path).stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def wake(self) -> None:
+        """Make the pending or next wait() return at once."""
+        self._changed.set()
+
+    async def wait(self, max_wait: float | None = None) -> bool:
+        """Wait until the log changes or ``max_wait`` seconds pass, return True on a change."""
+        loop = asyncio.get_running_loop()
+        deadline = None if max_wait is None else loop.time() + max_wait
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - loop.time())
+            wait_for = remaining
+            if self._key is None:
+                wait_for = self.poll_interval if remaining is None else min(self.poll_interval, remaining)
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._changed.wait(), wait_for)
+            stat = self._stat()
+            if self._changed.is_set() or stat != self._last_stat:
+                self._changed.clear()
+                self._last_stat = stat
+                return True
+            if deadline is not None and loop.time() >= deadline:
+                return False
+
+    def close(self) -> None:
+        """Stop watching the log."""
+        if self._inotify is not None:
+            if self._key is not None:
+                self._inotify.unwatch(self._key, self.wake)
+                self._key = None
+            if self._own_inotify:
+                self._inotify.close()
+
+
+class LogWatchers:
+    """Wait for any of several log files to change, see LogWatcher.
+
+    The files watched can change between two waits, e.g. when a new host
+    starts writing to a directory matched by a glob. They share a single
+    inotify instance, so their number is not limited by
+    ``fs.inotify.max_user_instances``.
+    """
+
+    def __init__(
+        self,
+        log_paths: list[str],
+        *,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        use_inotify: bool = True,
+    ) -> None:
+        """Start watching ``log_paths``."""
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self._inotify = Inotify() if use_inotify else None
+        self._watchers: dict[str, LogWatcher] = {}
+        self.watch(log_paths)
+
+    def watch(self, log_paths: list[str]) -> None:
+        """Watch ``log_paths`` from now on, and stop watching the other files."""
+        for log_path in set(self._watchers) - set(log_paths):
+            self._watchers.pop(log_path).close()
+        for log_path in log_paths:
+            if log_path not in self._watchers:
+                self._watchers[log_path] = LogWatcher(
+                    log_path,
+                    poll_interval=self.poll_interval,
+                    use_inotify=self.use_inotify,
+                    inotify=self._inotify,
+                )
+
+    def wake(self) -> None:
+        """Make the pending or next wait() return at once."""
+        for watcher in self._watchers.values():
+            watcher.wake()
+
+    async def wait(self, max_wait: float | None = None) -> bool:
+        """Wait until a log changes or ``max_wait`` seconds pass, return True on a change."""
+        watchers = list(self._watchers.values())
+        if len(watchers) == 1:
+            return await watchers[0].wait(max_wait)
+        if not watchers:
+            await asyncio.sleep(self.poll_interval if max_wait is None else max_wait)
+            return False
+        waits = [asyncio.create_task(watcher.wait(max_wait)) for watcher in watchers]
+        try:
+            await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for wait in waits:
+                wait.cancel()
+            # Waits that saw a change before being cancelled still report it
+            results = await asyncio.gather(*waits, return_exceptions=True)
+        return any(result is True for result in results)
+
+    def close(self) -> None:
+        """Stop watching every log."""
+        for watcher in self._watchers.values():
+            watcher.close()
+        self._watchers.clear()
+        if self._inotify is not None:
+            self._inotify.close()
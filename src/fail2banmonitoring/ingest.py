@@ -0,0 +1,111 @@
+import logging
+
+import aiohttp
+
+from fail2banmonitoring.db.config import (
+    DEFAULT_WRITE_BATCH_SIZE,
+    SqlConnectorConfig,
+    SqlEngine,
+)
+from fail2banmonitoring.fail2ban.sources import LogReader
+from fail2banmonitoring.pipeline import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_QUEUE_SIZE,
+    IngestPipeline,
+    PipelineStats,
+)
+from fail2banmonitoring.services.cache import (
+    DEFAULT_MAX_ENTRIES,
+    DEFAULT_TTL_SECONDS,
+    IPMetadataCache,
+)
+from fail2banmonitoring.services.ip import DEFAULT_CONCURRENCY, IPMetadata
+from fail2banmonitoring.services.providers import (
+    CacheProvider,
+    EnrichmentProvider,
+    GeoIPProvider,
+    IPAPIProvider,
+    ProviderChain,
+)
+from fail2banmonitoring.subnets import SubnetIndex
+from fail2banmonitoring.utils.environment_variables import EnvironmentVariables
+
+logger = logging.getLogger(__name__)
+
+
+def build_sql_engine(environment_variables: EnvironmentVariables) -> SqlEngine:
+    """Return the database engine configured by the environment, connected lazily."""
+    return SqlEngine(
+        SqlConnectorConfig(
+            drivername=environment_variables.driver,
+            username=environment_variables.username,
+            password=environment_variables.password,
+            host=environment_variables.host,
+            database=environment_variables.database,
+        ),
+        write_batch_size=environment_variables.db_write_batch_size or DEFAULT_WRITE_BATCH_SIZE,
+    )
+
+
+async def build_chain(
+    environment_variables: EnvironmentVariables,
+    session: aiohttp.ClientSession,
+) -> ProviderChain:
+    """Return the enrichment providers listed in ENRICHMENT_PROVIDERS, skipping unconfigured ones."""
+    providers: list[EnrichmentProvider] = []
+    for name in environment_variables.enrichment_providers:
+        if name == GeoIPProvider.name:
+            if environment_variables.geoip_databases:
+                providers.append(
+                    await GeoIPProvider.open(environment_variables.geoip_databases),
+                )
+        elif name == CacheProvider.name:
+            if environment_variables.enrichment_cache_path:
+                cache = IPMetadataCache(
+                    environment_variables.enrichment_cache_path,
+                    ttl=environment_variables.enrichment_cache_ttl or DEFAULT_TTL_SECONDS,
+                    max_entries=environment_variables.enrichment_cache_max_entries
+                    or DEFAULT_MAX_ENTRIES,
+                )
+                providers.append(CacheProvider(cache))
+        elif name == IPAPIProvider.name:
+            providers.append(
+                IPAPIProvider(
+                    session,
+                    url=environment_variables.ip_api_url or IPMetadata.API_URL,
+                    concurrency=environment_variables.ip_api_concurrency
+                    or DEFAULT_CONCURRENCY,
+                ),
+            )
+        else:
+            msg = f"Unknown enrichment provider: {name}"
+            raise ValueError(msg)
+    logger.info("Enrichment providers: %s", ", ".join(p.name for p in providers))
+    return ProviderChain(providers)
+
+
+async def ingest(
+    parser: LogReader,
+    chain: EnrichmentProvider,
+    sql_engine: SqlEngine,
+    *,
+    create_tables: bool = True,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    subnets: SubnetIndex | None = None,
+) -> PipelineStats:
+    """Read new events, enrich their IPs, store both and commit the checkpoint.
+
+    The three stages overlap, see IngestPipeline. IPs that could not be
+    enriched are kept in the checkpoint and enriched again by the next call.
+    The bans are also counted in ``subnets``, if given.
+    """
+    pipeline = IngestPipeline(
+        parser,
+        chain,
+        sql_engine,
+        batch_size=batch_size,
+        queue_size=queue_size,
+        subnets=subnets,
+    )
+    return await pipeline.run(create_tables=create_tables)
@@ -0,0 +1,172 @@
+import logging
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Any
+
+import sqlalchemy as sa
+from sqlalchemy.exc import DBAPIError, OperationalError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.orm import Mapped, mapped_column
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+from fail2banmonitoring.db.bulk import copy_rows, insert_rows, uses_copy
+from fail2banmonitoring.db.config import SqlEngine
+from fail2banmonitoring.fail2ban.addresses import pack_ip
+from fail2banmonitoring.fail2ban.events import BanEvent
+from fail2banmonitoring.models.base import PACKED_IP, _Base
+from fail2banmonitoring.models.rollup import BanRollupModel
+from fail2banmonitoring.services.ip import IPMetadata
+from fail2banmonitoring.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Columns of the row tuples built by BanEventModel.to_row, in order
+COLUMNS = ("timestamp", "jail", "action", "ip_address", "ip_packed", "host")
+
+
+class BanEventModel(_Base):
+    """Represents a single Ban, Unban or Restore Ban action fail2ban took.
+
+    Unlike the ``ip`` table, which holds a single enriched row per IP, this
+    table holds one compact row per log line, so dashboards can count bans.
+
+    Attributes
+    ----------
+    timestamp : datetime | None
+        When fail2ban logged the event.
+    jail : str
+        The jail that acted on the IP.
+    action : str
+        ``Ban``, ``Unban`` or ``Restore Ban``.
+    ip_address : str
+        The IP address.
+    ip_packed : bytes | None
+        The IP address packed in 16 bytes, for indexed network lookups, see in_network.
+    host : str | None
+        The host that logged the event, when the log line carries it.
+    created_at : datetime
+        The timestamp when the record was created.
+
+    Methods
+    -------
+    insert(events: List[BanEvent], sql_engine: SqlEngine) -> None
+        Bulk insert a list of BanEvent records into the database.
+    write(conn: AsyncConnection, events: List[BanEvent]) -> None
+        Insert them in the transaction of a connection.
+
+    """
+
+    __tablename__ = "ban_event"
+    id: Mapped[int] = mapped_column(sa.Integer, primary_key=True, autoincrement=True)
+    timestamp: Mapped[datetime | None] = mapped_column(sa.DateTime, index=True)
+    jail: Mapped[str] = mapped_column(sa.String(50))
+    action: Mapped[str] = mapped_column(sa.String(16))
+    ip_address: Mapped[str] = mapped_column(sa.String(50))
+    ip_packed: Mapped[bytes | None] = mapped_column(PACKED_IP, index=True)
+    host: Mapped[str | None] = mapped_column(sa.String(100))
+    created_at: Mapped[datetime] = mapped_column(
+        sa.DateTime,
+        server_default=sa.func.now(),
+    )
+
+    @staticmethod
+    def to_row(event: BanEvent) -> tuple[Any, ...]:
+        """Return the values of ``COLUMNS`` for a BanEvent."""
+        return (event.timestamp, event.jail, event.action, event.ip, pack_ip(event.ip), event.host)
+
+    @retry(
+        reraise=True,
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(
+            multiplier=1,
+            min=2,
+            max=10,
+        ),
+        retry=retry_if_exception_type((OperationalError, DBAPIError)),
+    )
+    @staticmethod
+    async def insert(
+        events: list[BanEvent],
+        sql_engine: SqlEngine,
+        *,
+        metadata: Mapping[str, IPMetadata] | None = None,
+    ) -> None:
+        """Bulk insert a list of BanEvent records, with COPY on PostgreSQL.
+
+        Other databases get batches of ``sql_engine.write_batch_size`` rows,
+        see insert_rows. With ``metadata``, the hourly rollups are updated in
+        the same transaction, see BanRollupModel.
+
+        Parameters
+        ----------
+        events : List[BanEvent]
+            The events to be inserted.
+        sql_engine : SqlEngine
+            The SQLAlchemy engine instance used for database operations.
+        metadata : Mapping[str, IPMetadata] | None
+            The metadata of the IPs of the events, by IP, to count them in the rollups.
+
+        Raises
+        ------
+        SQLAlchemyError
+            If a database error occurs that cannot be resolved with retries
+
+        """
+        if not events:
+            logger.debug("No ban events to insert")
+            return
+
+        try:
+            async with sql_engine.engine.begin() as conn:
+                await BanEventModel.write(
+                    conn,
+                    events,
+                    metadata=metadata,
+                    batch_size=sql_engine.write_batch_size,
+                )
+        except SQLAlchemyError:
+            logger.exception("Database error during ban event insert")
+            raise
+
+    @staticmethod
+    async def write(
+        conn: AsyncConnection,
+        events: list[BanEvent],
+        *,
+        metadata: Mapping[str, IPMetadata] | None = None,
+        batch_size: int,
+    ) -> None:
+        """Insert ``events``, and with ``metadata`` their rollups, in the transaction of ``conn``, see insert.
+
+        Parameters
+        ----------
+        conn : AsyncConnection
+            The connection to write with.
+        events : List[BanEvent]
+            The events to be inserted.
+        metadata : Mapping[str, IPMetadata] | None
+            The metadata of the IPs of the events, by IP, to count them in the rollups.
+        batch_size : int
+            The rows sent per statement, see insert_rows.
+
+        """
+        if not events:
+            return
+        rows = [BanEventModel.to_row(event) for event in events]
+        with metrics.DB_INSERT_SECONDS.time(BanEventModel.__tablename__):
+            if uses_copy(conn):
+                await copy_rows(conn, BanEventModel.__tablename__, COLUMNS, rows)
+            else:
+                await insert_rows(conn, INSERT_STATEMENT, COLUMNS, rows, batch_size=batch_size)
+            if metadata is not None:
+                await BanRollupModel.add(conn, events, metadata, batch_size=batch_size)
+        metrics.DB_ROWS_WRITTEN.inc(len(rows), BanEventModel.__tablename__)
+        logger.debug("Bulk inserted %d ban events into the database", len(events))
+
+
+INSERT_STATEMENT = sa.insert(BanEventModel)
@@ -1,6 +1,23 @@
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
 from sqlalchemy.orm import DeclarativeBase
 
+from fail2banmonitoring.fail2ban.addresses import PACKED_SIZE, network_range
+
+# IPs packed by pack_ip; VARBINARY on MySQL, where BLOB columns cannot be indexed whole
+PACKED_IP = sa.LargeBinary(PACKED_SIZE).with_variant(mysql.VARBINARY(PACKED_SIZE), "mysql", "mariadb")
+
 
 class _Base(DeclarativeBase):
 
     """Base class for all SQLAlchemy ORM models."""
+
+
+def in_network(column: sa.ColumnElement[bytes | None], network: str) -> sa.ColumnElement[bool]:
+    """Return a condition on a column of packed IPs matching the ones in ``network``, e.g. ``45.0.0.0/8``.
+
+    Blocks are contiguous ranges of packed values, so an index on the
+    column answers it with a range scan.
+    """
+    first, last = network_range(network)
+    return column.between(first, last)
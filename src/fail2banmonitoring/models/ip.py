@@ -1,10 +1,13 @@
+import functools
 import logging
+from collections import Counter
+from collections.abc import Mapping
 from datetime import datetime
-from typing import Self
+from typing import Any, Self
 
 import sqlalchemy as sa
 from sqlalchemy.exc import DBAPIError, OperationalError, SQLAlchemyError
-from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.ext.asyncio import AsyncConnection
 from sqlalchemy.orm import Mapped, mapped_column
 from tenacity import (
     retry,
@@ -13,12 +16,37 @@
     wait_exponential,
 )
 
+from fail2banmonitoring.db.bulk import build_upsert, copy_rows, insert_rows, uses_copy
 from fail2banmonitoring.db.config import SqlEngine
-from fail2banmonitoring.models.base import _Base
+from fail2banmonitoring.fail2ban.addresses import pack_ip
+from fail2banmonitoring.models.base import PACKED_IP, _Base
+from fail2banmonitoring.models.migrations import migrate
 from fail2banmonitoring.services.ip import IPMetadata
+from fail2banmonitoring.utils import metrics
 
 logger = logging.getLogger(__name__)
 
+# Metadata columns refreshed when a known IP is enriched again
+METADATA_COLUMNS = (
+    "country",
+    "country_code",
+    "region",
+    "region_name",
+    "city",
+    "zip",
+    "lat",
+    "lon",
+    "timezone",
+    "isp",
+    "org",
+    "as",
+)
+# Columns of the row tuples built by IpModel.to_row, in order
+COLUMNS = (*METADATA_COLUMNS, "ip_address", "ip_packed", "host", "hit_count")
+# On PostgreSQL rows are copied to this table, then upserted from it in one statement
+STAGING_TABLE = "ip_staging"
+CREATE_STAGING_TABLE = "CREATE TEMPORARY TABLE ip_staging (LIKE ip INCLUDING DEFAULTS) ON COMMIT DROP"
+
 
 class IpModel(_Base):
     """Represents an IP address entry in the database with associated metadata.
@@ -50,18 +78,30 @@ class IpModel(_Base):
     as_field : str | None
         The autonomous system (AS) of the IP address.
     ip_address : str | None
-        The IP address.
+        The IP address, unique across the table.
+    ip_packed : bytes | None
+        The IP address packed in 16 bytes, for indexed network lookups, see in_network.
+    host : str | None
+        The host whose log last banned the IP, when known.
+    hit_count : int
+        How many Ban and Restore Ban events of the IP were ingested.
     created_at : datetime
         The timestamp when the record was created.
+    last_seen : datetime
+        The timestamp when the record was last inserted or updated.
 
     Methods
     -------
-    insert(ips: List[IPMetadata], sql_engine: SqlEngine) -> None
-        Insert a list of IPMetadata objects into the database.
+    insert(ips: List[IPMetadata], sql_engine: SqlEngine, hosts: Mapping[str, str | None], hits: Mapping[str, int]) -> None
+        Upsert a list of IPMetadata objects into the database.
+    write(conn: AsyncConnection, ips: List[IPMetadata], hosts: Mapping[str, str | None], hits: Mapping[str, int]) -> None
+        Upsert them in the transaction of a connection.
 
     """
 
     __tablename__ = "ip"
+    # Dashboards count the IPs seen recently, grouped by country
+    __table_args__ = (sa.Index("ix_ip_last_seen_country", "last_seen", "country"),)
     id: Mapped[int] = mapped_column(sa.Integer, primary_key=True, autoincrement=True)
     country: Mapped[str | None] = mapped_column(sa.String(30))
     country_code: Mapped[str | None] = mapped_column(sa.String(30))
@@ -75,10 +115,23 @@ class IpModel(_Base):
     isp: Mapped[str | None] = mapped_column(sa.String(50))
     org: Mapped[str | None] = mapped_column(sa.String(50))
     as_field: Mapped[str | None] = mapped_column("as", sa.String(50), nullable=True)
-    ip_address: Mapped[str | None] = mapped_column(sa.String(50), name="ip_address")
+    ip_address: Mapped[str | None] = mapped_column(
+        sa.String(50),
+        name="ip_address",
+        unique=True,
+        index=True,
+    )
+    ip_packed: Mapped[bytes | None] = mapped_column(PACKED_IP, index=True)
+    host: Mapped[str | None] = mapped_column(sa.String(100))
+    hit_count: Mapped[int] = mapped_column(sa.Integer, server_default="1")
     created_at: Mapped[datetime] = mapped_column(
         sa.DateTime,
         server_default=sa.func.now(),
+        index=True,
+    )
+    last_seen: Mapped[datetime] = mapped_column(
+        sa.DateTime,
+        server_default=sa.func.now(),
     )
 
     @classmethod
@@ -98,22 +151,89 @@ def from_metadata(cls, ip_metadata: IPMetadata) -> Self:
             org=ip_metadata.org,
             as_field=ip_metadata.as_value,
             ip_address=ip_metadata.query,
+            ip_packed=pack_ip(ip_metadata.query),
         )
 
+    @staticmethod
+    def to_row(
+        ip_metadata: IPMetadata,
+        hit_count: int = 1,
+        host: str | None = None,
+    ) -> tuple[Any, ...]:
+        """Return the values of ``COLUMNS`` for an IPMetadata object banned on ``host``."""
+        return (
+            ip_metadata.country,
+            ip_metadata.country_code,
+            ip_metadata.region,
+            ip_metadata.region_name,
+            ip_metadata.city,
+            ip_metadata.zip,
+            ip_metadata.lat,
+            ip_metadata.lon,
+            ip_metadata.timezone,
+            ip_metadata.isp,
+            ip_metadata.org,
+            ip_metadata.as_value,
+            ip_metadata.query,
+            pack_ip(ip_metadata.query),
+            host,
+            hit_count,
+        )
+
+    @staticmethod
+    def hit_row(ip: str, hit_count: int, host: str | None = None) -> tuple[Any, ...]:
+        """Return the values of ``COLUMNS`` counting hits of an IP without new metadata, which the upsert keeps."""
+        return (*(None for _ in METADATA_COLUMNS), ip, pack_ip(ip), host, hit_count)
+
     @classmethod
     async def create_table(cls, sql_engine: SqlEngine) -> None:
-        """Create the IP table in the database if it does not exist."""
-        engine = sql_engine.engine
-        if isinstance(engine, AsyncEngine):
-            async with engine.begin() as conn:
-                await conn.run_sync(cls.metadata.create_all)
-        else:
-            cls.metadata.create_all(bind=engine)
+        """Create the tables if they do not exist and bring existing ones up to date, see migrate."""
+        await migrate(sql_engine)
 
     def __init_subclass__(cls, **kwargs: object) -> None:
         """Initialize subclass; allows for custom subclass initialization."""
         super().__init_subclass__(**kwargs)
 
+    @staticmethod
+    @functools.cache
+    def upsert_statement(dialect: str, *, from_staging: bool = False) -> sa.Insert:
+        """Return the insert statement that merges rows into existing IPs for ``dialect``.
+
+        Known IPs get their hit count incremented, ``last_seen`` refreshed and
+        their metadata and host replaced by the new values that are not null. With
+        ``from_staging`` the rows are read from ``STAGING_TABLE`` instead of
+        bound parameters.
+
+        Raises
+        ------
+        ValueError
+            If the dialect has no upsert support here.
+
+        """
+        table = IpModel.metadata.tables[IpModel.__tablename__]
+        source: sa.Select[Any] | None = None
+        if from_staging:
+            source = sa.table(STAGING_TABLE, *(sa.column(name) for name in COLUMNS)).select()
+
+        def updates(new: sa.ColumnCollection[str, Any]) -> dict[str, Any]:
+            return {
+                **{
+                    name: sa.func.coalesce(new[name], table.c[name])
+                    for name in (*METADATA_COLUMNS, "host")
+                },
+                "hit_count": table.c.hit_count + new.hit_count,
+                "last_seen": sa.func.now(),
+            }
+
+        return build_upsert(
+            dialect,
+            table,
+            ["ip_address"],
+            updates,
+            columns=COLUMNS,
+            source=source,
+        )
+
     @retry(
         reraise=True,
         stop=stop_after_attempt(3),
@@ -125,8 +245,21 @@ def __init_subclass__(cls, **kwargs: object) -> None:
         retry=retry_if_exception_type((OperationalError, DBAPIError)),
     )
     @staticmethod
-    async def insert(ips: list[IPMetadata], sql_engine: SqlEngine) -> None:
-        """Insert a list of IPMetadata objects into the database efficiently using bulk insert.
+    async def insert(
+        ips: list[IPMetadata],
+        sql_engine: SqlEngine,
+        *,
+        hosts: Mapping[str, str | None] | None = None,
+        hits: Mapping[str, int] | None = None,
+    ) -> None:
+        """Upsert a list of IPMetadata objects with Core statements, without ORM instances.
+
+        Each IP keeps a single row: inserting a known IP updates it instead of
+        adding a copy, see upsert_statement. Without ``hits`` the same IP
+        listed several times counts as several hits, the last record winning.
+        On PostgreSQL the
+        rows are streamed with COPY, elsewhere they are sent in batches of
+        ``sql_engine.write_batch_size``, see insert_rows.
 
         Parameters
         ----------
@@ -134,6 +267,11 @@ async def insert(ips: list[IPMetadata], sql_engine: SqlEngine) -> None:
             The list of IPMetadata objects to be inserted.
         sql_engine : SqlEngine
             The SQLAlchemy engine instance used for database operations.
+        hosts : Mapping[str, str | None] | None
+            The host that banned each IP, by IP, e.g. from the ban events of the batch.
+        hits : Mapping[str, int] | None
+            The hits to add to each IP, by IP, e.g. its ban events in the batch.
+            IPs without a record get their hits and host updated, their metadata kept.
 
         Raises
         ------
@@ -143,26 +281,79 @@ async def insert(ips: list[IPMetadata], sql_engine: SqlEngine) -> None:
             If there's an issue with the data format or the engine is not initialized
 
         """
-        if not ips:
+        if not ips and not hits:
             logger.debug("No IP records to insert")
             return
 
         try:
-            ip_models = [IpModel.from_metadata(ip) for ip in ips]
-
-            try:
-                engine = sql_engine.engine
-            except Exception as e:
-                logger.exception("Failed to initialize database engine: %s")
-                msg = f"Database engine initialization failed: {e!s}"
-                raise ValueError(msg) from e
-            try:
-                async with AsyncSession(engine) as session, session.begin():
-                    session.add_all(ip_models)
-                logger.debug("Bulk inserted %d IP records into the database", len(ips))
-            except SQLAlchemyError as e:
-                logger.exception("Database error during bulk insert: %s")
-                raise
+            engine = sql_engine.engine
         except Exception as e:
-            logger.exception("Failed to insert IP records: %s")
+            logger.exception("Failed to initialize database engine: %s")
+            msg = f"Database engine initialization failed: {e!s}"
+            raise ValueError(msg) from e
+        try:
+            async with engine.begin() as conn:
+                await IpModel.write(
+                    conn,
+                    ips,
+                    hosts=hosts,
+                    hits=hits,
+                    batch_size=sql_engine.write_batch_size,
+                )
+        except SQLAlchemyError:
+            logger.exception("Database error during IP upsert")
             raise
+
+    @staticmethod
+    async def write(
+        conn: AsyncConnection,
+        ips: list[IPMetadata],
+        *,
+        hosts: Mapping[str, str | None] | None = None,
+        hits: Mapping[str, int] | None = None,
+        batch_size: int,
+    ) -> None:
+        """Upsert ``ips`` in the transaction of ``conn``, e.g. along with their ban events, see insert.
+
+        Parameters
+        ----------
+        conn : AsyncConnection
+            The connection to write with.
+        ips : List[IPMetadata]
+            The list of IPMetadata objects to be inserted.
+        hosts : Mapping[str, str | None] | None
+            The host that banned each IP, by IP.
+        hits : Mapping[str, int] | None
+            The hits to add to each IP, by IP, by default one per record.
+        batch_size : int
+            The rows sent per statement, see insert_rows.
+
+        """
+        if not ips and not hits:
+            return
+        # A statement may not update the same row twice, so duplicates are merged first
+        if hits is None:
+            hits = Counter(ip.query for ip in ips)
+        latest = {ip.query: ip for ip in ips}
+        hosts = hosts or {}
+        rows = [IpModel.to_row(ip, hits.get(query, 0), hosts.get(query)) for query, ip in latest.items()]
+        rows.extend(
+            IpModel.hit_row(query, count, hosts.get(query))
+            for query, count in hits.items()
+            if query not in latest
+        )
+        with metrics.DB_INSERT_SECONDS.time(IpModel.__tablename__):
+            if uses_copy(conn):
+                await conn.exec_driver_sql(CREATE_STAGING_TABLE)
+                await copy_rows(conn, STAGING_TABLE, COLUMNS, rows)
+                await conn.execute(IpModel.upsert_statement(conn.dialect.name, from_staging=True))
+            else:
+                await insert_rows(
+                    conn,
+                    IpModel.upsert_statement(conn.dialect.name),
+                    COLUMNS,
+                    rows,
+                    batch_size=batch_size,
+                )
+        metrics.DB_ROWS_WRITTEN.inc(len(rows), IpModel.__tablename__)
+        logger.debug("Upserted %d IP records into the database", len(rows))
@@ -0,0 +1,251 @@
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass
+from itertools import batched
+
+import sqlalchemy as sa
+from sqlalchemy.schema import CreateIndex
+
+from fail2banmonitoring.db.config import SqlEngine
+from fail2banmonitoring.fail2ban.addresses import pack_ip
+from fail2banmonitoring.fail2ban.events import UNBAN
+from fail2banmonitoring.models.ban_event import BanEventModel
+from fail2banmonitoring.models.base import PACKED_IP, _Base
+from fail2banmonitoring.models.retention import is_partitioned, partition_ban_events
+from fail2banmonitoring.models.rollup import COLUMNS, BanRollupModel
+
+logger = logging.getLogger(__name__)
+
+# Table an ip table from before upserts is rebuilt into, then renamed to ip
+REBUILT_IP_TABLE = "ip_rebuilt"
+# Rows given their packed IP per statement by the backfill
+BACKFILL_BATCH_SIZE = 5000
+
+schema_version = sa.Table(
+    "schema_version",
+    _Base.metadata,
+    sa.Column("version", sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column("description", sa.String(100)),
+    sa.Column("applied_at", sa.DateTime, server_default=sa.func.now()),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    """A schema change applied once per database, in ``version`` order.
+
+    ``apply`` receives a connection and must be idempotent, so that a
+    migration interrupted halfway can simply run again. Migrations that are
+    not ``transactional`` run in autocommit mode, as needed by statements
+    such as PostgreSQL's CREATE INDEX CONCURRENTLY.
+    """
+
+    version: int
+    description: str
+    apply: Callable[[sa.Connection], None]
+    transactional: bool = True
+
+
+def _merge_duplicate_ips(conn: sa.Connection) -> None:
+    """Rebuild an ip table from before upserts with one row per IP.
+
+    Each IP keeps the metadata of its latest row, the number of rows as
+    ``hit_count``, and its first and last ``created_at`` as ``created_at``
+    and ``last_seen``. The copy is needed since SQLite cannot add a column
+    defaulting to the current time; new ids are assigned, nothing refers to
+    them.
+    """
+    existing = [column["name"] for column in sa.inspect(conn).get_columns("ip")]
+    if "hit_count" in existing:
+        return
+    rebuilt = _Base.metadata.tables["ip"].to_metadata(sa.MetaData(), name=REBUILT_IP_TABLE)
+    # Indexes keep the names they get here once renamed, _create_missing_indexes adds them
+    rebuilt.indexes.clear()
+    rebuilt.create(conn)
+
+    old = sa.table("ip", *(sa.column(name) for name in existing))
+    copied = [name for name in existing if name not in {"id", "created_at"}]
+    latest = (
+        sa.select(
+            sa.func.max(old.c.id).label("id"),
+            sa.func.count().label("hit_count"),
+            sa.func.min(old.c.created_at).label("created_at"),
+            sa.func.max(old.c.created_at).label("last_seen"),
+        )
+        .group_by(old.c.ip_address)
+        .subquery("latest")
+    )
+    source = sa.select(
+        *(old.c[name] for name in copied),
+        latest.c.hit_count,
+        latest.c.created_at,
+        latest.c.last_seen,
+    ).join_from(old, latest, old.c.id == latest.c.id)
+    conn.execute(
+        sa.insert(rebuilt).from_select([*copied, "hit_count", "created_at", "last_seen"], source),
+    )
+    conn.execute(sa.text("DROP TABLE ip"))
+    conn.execute(sa.text("ALTER TABLE ip_rebuilt RENAME TO ip"))
+
+
+def _create_missing_indexes(conn: sa.Connection) -> None:
+    """Create the indexes declared by the models that an existing table lacks.
+
+    PostgreSQL builds them CONCURRENTLY and InnoDB online by default, so
+    writes are not blocked meanwhile. Unique indexes already enforced by an
+    unnamed unique constraint are skipped.
+    """
+    inspector = sa.inspect(conn)
+    for table in _Base.metadata.sorted_tables:
+        existing = inspector.get_indexes(table.name)
+        names = {index["name"] for index in existing}
+        unique_columns = {tuple(index["column_names"]) for index in existing if index["unique"]}
+        unique_columns |= {
+            tuple(constraint["column_names"])
+            for constraint in inspector.get_unique_constraints(table.name)
+        }
+        for index in table.indexes:
+            columns = tuple(column.name for column in index.columns)
+            if index.name in names or (index.unique and columns in unique_columns):
+                continue
+            statement = str(CreateIndex(index).compile(dialect=conn.dialect))
+            # Partitioned tables cannot be indexed concurrently
+            if conn.dialect.name == "postgresql" and not (
+                table.name == BanEventModel.__tablename__ and is_partitioned(conn)
+            ):
+                statement = statement.replace(" INDEX ", " INDEX CONCURRENTLY ", 1)
+            logger.info("Creating index %s on %s", index.name, table.name)
+            conn.execute(sa.text(statement))
+
+
+def _backfill_rollups(conn: sa.Connection) -> None:
+    """Count the ban events stored before the rollups existed, unless they already have rows."""
+    rollup = _Base.metadata.tables[BanRollupModel.__tablename__]
+    if conn.execute(sa.select(rollup.c.bucket).limit(1)).first() is not None:
+        return
+    ban_event = _Base.metadata.tables[BanEventModel.__tablename__]
+    ip = _Base.metadata.tables["ip"]
+    facts = (
+        sa.select(
+            ban_event.c.timestamp,
+            ban_event.c.jail,
+            ip.c.country,
+            ip.c.city,
+            ip.c.isp,
+            ip.c["as"],
+        )
+        .outerjoin_from(ban_event, ip, ban_event.c.ip_address == ip.c.ip_address)
+        .where(ban_event.c.action != UNBAN)
+        .execution_options(yield_per=10_000)
+    )
+    rows = BanRollupModel.count(conn.execute(facts))
+    statement = BanRollupModel.upsert_statement(conn.dialect.name)
+    for batch in batched(rows, 5000):
+        conn.execute(statement, [dict(zip(COLUMNS, row, strict=True)) for row in batch])
+    logger.info("Backfilled %d rollup rows", len(rows))
+
+
+def _backfill_packed_ips(conn: sa.Connection, table: sa.Table) -> None:
+    """Fill in ``ip_packed`` from ``ip_address`` where it is missing, ``BACKFILL_BATCH_SIZE`` rows at a time."""
+    last_id = 0
+    filled = 0
+    update = (
+        sa.update(table)
+        .where(table.c.id == sa.bindparam("row_id"))
+        .values(ip_packed=sa.bindparam("packed"))
+    )
+    while True:
+        rows = conn.execute(
+            sa.select(table.c.id, table.c.ip_address)
+            .where(table.c.id > last_id, table.c.ip_packed.is_(None))
+            .order_by(table.c.id)
+            .limit(BACKFILL_BATCH_SIZE),
+        ).all()
+        if not rows:
+            break
+        # Values that are not IPs are left null
+        values = [
+            {"row_id": row_id, "packed": packed}
+            for row_id, ip in rows
+            if ip and (packed := pack_ip(ip)) is not None
+        ]
+        if values:
+            conn.execute(update, values)
+        filled += len(values)
+        last_id = rows[-1].id
+    if filled:
+        logger.info("Packed %d IPs of %s", filled, table.name)
+
+
+def _add_packed_ips(conn: sa.Connection) -> None:
+    """Add the packed form of each IP next to its text to ip and ban_event, fill it in and index it.
+
+    Runs in autocommit mode, so each backfill batch is kept if the
+    migration is interrupted, and the next attempt only fills the rest.
+    """
+    column_type = PACKED_IP.compile(dialect=conn.dialect)
+    for name in ("ip", BanEventModel.__tablename__):
+        columns = {column["name"] for column in sa.inspect(conn).get_columns(name)}
+        if "ip_packed" not in columns:
+            conn.execute(sa.text(f"ALTER TABLE {name} ADD COLUMN ip_packed {column_type}"))
+        _backfill_packed_ips(conn, _Base.metadata.tables[name])
+    _create_missing_indexes(conn)
+
+
+def _add_ip_host(conn: sa.Connection) -> None:
+    """Add the host that last banned each IP to ip, unknown for the IPs stored so far."""
+    columns = {column["name"] for column in sa.inspect(conn).get_columns("ip")}
+    if "host" not in columns:
+        column_type = _Base.metadata.tables["ip"].c.host.type.compile(dialect=conn.dialect)
+        conn.execute(sa.text(f"ALTER TABLE ip ADD COLUMN host {column_type}"))
+
+
+MIGRATIONS = (
+    Migration(1, "one row per IP, with hit_count and last_seen", _merge_duplicate_ips),
+    Migration(2, "indexes for the dashboard queries", _create_missing_indexes, transactional=False),
+    Migration(3, "hourly ban rollups from the stored ban events", _backfill_rollups),
+    Migration(4, "monthly partitions of ban_event on PostgreSQL", partition_ban_events),
+    Migration(5, "packed IPs, indexed for network lookups", _add_packed_ips, transactional=False),
+    Migration(6, "host that last banned each IP", _add_ip_host),
+)
+
+
+async def migrate(sql_engine: SqlEngine) -> int:
+    """Create the missing tables, apply the pending migrations and return the schema version.
+
+    Tables created here already have the latest schema, so the migrations
+    find nothing to change on a new database and are only recorded.
+
+    Parameters
+    ----------
+    sql_engine : SqlEngine
+        The engine of the database to migrate.
+
+    Returns
+    -------
+    int
+        The version of the latest migration applied to the database.
+
+    """
+    engine = sql_engine.engine
+    async with engine.begin() as conn:
+        await conn.run_sync(_Base.metadata.create_all)
+        result = await conn.execute(sa.select(sa.func.max(schema_version.c.version)))
+        current = result.scalar_one() or 0
+    for migration in MIGRATIONS:
+        if migration.version <= current:
+            continue
+        logger.info("Applying schema migration %d: %s", migration.version, migration.description)
+        async with engine.connect() as conn:
+            if not migration.transactional:
+                await conn.execution_options(isolation_level="AUTOCOMMIT")
+            async with conn.begin():
+                await conn.run_sync(migration.apply)
+                await conn.execute(
+                    sa.insert(schema_version).values(
+                        version=migration.version,
+                        description=migration.description,
+                    ),
+                )
+        current = migration.version
+    return current
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import re
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from fail2banmonitoring.db.config import SqlEngine
+
+logger = logging.getLogger(__name__)
+
+# Rows deleted per transaction, short enough not to hold locks for long
+DEFAULT_RETENTION_BATCH_SIZE = 1000
+# Monthly partitions of ban_event created ahead of the current month
+PARTITIONS_AHEAD = 2
+# The ban_event table from before partitioning, kept as the partition of everything older
+LEGACY_PARTITION = "ban_event_legacy"
+_UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+# The columns retention works with, whichever models were imported
+_BAN_EVENT = sa.table("ban_event", sa.column("id", sa.Integer), sa.column("created_at", sa.DateTime))
+_IP = sa.table("ip", sa.column("id", sa.Integer), sa.column("last_seen", sa.DateTime))
+
+
+def _month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(month: datetime) -> datetime:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def database_now(conn: sa.Connection) -> datetime:
+    """Return the current time of the database, as stored by the ``created_at`` defaults."""
+    if conn.dialect.name == "sqlite":
+        return conn.execute(sa.select(sa.func.current_timestamp())).scalar_one()
+    return conn.execute(sa.select(sa.func.localtimestamp())).scalar_one()
+
+
+def is_partitioned(conn: sa.Connection) -> bool:
+    """Return True if ban_event is a partitioned PostgreSQL table."""
+    if conn.dialect.name != "postgresql":
+        return False
+    query = "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('ban_event')"
+    return conn.execute(sa.text(query)).first() is not None
+
+
+def _partitions(conn: sa.Connection) -> dict[str, datetime]:
+    """Return the upper bound of each partition of ban_event, by partition name."""
+    rows = conn.execute(
+        sa.text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'ban_event'::regclass",
+        ),
+    )
+    bounds = {}
+    for name, bound in rows:
+        if match := _UPPER_BOUND.search(bound):
+            bounds[name] = datetime.fromisoformat(match[1])
+    return bounds
+
+
+def create_partitions(conn: sa.Connection, now: datetime) -> None:
+    """Create the monthly partitions of ban_event up to ``PARTITIONS_AHEAD`` months after ``now``."""
+    start = max(_partitions(conn).values(), default=_month_start(now))
+    horizon = _month_start(now)
+    for _ in range(PARTITIONS_AHEAD + 1):
+        horizon = _next_month(horizon)
+    while start < horizon:
+        end = _next_month(start)
+        logger.info("Creating partition ban_event_p%s", f"{start:%Y_%m}")
+        conn.execute(
+            sa.text(
+                f"CREATE TABLE IF NOT EXISTS ban_event_p{start:%Y_%m} PARTITION OF ban_event "
+                f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')",
+            ),
+        )
+        start = end
+
+
+def partition_ban_events(conn: sa.Connection) -> None:
+    """Turn ban_event into a table partitioned by month of ``created_at``, on PostgreSQL.
+
+    The existing table becomes the partition of everything before next
+    month, so no row is copied, and monthly partitions follow it. The
+    primary key becomes (id, created_at) since it must include the
+    partition key. Other databases are left as they are.
+    """
+    if conn.dialect.name != "postgresql" or is_partitioned(conn):
+        return
+    now = database_now(conn)
+    for statement in (
+        f"ALTER TABLE ban_event RENAME TO {LEGACY_PARTITION}",
+        f"ALTER TABLE {LEGACY_PARTITION} RENAME CONSTRAINT ban_event_pkey TO {LEGACY_PARTITION}_pkey",
+        f"ALTER INDEX IF EXISTS ix_ban_event_timestamp RENAME TO ix_{LEGACY_PARTITION}_timestamp",
+        # Created on the partitioned table by migration 5, when the column exists
+        f"ALTER INDEX IF EXISTS ix_ban_event_ip_packed RENAME TO ix_{LEGACY_PARTITION}_ip_packed",
+        f"CREATE TABLE ban_event (LIKE {LEGACY_PARTITION} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)",
+        "ALTER TABLE ban_event ADD PRIMARY KEY (id, created_at)",
+        "ALTER SEQUENCE ban_event_id_seq OWNED BY ban_event.id",
+        'CREATE INDEX ix_ban_event_timestamp ON ban_event ("timestamp")',
+        (
+            f"ALTER TABLE ban_event ATTACH PARTITION {LEGACY_PARTITION} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{_next_month(_month_start(now)):%Y-%m-%d}')"
+        ),
+    ):
+        conn.execute(sa.text(statement))
+    create_partitions(conn, now)
+
+
+def _drop_expired_partitions(conn: sa.Connection, cutoff: datetime) -> None:
+    """Detach and drop the partitions of ban_event holding only rows older than ``cutoff``."""
+    quote = conn.dialect.identifier_preparer.quote
+    for name, upper in _partitions(conn).items():
+        if upper <= cutoff:
+            logger.info("Dropping partition %s, older than %s", name, cutoff)
+            conn.execute(sa.text(f"ALTER TABLE ban_event DETACH PARTITION {quote(name)}"))
+            conn.execute(sa.text(f"DROP TABLE {quote(name)}"))
+
+
+async def _delete_expired_events(engine: AsyncEngine, cutoff: datetime, batch_size: int) -> int:
+    """Delete the ban events created before ``cutoff``, ``batch_size`` at a time.
+
+    Ids grow with ``created_at``, so rows are paginated on the primary key
+    and deletion stops at the first batch holding a recent row.
+    """
+    table = _BAN_EVENT
+    deleted = 0
+    last_id = 0
+    while True:
+        async with engine.begin() as conn:
+            result = await conn.execute(
+                sa.select(table.c.id, table.c.created_at)
+                .where(table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(batch_size),
+            )
+            rows = result.all()
+            expired = [row_id for row_id, created_at in rows if created_at < cutoff]
+            if expired:
+                await conn.execute(sa.delete(table).where(table.c.id.in_(expired)))
+        deleted += len(expired)
+        if len(rows) < batch_size or len(expired) < len(rows):
+            return deleted
+        last_id = rows[-1].id
+        # Let ingestion interleave with the next batch
+        await asyncio.sleep(0)
+
+
+async def _delete_stale_ips(engine: AsyncEngine, cutoff: datetime, batch_size: int) -> int:
+    """Delete the IPs last seen before ``cutoff``, ``batch_size`` at a time, oldest first."""
+    table = _IP
+    deleted = 0
+    while True:
+        async with engine.begin() as conn:
+            result = await conn.execute(
+                sa.select(table.c.id)
+                .where(table.c.last_seen < cutoff)
+                .order_by(table.c.last_seen)
+                .limit(batch_size),
+            )
+            stale = list(result.scalars())
+            if stale:
+                await conn.execute(sa.delete(table).where(table.c.id.in_(stale)))
+        deleted += len(stale)
+        if len(stale) < batch_size:
+            return deleted
+        await asyncio.sleep(0)
+
+
+async def apply_retention(
+    sql_engine: SqlEngine,
+    max_age: timedelta | None,
+    *,
+    batch_size: int = DEFAULT_RETENTION_BATCH_SIZE,
+) -> None:
+    """Create the upcoming partitions of ban_event, then remove raw data older than ``max_age``.
+
+    On a partitioned PostgreSQL table, expired months are dropped whole, so
+    events are kept until the end of the month ``max_age`` falls in.
+    Elsewhere they are deleted in small batches, as are the IPs not seen
+    for ``max_age``. The hourly rollups are kept. Without ``max_age``
+    nothing is removed.
+
+    Parameters
+    ----------
+    sql_engine : SqlEngine
+        The engine of the database to clean up.
+    max_age : timedelta | None
+        How long raw ban events and IPs are kept.
+    batch_size : int
+        The rows deleted per transaction.
+
+    """
+    engine = sql_engine.engine
+    async with engine.begin() as conn:
+        if not await conn.run_sync(lambda sync: sa.inspect(sync).has_table("ban_event")):
+            # Nothing was ever ingested
+            return
+        partitioned = await conn.run_sync(is_partitioned)
+        now = await conn.run_sync(database_now)
+        if partitioned:
+            await conn.run_sync(create_partitions, now)
+    if max_age is None:
+        return
+
+    cutoff = now - max_age
+    if partitioned:
+        async with engine.begin() as conn:
+            await conn.run_sync(_drop_expired_partitions, cutoff)
+        events = 0
+    else:
+        events = await _delete_expired_events(engine, cutoff, batch_size)
+    ips = await _delete_stale_ips(engine, cutoff, batch_size)
+    logger.info("Retention removed %d ban events and %d IPs older than %s", events, ips, cutoff)
@@ -0,0 +1,136 @@
+import functools
+import logging
+from collections import Counter
+from collections.abc import Iterable, Mapping
+from datetime import datetime
+from typing import Any
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.orm import Mapped, mapped_column
+
+from fail2banmonitoring.db.bulk import build_upsert, insert_rows
+from fail2banmonitoring.fail2ban.events import BanEvent
+from fail2banmonitoring.models.base import _Base
+from fail2banmonitoring.services.ip import IPMetadata
+from fail2banmonitoring.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Dimensions bans are counted by, in the order of the facts given to count()
+DIMENSIONS = ("jail", "country", "city", "isp", "as")
+# Value counted for IPs without the dimension, e.g. not enriched
+UNKNOWN = "Unknown"
+# Columns of the row tuples built by BanRollupModel.count, in order
+COLUMNS = ("bucket", "dimension", "value", "bans")
+
+# A ban as counted by the rollups: its timestamp followed by its value for each dimension
+Fact = tuple[datetime | None, str | None, str | None, str | None, str | None, str | None]
+
+
+class BanRollupModel(_Base):
+    """Bans per hour for each value of each dimension, e.g. per country.
+
+    Rows are kept up to date by additive upserts along with the ban events,
+    so dashboards sum a few rows per hour instead of scanning ``ban_event``
+    and ``ip``. Bans without a timestamp are not counted.
+
+    Attributes
+    ----------
+    bucket : datetime
+        The start of the hour the bans happened in.
+    dimension : str
+        What the bans are counted by: ``jail``, ``country``, ``city``, ``isp`` or ``as``.
+    value : str
+        The jail, country, city, ISP or AS, ``Unknown`` when the IP has none.
+    bans : int
+        The number of Ban and Restore Ban events.
+
+    Methods
+    -------
+    add(conn: AsyncConnection, events: List[BanEvent], metadata: Mapping[str, IPMetadata]) -> None
+        Add the bans of the events to the rollups.
+
+    """
+
+    __tablename__ = "ban_rollup"
+    bucket: Mapped[datetime] = mapped_column(sa.DateTime, primary_key=True)
+    dimension: Mapped[str] = mapped_column(sa.String(16), primary_key=True)
+    value: Mapped[str] = mapped_column(sa.String(100), primary_key=True)
+    bans: Mapped[int] = mapped_column(sa.Integer)
+
+    @staticmethod
+    def count(facts: Iterable[Fact]) -> list[tuple[Any, ...]]:
+        """Return the rollup rows of ``facts``, tuples of ``COLUMNS`` values."""
+        counts: Counter[tuple[datetime, str, str]] = Counter()
+        for timestamp, *values in facts:
+            if timestamp is None:
+                continue
+            bucket = timestamp.replace(minute=0, second=0, microsecond=0)
+            for dimension, value in zip(DIMENSIONS, values, strict=True):
+                counts[bucket, dimension, value or UNKNOWN] += 1
+        return [(*key, bans) for key, bans in counts.items()]
+
+    @staticmethod
+    def facts(events: Iterable[BanEvent], metadata: Mapping[str, IPMetadata]) -> Iterable[Fact]:
+        """Yield the facts of the ban events, their IPs being looked up in ``metadata``."""
+        empty = IPMetadata(status="fail", query="")
+        for event in events:
+            if not event.is_ban:
+                continue
+            record = metadata.get(event.ip, empty)
+            yield (
+                event.timestamp,
+                event.jail,
+                record.country,
+                record.city,
+                record.isp,
+                record.as_value,
+            )
+
+    @staticmethod
+    @functools.cache
+    def upsert_statement(dialect: str) -> sa.Insert:
+        """Return the insert statement adding bans to existing rollup rows for ``dialect``."""
+        table = BanRollupModel.metadata.tables[BanRollupModel.__tablename__]
+        return build_upsert(
+            dialect,
+            table,
+            ["bucket", "dimension", "value"],
+            lambda new: {"bans": table.c.bans + new.bans},
+        )
+
+    @staticmethod
+    async def add(
+        conn: AsyncConnection,
+        events: list[BanEvent],
+        metadata: Mapping[str, IPMetadata],
+        *,
+        batch_size: int,
+    ) -> None:
+        """Add the bans of ``events`` to the rollups, in the transaction of ``conn``.
+
+        Parameters
+        ----------
+        conn : AsyncConnection
+            The connection the ban events are inserted with.
+        events : List[BanEvent]
+            The events being inserted.
+        metadata : Mapping[str, IPMetadata]
+            The metadata of the IPs of the events; missing ones count as ``Unknown``.
+        batch_size : int
+            The rows sent per statement, see insert_rows.
+
+        """
+        rows = BanRollupModel.count(BanRollupModel.facts(events, metadata))
+        if not rows:
+            return
+        await insert_rows(
+            conn,
+            BanRollupModel.upsert_statement(conn.dialect.name),
+            COLUMNS,
+            rows,
+            batch_size=batch_size,
+        )
+        metrics.DB_ROWS_WRITTEN.inc(len(rows), BanRollupModel.__tablename__)
+        logger.debug("Added %d ban events to %d rollup rows", len(events), len(rows))
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from sqlalchemy.exc import DBAPIError, OperationalError, SQLAlchemyError
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+from fail2banmonitoring.db.config import SqlEngine
+from fail2banmonitoring.fail2ban.addresses import IPSet
+from fail2banmonitoring.fail2ban.events import BanEvent
+from fail2banmonitoring.fail2ban.sources import LogReader
+from fail2banmonitoring.models.ban_event import BanEventModel
+from fail2banmonitoring.models.ip import IpModel
+from fail2banmonitoring.services.providers import EnrichmentProvider
+from fail2banmonitoring.subnets import SubnetIndex
+from fail2banmonitoring.utils import metrics
+
+if TYPE_CHECKING:
+    from fail2banmonitoring.services.ip import IPMetadata
+
+logger = logging.getLogger(__name__)
+
+# Events handed from one stage to the next at once, at least: batches end with a log block
+DEFAULT_BATCH_SIZE = 5_000
+# Batches waiting between two stages before the upstream one is paused
+DEFAULT_QUEUE_SIZE = 4
+# New IPs looked up at once when batches queue up before enrichment
+DEFAULT_ENRICH_BATCH_SIZE = 1_000
+
+
+@dataclass
+class PipelineStats:
+    """Counters of an IngestPipeline run."""
+
+    events: int = 0
+    batches: int = 0
+    lookups: int = 0
+    enriched: int = 0
+    writes: int = 0
+
+
+class IngestPipeline:
+    """Parse, enrich and write stages running concurrently over bounded queues.
+
+    The parser streams event batches of at least ``batch_size``, each made of
+    whole log blocks, into a queue feeding
+    the enrichment stage, which looks up the IPs not seen yet in this run and
+    passes events and records on to the writer. Each queue holds at most
+    ``queue_size`` batches, so a slow database or API pauses the stages before
+    it instead of piling events up in memory, and network and database time
+    overlap instead of adding up. With a ``subnets`` index, the writer also
+    adds the bans of each batch to it.
+
+    Each batch goes along with the number of log blocks it completes, and
+    once it is stored the checkpoint is committed up to them, so a run that
+    fails resumes after the last batch stored.
+    """
+
+    def __init__(
+        self,
+        parser: LogReader,
+        chain: EnrichmentProvider,
+        sql_engine: SqlEngine,
+        *,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        enrich_batch_size: int = DEFAULT_ENRICH_BATCH_SIZE,
+        subnets: SubnetIndex | None = None,
+    ) -> None:
+        """Link ``parser`` to ``chain`` and ``sql_engine``."""
+        self.parser = parser
+        self.chain = chain
+        self.sql_engine = sql_engine
+        self.batch_size = batch_size
+        self.enrich_batch_size = enrich_batch_size
+        self.subnets = subnets
+        self.stats = PipelineStats()
+        # IPs to enrich again on the next run, see Fail2BanLogParser.commit_checkpoint
+        self.failed_ips: list[str] = []
+        # Batches, with the number of log blocks read by the end of each
+        self._parsed: asyncio.Queue[tuple[list[BanEvent], int] | None] = asyncio.Queue(queue_size)
+        self._enriched: asyncio.Queue[tuple[list[BanEvent], list[IPMetadata], int] | None] = (
+            asyncio.Queue(queue_size)
+        )
+        # Packed, since a run may see millions of distinct IPs
+        self._seen_ips = IPSet()
+        self._banned_ips = IPSet()
+        # Metadata of the IPs enriched in this run, by IP, for the rollups of later batches
+        self._metadata: dict[str, IPMetadata] = {}
+
+    async def _parse(self) -> None:
+        """Stream the new events of the log in batches of at least ``batch_size``."""
+        batch: list[BanEvent] = []
+        blocks = 0
+        async for events in self.parser.iter_event_blocks():
+            batch.extend(events)
+            blocks += 1
+            # Blocks are not split, the checkpoint can only be committed past a whole one
+            if len(batch) >= self.batch_size:
+                await self._put_parsed(batch, blocks)
+                batch = []
+        if batch:
+            await self._put_parsed(batch, blocks)
+        await self._parsed.put(None)
+
+    async def _put_parsed(self, batch: list[BanEvent], blocks: int) -> None:
+        self.stats.events += len(batch)
+        self.stats.batches += 1
+        await self._parsed.put((batch, blocks))
+
+    async def _enrich(self) -> None:
+        """Look up the IPs banned for the first time in this run, batch after batch."""
+        # IPs that failed on the previous run are looked up with the first batch
+        retry_ips = await asyncio.to_thread(self.parser.retry_ips)
+        blocks = 0
+        done = False
+        while not done:
+            item = await self._parsed.get()
+            if item is None:
+                break
+            events, blocks = item
+            # Batches already waiting are merged, for fewer and fuller lookups
+            ips = self._new_ips(events, retry_ips)
+            retry_ips = []
+            while len(ips) < self.enrich_batch_size and not self._parsed.empty():
+                next_item = self._parsed.get_nowait()
+                if next_item is None:
+                    done = True
+                    break
+                more, blocks = next_item
+                events = events + more
+                ips.extend(self._new_ips(more, []))
+            records: list[IPMetadata] = []
+            if ips:
+                result = await self.chain.lookup(ips)
+                records = result.records
+                self.failed_ips.extend(result.failed_ips)
+                self.stats.lookups += 1
+                self.stats.enriched += len(records)
+            await self._enriched.put((events, records, blocks))
+        if retry_ips:
+            result = await self.chain.lookup(retry_ips)
+            self.failed_ips.extend(result.failed_ips)
+            await self._enriched.put(([], result.records, blocks))
+        await self._enriched.put(None)
+
+    def _new_ips(self, events: list[BanEvent], extra: list[str]) -> list[str]:
+        """Return the banned IPs of ``events`` and ``extra`` not seen yet in this run."""
+        banned = [event.ip for event in events if event.is_ban]
+        self._banned_ips.update(banned)
+        return [ip for ip in banned + extra if self._seen_ips.add(ip)]
+
+    async def _write(self, *, create_tables: bool) -> None:
+        """Store the records and events of each batch, then commit the checkpoint past them."""
+        while (item := await self._enriched.get()) is not None:
+            events, records, blocks = item
+            if create_tables:
+                await IpModel.create_table(self.sql_engine)
+                create_tables = False
+            self._metadata.update((record.query, record) for record in records)
+            await self._store(events, records)
+            # IPs failing in batches enriched ahead are kept too, and simply retried
+            await asyncio.to_thread(
+                self.parser.commit_checkpoint,
+                list(self.failed_ips),
+                blocks=blocks,
+            )
+            # Only once the batch can no longer be ingested again, a failure losing it from the index
+            if self.subnets is not None:
+                await asyncio.to_thread(self.subnets.add, events, self._metadata)
+            self.stats.writes += 1
+
+    @retry(
+        reraise=True,
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(
+            multiplier=1,
+            min=2,
+            max=10,
+        ),
+        retry=retry_if_exception_type((OperationalError, DBAPIError)),
+    )
+    async def _store(self, events: list[BanEvent], records: list["IPMetadata"]) -> None:
+        """Store the records and events of a batch, with their rollups, in a single transaction."""
+        # The host of the last ban of each IP in the batch, and its bans, enriched in this batch or not
+        hosts = {event.ip: event.host for event in events if event.is_ban}
+        hits = Counter(event.ip for event in events if event.is_ban)
+        batch_size = self.sql_engine.write_batch_size
+        try:
+            async with self.sql_engine.engine.begin() as conn:
+                await IpModel.write(conn, records, hosts=hosts, hits=hits, batch_size=batch_size)
+                await BanEventModel.write(conn, events, metadata=self._metadata, batch_size=batch_size)
+        except SQLAlchemyError:
+            logger.exception("Database error while storing a batch")
+            raise
+
+    async def run(self, *, create_tables: bool = True) -> PipelineStats:
+        """Ingest what was added to the log since the last checkpoint, then commit it.
+
+        If a stage fails the others are cancelled and the checkpoint is left
+        after the last batch stored, so that the next run ingests the lines
+        of the other batches again. A batch is stored in one transaction and
+        the checkpoint committed past it right after.
+        """
+        try:
+            async with asyncio.TaskGroup() as stages:
+                stages.create_task(self._parse())
+                stages.create_task(self._enrich())
+                stages.create_task(self._write(create_tables=create_tables))
+        except Exception:
+            metrics.INGEST_RUNS.inc(1, "failure")
+            raise
+        if not self._seen_ips:
+            logger.info("No Ips to fetch")
+        await asyncio.to_thread(self.parser.report, self._banned_ips)
+        # Failed lookups are retried on the next run instead of failing this one
+        await asyncio.to_thread(self.parser.commit_checkpoint, self.failed_ips)
+        metrics.INGEST_RUNS.inc(1, "success")
+        metrics.INGEST_LAST_SUCCESS.set(time.time())
+        logger.info(
+            "Ingested %d events in %d batches, enriched %d IPs in %d lookups",
+            self.stats.events,
+            self.stats.batches,
+            self.stats.enriched,
+            self.stats.lookups,
+        )
+        return self.stats
@@ -0,0 +1,186 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+from fail2banmonitoring.services.ip import IPMetadata
+from fail2banmonitoring.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Geolocation of an IP rarely changes, a month keeps ip-api traffic minimal
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 1_000_000
+DEFAULT_HOT_SIZE = 10_000
+
+
+@dataclass
+class CacheStats:
+    """Counters of an IPMetadataCache since it was opened."""
+
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        """Return the share of lookups answered from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class IPMetadataCache:
+    """Persistent cache of IPMetadata records, keyed by IP.
+
+    Records live in a local SQLite file and expire after ``ttl`` seconds. The
+    file keeps at most ``max_entries`` records, evicting the least recently
+    used ones, and the ``hot_size`` most recently used records are also kept
+    in memory. Methods are blocking; call them through ``asyncio.to_thread``.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        hot_size: int = DEFAULT_HOT_SIZE,
+    ) -> None:
+        """Open or create the cache file at ``path``."""
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hot_size = hot_size
+        self.stats = CacheStats()
+        self._hot: OrderedDict[str, IPMetadata] = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS ip_metadata ("
+                "ip TEXT PRIMARY KEY, payload TEXT NOT NULL, "
+                "fetched_at REAL NOT NULL, last_used REAL NOT NULL)",
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_ip_metadata_last_used "
+                "ON ip_metadata (last_used)",
+            )
+        # Kept up to date by put_many, so that it never counts the whole file again
+        (self._count,) = self._connection.execute("SELECT COUNT(*) FROM ip_metadata").fetchone()
+
+    def _fresh(self, fetched_at: datetime) -> bool:
+        return time.time() - fetched_at.timestamp() < self.ttl
+
+    def _remember(self, record: IPMetadata) -> None:
+        """Put a record at the most recently used end of the hot layer."""
+        self._hot[record.query] = record
+        self._hot.move_to_end(record.query)
+        while len(self._hot) > self.hot_size:
+            self._hot.popitem(last=False)
+
+    def _known(self, ips: list[str]) -> set[str]:
+        """Return which of ``ips`` have a row in the cache file, fresh or not."""
+        known: set[str] = set()
+        for start in range(0, len(ips), 500):
+            chunk = ips[start : start + 500]
+            known.update(
+                ip
+                for (ip,) in self._connection.execute(
+                    "SELECT ip FROM ip_metadata "  # noqa: S608
+                    f"WHERE ip IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+            )
+        return known
+
+    def get_many(self, ips: list[str]) -> dict[str, IPMetadata]:
+        """Return the fresh cached records among ``ips``."""
+        found: dict[str, IPMetadata] = {}
+        with self._lock:
+            cold = []
+            for ip in ips:
+                record = self._hot.get(ip)
+                if record is not None and self._fresh(record.fetched_at):
+                    self._hot.move_to_end(ip)
+                    found[ip] = record
+                else:
+                    cold.append(ip)
+            for start in range(0, len(cold), 500):
+                chunk = cold[start : start + 500]
+                rows = self._connection.execute(
+                    "SELECT ip, payload FROM ip_metadata "  # noqa: S608
+                    f"WHERE ip IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for ip, payload in rows:
+                    record = IPMetadata.model_validate_json(payload)
+                    if self._fresh(record.fetched_at):
+                        found[ip] = record
+                        self._remember(record)
+                    else:
+                        self.stats.expired += 1
+            now = time.time()
+            with self._connection:
+                self._connection.executemany(
+                    "UPDATE ip_metadata SET last_used = ? WHERE ip = ?",
+                    [(now, ip) for ip in found],
+                )
+            self.stats.hits += len(found)
+            self.stats.misses += len(ips) - len(found)
+        metrics.CACHE_HITS.inc(len(found))
+        metrics.CACHE_MISSES.inc(len(ips) - len(found))
+        return found
+
+    def put_many(self, records: list[IPMetadata]) -> None:
+        """Store freshly fetched records, then evict the least recently used ones over the limit."""
+        # Records built from a validation failure say nothing about the IP
+        cacheable = [
+            record
+            for record in records
+            if not (record.message or "").startswith("Validation error")
+        ]
+        if not cacheable:
+            return
+        now = time.time()
+        with self._lock:
+            with self._connection:
+                queries = list(dict.fromkeys(record.query for record in cacheable))
+                self._count += len(queries) - len(self._known(queries))
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO ip_metadata "
+                    "(ip, payload, fetched_at, last_used) VALUES (?, ?, ?, ?)",
+                    [
+                        (
+                            record.query,
+                            record.model_dump_json(by_alias=True),
+                            record.fetched_at.timestamp(),
+                            now,
+                        )
+                        for record in cacheable
+                    ],
+                )
+                if self._count > self.max_entries:
+                    evicted = self._connection.execute(
+                        "DELETE FROM ip_metadata WHERE ip IN ("
+                        "SELECT ip FROM ip_metadata ORDER BY last_used LIMIT ?)",
+                        (self._count - self.max_entries,),
+                    ).rowcount
+                    self._count -= evicted
+                    self.stats.evictions += evicted
+            for record in cacheable:
+                self._remember(record)
+
+    def close(self) -> None:
+        """Close the cache file."""
+        with self._lock:
+            self._connection.close()
+        logger.info(
+            "Enrichment cache: %d hits, %d misses, %d expired, %d evicted (%.0f%% hit ratio)",
+            self.stats.hits,
+            self.stats.misses,
+            self.stats.expired,
+            self.stats.evictions,
+            self.stats.hit_ratio * 100,
+        )
@@ -1,14 +1,51 @@
+import asyncio
 import json
 import logging
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from typing import Any, ClassVar, Literal
+from itertools import batched
+from typing import TYPE_CHECKING, Any, ClassVar, Literal, NamedTuple
 
 import aiohttp
 from pydantic import BaseModel, Field, ValidationError, field_validator
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+from fail2banmonitoring.services.rate_limit import RateLimiter
+from fail2banmonitoring.utils import metrics
+
+if TYPE_CHECKING:
+    from fail2banmonitoring.services.cache import IPMetadataCache
 
 logger = logging.getLogger(__name__)
 
+# Batch requests in flight at once on the shared session
+DEFAULT_CONCURRENCY = 4
+# Requests sent for a chunk before its IPs are reported as failed
+CHUNK_ATTEMPTS = 4
+# Multiplier and cap, in seconds, of the jittered exponential backoff between them
+RETRY_BACKOFF = (1.0, 30.0)
+# Seconds without an answer before a tail chunk is sent a second time
+DEFAULT_HEDGE_AFTER = 5.0
+
+
+class RetryableResponseError(ValueError):
+    """Raised for API responses worth retrying: rate limited or server errors."""
+
+
+class FailedLookup(NamedTuple):
+    """An IP whose metadata could not be fetched, to retry on a later run."""
+
+    ip: str
+    error: str
+
 
 class _IPAPIRules(Enum):
     # Unfortunately these endpoints are not HTTPS
@@ -21,6 +58,9 @@ class IPMetadata(BaseModel):
 
     # Class variable to store the API URL
     API_URL: ClassVar[str] = "http://ip-api.com/batch"
+    # The batch endpoint takes at most 100 IPs and 15 requests per minute
+    BATCH_SIZE: ClassVar[int] = 100
+    RATE_LIMIT: ClassVar[tuple[int, float]] = (15, 60.0)
 
     status: Literal["success", "fail"]
     query: str
@@ -55,12 +95,14 @@ async def get_ip_metadata(
         cls,
         ip: str,
         session: aiohttp.ClientSession,
+        cache: "IPMetadataCache | None" = None,
     ) -> "IPMetadata":
         """Get metadata for a single IP address.
 
         Args:
             ip: IP address to get metadata for
             session: aiohttp client session
+            cache: optional local cache consulted before the API
 
         Returns:
             IPMetadata object with IP information
@@ -71,10 +113,12 @@ async def get_ip_metadata(
 
         """
         try:
-            batch_result = await cls.get_ips_metadata_batch([ip], session)
-            if batch_result and len(batch_result) > 0:
-                return batch_result[0]
+            batch_result = await cls.get_ips_metadata_batch([ip], session, cache)
+            if batch_result.records:
+                return batch_result.records[0]
             msg = f"Failed to get metadata for IP {ip}"
+            if batch_result.failed:
+                msg = f"{msg}: {batch_result.failed[0].error}"
             logger.error(msg)
             raise ValueError(msg)  # noqa: TRY301
         except Exception as e:
@@ -86,88 +130,297 @@ async def get_ips_metadata_batch(
         cls,
         ips: list[str],
         session: aiohttp.ClientSession,
-    ) -> list["IPMetadata"]:
+        cache: "IPMetadataCache | None" = None,
+        *,
+        limiter: RateLimiter | None = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        hedge_after: float | None = DEFAULT_HEDGE_AFTER,
+        url: str | None = None,
+    ) -> "BatchResult":
         """Get metadata for a batch of IP addresses.
 
+        With a cache, fresh cached records are returned straight away and only
+        the misses and expired entries are fetched, then cached. Fetches are
+        split into ``BATCH_SIZE`` chunks, ``concurrency`` of them in flight,
+        paced by ``limiter`` which follows the API's rate limit headers.
+
+        Each chunk is retried on its own with jittered exponential backoff, and
+        once no chunk is left waiting, a chunk still unanswered after
+        ``hedge_after`` seconds is sent a second time. A chunk that keeps
+        failing is reported in the result instead of failing the whole batch.
+
         Args:
             ips: List of IP addresses to get metadata for
             session: aiohttp client session
+            cache: optional local cache consulted before the API
+            limiter: rate limiter shared across calls, a fresh one by default
+            concurrency: maximum number of requests in flight
+            hedge_after: seconds before a slow tail chunk is sent again, None to never hedge
+            url: batch endpoint to query, ``API_URL`` by default
 
         Returns:
-            List of IPMetadata objects with IP information
-
-        Raises:
-            ValueError: If the API request fails or returns invalid data
-            aiohttp.ClientError: If there's an issue with the HTTP request
-            TimeoutError: If the API request times out
+            BatchResult with the IPMetadata records in the order of ``ips`` and
+            the IPs whose lookup failed
 
         """
         if not ips:
             logger.warning("No IPs provided to get metadata for")
-            return []
+            return BatchResult([])
+        url = url or cls.API_URL
+        if cache is None:
+            return await cls._fetch_batch(
+                ips,
+                session,
+                url,
+                limiter=limiter,
+                concurrency=concurrency,
+                hedge_after=hedge_after,
+            )
 
-        try:
-            logger.info("Fetching metadata for %d IPs", len(ips))
+        cached = await asyncio.to_thread(cache.get_many, ips)
+        missing = [ip for ip in ips if ip not in cached]
+        logger.info("%d of %d IPs found in the enrichment cache", len(cached), len(ips))
+        failed: list[FailedLookup] = []
+        if missing:
+            fetched = await cls._fetch_batch(
+                missing,
+                session,
+                url,
+                limiter=limiter,
+                concurrency=concurrency,
+                hedge_after=hedge_after,
+            )
+            await asyncio.to_thread(cache.put_many, fetched.records)
+            cached.update((record.query, record) for record in fetched.records)
+            failed = fetched.failed
+        return BatchResult([cached[ip] for ip in ips if ip in cached], failed)
 
-            data = [{"query": ip} for ip in ips]
+    @classmethod
+    async def _fetch_batch(
+        cls,
+        ips: list[str],
+        session: aiohttp.ClientSession,
+        url: str,
+        *,
+        limiter: RateLimiter | None = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        hedge_after: float | None = DEFAULT_HEDGE_AFTER,
+    ) -> "BatchResult":
+        """Fetch metadata for any number of IPs in API-sized chunks.
 
-            try:
-                async with session.post(
-                    cls.API_URL,
-                    json=data,
-                    timeout=aiohttp.ClientTimeout(total=30),
-                    headers={"Content-Type": "application/json"},
-                ) as response:
-                    if response.status != 200:
-                        text = await response.text()
-                        msg = (
-                            f"API request failed with status {response.status}: {text}"
-                        )
-                        logger.error(msg)
-                        raise ValueError(msg)
-                    try:
-                        batch_json = await response.json()
-                    except json.JSONDecodeError as e:
-                        text = await response.text()
-                        logger.exception("Invalid JSON response: %s...", text[:200])
-                        msg = f"Invalid JSON response from API: {e}"
-                        raise ValueError(msg) from e
-
-                    logger.debug("API response: %s...", json.dumps(batch_json)[:500])
-            except TimeoutError as e:
-                logger.exception("API request timed out after 30 seconds: %s")
-                msg = f"API request timed out: {e}"
-                raise TimeoutError(msg) from e
-            except aiohttp.ClientError as e:
-                logger.exception("HTTP request error: %s")
-                raise
-
-            # Create models from response
-            result = []
-            for item in batch_json:
+        Chunks of ``BATCH_SIZE`` IPs are sent at most ``concurrency`` at a
+        time, each one waiting for ``limiter``; results keep the order of ``ips``.
+        """
+        limiter = limiter or RateLimiter(*cls.RATE_LIMIT)
+        semaphore = asyncio.Semaphore(concurrency)
+        chunks = list(batched(ips, cls.BATCH_SIZE))
+        queued = len(chunks)
+        logger.info("Fetching metadata for %d IPs in %d requests", len(ips), len(chunks))
+
+        async def fetch(chunk: tuple[str, ...]) -> BatchResult:
+            nonlocal queued
+            async with semaphore:
+                queued -= 1
                 try:
-                    if "as" in item:
-                        item["as_value"] = item.pop("as")
-
-                    result.append(cls(**item))
-                except ValidationError as e:
-                    logger.exception("Validation error for item %r: ", item)
-                    result.append(
-                        cls(
-                            status="fail",
-                            query=item.get("query", "unknown"),
-                            message=f"Validation error: {e}",
-                        ),
+                    records = await cls._fetch_chunk(
+                        list(chunk),
+                        session,
+                        url,
+                        limiter,
+                        hedge_after=hedge_after,
+                        is_tail=lambda: queued == 0,
                     )
-            return result  # noqa: TRY300
-        except (aiohttp.ClientError, ValueError, TimeoutError) as e:
-            # Let these specific exceptions propagate with their original type
-            raise
-        except Exception as e:
-            logger.exception("Unexpected error in batch IP metadata request: %s")
-            msg = f"Failed to fetch IP metadata: {e}"
+                except (aiohttp.ClientError, ValueError, TimeoutError) as e:
+                    logger.warning(
+                        "Giving up on %d IPs after %d attempts: %r",
+                        len(chunk),
+                        CHUNK_ATTEMPTS,
+                        e,
+                    )
+                    return BatchResult([], [FailedLookup(ip, repr(e)) for ip in chunk])
+                return BatchResult(records)
+
+        results = await asyncio.gather(*(fetch(chunk) for chunk in chunks))
+        if limiter.waited:
+            logger.info("Waited %.1fs for the API rate limit", limiter.waited)
+        batch = BatchResult(
+            [record for result in results for record in result.records],
+            [lookup for result in results for lookup in result.failed],
+        )
+        if batch.failed:
+            logger.warning("Metadata lookup failed for %d IPs", len(batch.failed))
+        return batch
+
+    @classmethod
+    async def _fetch_chunk(
+        cls,
+        ips: list[str],
+        session: aiohttp.ClientSession,
+        url: str,
+        limiter: RateLimiter,
+        *,
+        hedge_after: float | None,
+        is_tail: Callable[[], bool],
+    ) -> list["IPMetadata"]:
+        """Fetch metadata for at most ``BATCH_SIZE`` IPs, retrying transient failures.
+
+        Raises:
+            ValueError: If the API keeps failing or returns invalid data
+            aiohttp.ClientError: If the HTTP request keeps failing
+            TimeoutError: If the API request keeps timing out
+
+        """
+        multiplier, maximum = RETRY_BACKOFF
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(CHUNK_ATTEMPTS),
+            # Full jitter keeps retrying clients from hitting the API in step
+            wait=wait_random_exponential(multiplier=multiplier, max=maximum),
+            retry=retry_if_exception_type(
+                (aiohttp.ClientError, TimeoutError, RetryableResponseError),
+            ),
+            before_sleep=lambda state: logger.warning(
+                "Request for %d IPs failed (attempt %d): %r, retrying",
+                len(ips),
+                state.attempt_number,
+                state.outcome.exception() if state.outcome else None,
+            ),
+            reraise=True,
+        )
+        async for attempt in retrying:
+            with attempt:
+                batch_json = await cls._hedged_request(
+                    ips,
+                    session,
+                    url,
+                    limiter,
+                    hedge_after=hedge_after,
+                    is_tail=is_tail,
+                )
+        return cls._parse_items(batch_json)
+
+    @classmethod
+    async def _hedged_request(
+        cls,
+        ips: list[str],
+        session: aiohttp.ClientSession,
+        url: str,
+        limiter: RateLimiter,
+        *,
+        hedge_after: float | None,
+        is_tail: Callable[[], bool],
+    ) -> list[dict[str, Any]]:
+        """Send one request for ``ips``, and a second one if it is a slow tail request.
+
+        The first of the two to succeed wins and the other one is cancelled.
+        """
+
+        async def send() -> list[dict[str, Any]]:
+            await limiter.acquire()
+            return await cls._post_chunk(ips, session, url, limiter)
+
+        await limiter.acquire()
+        tasks = [asyncio.create_task(cls._post_chunk(ips, session, url, limiter))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done and is_tail():
+                logger.info(
+                    "No answer for %d IPs after %.1fs, sending a hedged request",
+                    len(ips),
+                    hedge_after,
+                )
+                tasks.append(asyncio.create_task(send()))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            return await tasks[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @classmethod
+    async def _post_chunk(
+        cls,
+        ips: list[str],
+        session: aiohttp.ClientSession,
+        url: str,
+        limiter: RateLimiter,
+    ) -> list[dict[str, Any]]:
+        """Send a single API request for at most ``BATCH_SIZE`` IPs."""
+        data = [{"query": ip} for ip in ips]
+        start = time.perf_counter()
+        async with session.post(
+            url,
+            json=data,
+            timeout=aiohttp.ClientTimeout(total=30),
+            headers={"Content-Type": "application/json"},
+        ) as response:
+            metrics.ENRICHMENT_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                str(response.status),
+            )
+            limiter.update_from_headers(response.headers)
+            if response.status == 429 or response.status >= 500:
+                msg = f"API request failed with status {response.status}"
+                raise RetryableResponseError(msg)
+            return await cls._read_response(response)
+
+    @classmethod
+    def _parse_items(cls, batch_json: list[dict[str, Any]]) -> list["IPMetadata"]:
+        """Create models from an API response."""
+        result = []
+        for item in batch_json:
+            try:
+                # Validated by alias: "as" fills as_value
+                result.append(cls.model_validate(item))
+            except ValidationError as e:
+                logger.exception("Validation error for item %r: ", item)
+                result.append(
+                    cls(
+                        status="fail",
+                        query=item.get("query", "unknown"),
+                        message=f"Validation error: {e}",
+                    ),
+                )
+        return result
+
+    @staticmethod
+    async def _read_response(response: aiohttp.ClientResponse) -> list[dict[str, Any]]:
+        """Return the decoded JSON body of a successful API response."""
+        if response.status != 200:
+            text = await response.text()
+            msg = f"API request failed with status {response.status}: {text}"
+            logger.error(msg)
+            raise ValueError(msg)
+        try:
+            batch_json = await response.json()
+        except json.JSONDecodeError as e:
+            text = await response.text()
+            logger.exception("Invalid JSON response: %s...", text[:200])
+            msg = f"Invalid JSON response from API: {e}"
             raise ValueError(msg) from e
 
+        logger.debug("API response: %s...", json.dumps(batch_json)[:500])
+        return batch_json
+
     def to_dict(self) -> dict[str, Any]:
         """Convert the model to a dictionary."""
         return self.model_dump()
+
+
+@dataclass
+class BatchResult:
+    """Outcome of a batch lookup: the records fetched and the IPs that failed."""
+
+    records: list[IPMetadata]
+    failed: list[FailedLookup] = field(default_factory=list)
+
+    @property
+    def failed_ips(self) -> list[str]:
+        """Return the IPs whose lookup failed."""
+        return [lookup.ip for lookup in self.failed]
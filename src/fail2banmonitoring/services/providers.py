@@ -0,0 +1,227 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import Counter
+from itertools import batched
+from typing import ClassVar
+
+import aiohttp
+
+from fail2banmonitoring.services.cache import IPMetadataCache
+from fail2banmonitoring.services.geoip import NOT_FOUND_MESSAGE, GeoIPDatabase
+from fail2banmonitoring.services.ip import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_HEDGE_AFTER,
+    BatchResult,
+    FailedLookup,
+    IPMetadata,
+)
+from fail2banmonitoring.services.rate_limit import RateLimiter
+from fail2banmonitoring.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class EnrichmentProvider(ABC):
+    """A source of IP metadata answering lookups in batches.
+
+    Subclasses implement ``lookup_batch`` for at most ``batch_size`` IPs;
+    ``lookup`` splits any number of IPs into such batches, paced by
+    ``rate_limit`` requests per period when the provider has one.
+    """
+
+    name: ClassVar[str]
+    batch_size: int = 10_000
+    rate_limit: tuple[int, float] | None = None
+
+    def __init__(self) -> None:
+        """Initialize the rate limiter shared by all lookups of this provider."""
+        self.limiter = RateLimiter(*self.rate_limit) if self.rate_limit else None
+
+    async def lookup(self, ips: list[str]) -> BatchResult:
+        """Return the records of the ``ips`` this provider covers, in order."""
+        result = BatchResult([])
+        for chunk in batched(ips, self.batch_size):
+            if self.limiter is not None:
+                await self.limiter.acquire()
+            batch = await self.lookup_batch(list(chunk))
+            result.records.extend(batch.records)
+            result.failed.extend(batch.failed)
+        return result
+
+    @abstractmethod
+    async def lookup_batch(self, ips: list[str]) -> BatchResult:
+        """Return the records of the ``ips`` this provider covers.
+
+        IPs the provider knows nothing about are left out of the result, and
+        IPs it could not look up right now are reported as failed.
+        """
+
+    async def store(self, records: list[IPMetadata]) -> None:  # noqa: B027
+        """Remember records resolved by the providers after this one in a chain."""
+
+    async def close(self) -> None:  # noqa: B027
+        """Release the resources of the provider."""
+
+
+class GeoIPProvider(EnrichmentProvider):
+    """Lookups in local GeoIP databases, see GeoIPDatabase."""
+
+    name = "geoip"
+
+    def __init__(self, database: GeoIPDatabase) -> None:
+        """Use the already opened ``database``."""
+        super().__init__()
+        self.database = database
+
+    @classmethod
+    async def open(cls, paths: list[str]) -> "GeoIPProvider":
+        """Open the databases at ``paths`` without blocking the event loop."""
+        return cls(await asyncio.to_thread(GeoIPDatabase, paths))
+
+    async def lookup_batch(self, ips: list[str]) -> BatchResult:
+        """Return the records of the ``ips`` the databases cover."""
+        return await asyncio.to_thread(
+            self.database.lookup_many,
+            ips,
+            report_missing=False,
+        )
+
+    async def close(self) -> None:
+        """Release the databases."""
+        self.database.close()
+
+
+class CacheProvider(EnrichmentProvider):
+    """Lookups in the local enrichment cache, which keeps what later providers find."""
+
+    name = "cache"
+
+    def __init__(self, cache: IPMetadataCache) -> None:
+        """Use the already opened ``cache``."""
+        super().__init__()
+        self.cache = cache
+
+    async def lookup_batch(self, ips: list[str]) -> BatchResult:
+        """Return the fresh cached records of ``ips``."""
+        found = await asyncio.to_thread(self.cache.get_many, ips)
+        return BatchResult([found[ip] for ip in ips if ip in found])
+
+    async def store(self, records: list[IPMetadata]) -> None:
+        """Cache records resolved by the providers after this one."""
+        await asyncio.to_thread(self.cache.put_many, records)
+
+    async def close(self) -> None:
+        """Close the cache file."""
+        self.cache.close()
+
+
+class IPAPIProvider(EnrichmentProvider):
+    """Lookups on ip-api's batch endpoint, or on any server speaking its protocol."""
+
+    name = "ip-api"
+    batch_size = IPMetadata.BATCH_SIZE
+    rate_limit = IPMetadata.RATE_LIMIT
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        *,
+        url: str = IPMetadata.API_URL,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        hedge_after: float | None = DEFAULT_HEDGE_AFTER,
+    ) -> None:
+        """Send requests to ``url`` on ``session``, ``concurrency`` at a time."""
+        super().__init__()
+        self.session = session
+        self.url = url
+        self.concurrency = concurrency
+        self.hedge_after = hedge_after
+
+    async def lookup(self, ips: list[str]) -> BatchResult:
+        """Return the records of ``ips``, chunks being sent concurrently."""
+        return await IPMetadata.get_ips_metadata_batch(
+            ips,
+            self.session,
+            limiter=self.limiter,
+            concurrency=self.concurrency,
+            hedge_after=self.hedge_after,
+            url=self.url,
+        )
+
+    async def lookup_batch(self, ips: list[str]) -> BatchResult:
+        """Return the records of at most ``batch_size`` IPs."""
+        return await self.lookup(ips)
+
+
+class ProviderChain(EnrichmentProvider):
+    """Providers tried in order, each one only asked for the IPs still unresolved.
+
+    Records resolved by a provider are stored in the providers before it, so
+    that e.g. a cache placed before ip-api keeps what ip-api returns. IPs that
+    no provider covers get a ``fail`` record, while IPs that a provider failed
+    to look up and no later one resolved are reported as failed.
+    """
+
+    name = "chain"
+
+    def __init__(self, providers: list[EnrichmentProvider]) -> None:
+        """Chain ``providers``, the first one being asked first."""
+        super().__init__()
+        self.providers = providers
+        # IPs resolved by each provider since the chain was created
+        self.stats: Counter[str] = Counter()
+
+    async def lookup(self, ips: list[str]) -> BatchResult:
+        """Return the records of ``ips`` in order, from the first provider covering each one."""
+        found: dict[str, IPMetadata] = {}
+        errors: dict[str, FailedLookup] = {}
+        remaining = list(dict.fromkeys(ips))
+        for position, provider in enumerate(self.providers):
+            if not remaining:
+                break
+            try:
+                with metrics.ENRICHMENT_LOOKUP_SECONDS.time(provider.name):
+                    result = await provider.lookup(remaining)
+            except (aiohttp.ClientError, OSError, TimeoutError, ValueError) as e:
+                logger.exception("Enrichment provider %s failed", provider.name)
+                result = BatchResult([], [FailedLookup(ip, repr(e)) for ip in remaining])
+            for record in result.records:
+                found[record.query] = record
+            errors.update((lookup.ip, lookup) for lookup in result.failed)
+            self.stats[provider.name] += len(result.records)
+            metrics.ENRICHMENT_RESOLVED.inc(len(result.records), provider.name)
+            logger.info(
+                "%s resolved %d of %d IPs",
+                provider.name,
+                len(result.records),
+                len(remaining),
+            )
+            if result.records:
+                for previous in self.providers[:position]:
+                    await previous.store(result.records)
+            remaining = [ip for ip in remaining if ip not in found]
+
+        for ip in remaining:
+            if ip not in errors:
+                found[ip] = IPMetadata(status="fail", query=ip, message=NOT_FOUND_MESSAGE)
+        failed = [errors[ip] for ip in remaining if ip in errors]
+        metrics.ENRICHMENT_FAILED.inc(len(failed))
+        return BatchResult(
+            [found[ip] for ip in ips if ip in found],
+            failed,
+        )
+
+    async def lookup_batch(self, ips: list[str]) -> BatchResult:
+        """Return the records of ``ips``, see lookup."""
+        return await self.lookup(ips)
+
+    async def store(self, records: list[IPMetadata]) -> None:
+        """Store records in every provider of the chain."""
+        for provider in self.providers:
+            await provider.store(records)
+
+    async def close(self) -> None:
+        """Release every provider of the chain."""
+        for provider in self.providers:
+            await provider.close()
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import time
+from collections.abc import Mapping
+
+from fail2banmonitoring.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Token bucket for an API that reports its own window in response headers.
+
+    The bucket refills ``capacity`` tokens per ``period`` seconds. Each
+    response can then correct it with the requests the server says are left
+    and the seconds until its window resets, e.g. ip-api's ``X-Rl``/``X-Ttl``.
+    """
+
+    def __init__(self, capacity: int, period: float) -> None:
+        """Initialize a full bucket."""
+        self.capacity = capacity
+        self.period = period
+        # Total seconds callers spent waiting for a token
+        self.waited = 0.0
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(
+            self.capacity,
+            self._tokens + (now - self._updated) * self.capacity / self.period,
+        )
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent, then take a token for it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                delay = self._blocked_until - now
+                if self._blocked_until and delay <= 0:
+                    # The server's window has reset
+                    self._blocked_until = 0.0
+                    self._tokens = float(self.capacity)
+                if delay <= 0 and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                if delay <= 0:
+                    delay = (1 - self._tokens) * self.period / self.capacity
+                logger.debug("Rate limited, waiting %.2fs", delay)
+                self.waited += delay
+                metrics.RATE_LIMIT_WAIT_SECONDS.inc(delay)
+                await asyncio.sleep(delay)
+
+    def update(self, remaining: int | None, reset_after: float | None) -> None:
+        """Align the bucket with the limits reported by the server."""
+        now = time.monotonic()
+        self._refill(now)
+        if remaining is not None:
+            self._tokens = float(min(self.capacity, remaining))
+            if remaining <= 0 and reset_after is not None:
+                self._blocked_until = max(self._blocked_until, now + reset_after)
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """Align the bucket with ip-api style ``X-Rl``/``X-Ttl`` headers."""
+        remaining = headers.get("X-Rl")
+        reset_after = headers.get("X-Ttl")
+        self.update(
+            int(remaining) if remaining is not None and remaining.isdigit() else None,
+            float(reset_after) if reset_after is not None and reset_after.isdigit() else None,
+        )
@@ -0,0 +1,170 @@
+"""Local stand-in for ip-api, to measure enrichment throughput and fallbacks offline.
+
+Usage: python -m fail2banmonitoring.services.standin --port 8080 --latency 0.2 --error-rate 0.05
+"""
+
+import argparse
+import asyncio
+import hashlib
+import ipaddress
+import logging
+import math
+import random
+import time
+from types import TracebackType
+from typing import Any, Self
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+COUNTRIES = (
+    ("China", "CN", "Beijing"),
+    ("United States", "US", "Ashburn"),
+    ("Russia", "RU", "Moscow"),
+    ("Brazil", "BR", "Sao Paulo"),
+    ("Germany", "DE", "Frankfurt am Main"),
+    ("Netherlands", "NL", "Amsterdam"),
+    ("India", "IN", "Mumbai"),
+    ("Vietnam", "VN", "Hanoi"),
+)
+
+
+class IPAPIStandIn:
+    """aiohttp server answering like ip-api's batch endpoint.
+
+    Every IP resolves to made-up but stable metadata, and private or reserved
+    IPs fail like on ip-api. Responses are delayed by ``latency`` seconds plus
+    up to ``jitter``, carry the ``X-Rl``/``X-Ttl`` headers of a fixed window of
+    ``rate_limit`` requests per period, and get a 429 once it is exhausted.
+    A share ``error_rate`` of the requests fail with a 503.
+    """
+
+    def __init__(
+        self,
+        *,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        rate_limit: tuple[int, float] = (15, 60.0),
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        """Configure the simulated behaviour, ``seed`` making errors and jitter reproducible."""
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.random = random.Random(seed)  # noqa: S311
+        # Requests received, answered with a 429 and with a 503
+        self.requests = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.url = ""
+        self._window_start = 0.0
+        self._window_requests = 0
+        self._runner: web.AppRunner | None = None
+
+    def app(self) -> web.Application:
+        """Return the application serving ``POST /batch``."""
+        app = web.Application()
+        app.router.add_post("/batch", self._batch)
+        return app
+
+    @staticmethod
+    def record(ip: str) -> dict[str, Any]:
+        """Return the ip-api style record of ``ip``."""
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return {"status": "fail", "message": "invalid query", "query": ip}
+        if address.is_private or address.is_reserved or address.is_loopback:
+            return {"status": "fail", "message": "private range", "query": ip}
+        digest = int.from_bytes(hashlib.blake2b(ip.encode(), digest_size=4).digest())
+        country, country_code, city = COUNTRIES[digest % len(COUNTRIES)]
+        asn = 1000 + digest % 50_000
+        return {
+            "status": "success",
+            "country": country,
+            "countryCode": country_code,
+            "city": city,
+            "lat": round(digest % 18_000 / 100 - 90, 2),
+            "lon": round(digest % 36_000 / 100 - 180, 2),
+            "isp": f"ISP {asn}",
+            "org": f"Org {asn}",
+            "as": f"AS{asn} Org {asn}",
+            "query": ip,
+        }
+
+    def _take_request(self) -> tuple[int, int]:
+        """Count a request in the current window, return the requests left and seconds to reset."""
+        capacity, period = self.rate_limit
+        now = time.monotonic()
+        if now - self._window_start >= period:
+            self._window_start = now
+            self._window_requests = 0
+        self._window_requests += 1
+        reset_after = math.ceil(self._window_start + period - now)
+        return capacity - self._window_requests, reset_after
+
+    async def _batch(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        remaining, reset_after = self._take_request()
+        headers = {"X-Rl": str(max(remaining, 0)), "X-Ttl": str(reset_after)}
+        if remaining < 0:
+            self.rate_limited += 1
+            return web.Response(status=429, headers=headers)
+        await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+        if self.random.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=503, headers=headers)
+        queries = await request.json()
+        if len(queries) > 100:
+            return web.Response(status=422, text="too many queries", headers=headers)
+        return web.json_response(
+            [self.record(query["query"] if isinstance(query, dict) else query) for query in queries],
+            headers=headers,
+        )
+
+    async def __aenter__(self) -> Self:
+        """Start serving on a free local port, exposed as ``url``."""
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        _, port = self._runner.addresses[0][:2]
+        self.url = f"http://127.0.0.1:{port}/batch"
+        logger.info("ip-api stand-in listening on %s", self.url)
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Stop the server."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+def main() -> None:
+    """Serve the stand-in until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--requests-per-minute", type=int, default=15)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    standin = IPAPIStandIn(
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limit=(args.requests_per_minute, 60.0),
+        error_rate=args.error_rate,
+    )
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(standin.app(), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""Subnets and autonomous systems responsible for the most bans.
+
+Usage: python -m fail2banmonitoring.subnets [--path index.db] [--ipv4-prefixes 16 24]
+[--ipv6-prefixes 32 48 64] [--top 10] [--asns]
+
+SubnetIndex keeps the bans of every IP, with its AS, in a local SQLite file
+updated by each ingestion, see SUBNET_INDEX_PATH. Loading it builds one
+PrefixTrie per address family and the per-AS rollups in a single ordered
+scan, without reading the ``ip`` or ``ban_event`` tables.
+"""
+
+import argparse
+import heapq
+import ipaddress
+import logging
+import os
+import sqlite3
+import threading
+from collections import Counter
+from collections.abc import Iterable, Iterator, Mapping
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from fail2banmonitoring.fail2ban.addresses import IPV4_MAPPED_PREFIX, pack_ip
+from fail2banmonitoring.fail2ban.events import BanEvent
+
+if TYPE_CHECKING:
+    from fail2banmonitoring.services.ip import IPMetadata
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IPV4_PREFIXES = (16, 24)
+DEFAULT_IPV6_PREFIXES = (32, 48, 64)
+DEFAULT_TOP = 10
+# Prefix lengths of the subnets counted per AS
+AS_IPV4_PREFIX = 24
+AS_IPV6_PREFIX = 48
+# Value reported for IPs without an AS, as in ban_rollup
+UNKNOWN = "Unknown"
+
+
+@dataclass
+class Subnet:
+    """Bans of the IPs of a subnet."""
+
+    network: str
+    bans: int
+    ips: int
+
+
+@dataclass
+class AsRollup:
+    """Bans of the IPs of an autonomous system, and how many subnets they came from."""
+
+    name: str
+    bans: int = 0
+    ips: int = 0
+    subnets: int = 0
+
+
+class _Node:
+    """A prefix of ``length`` bits, with the bans and IPs below it."""
+
+    __slots__ = ("bans", "children", "ips", "length", "prefix")
+    # Left unset on addresses, which have none
+    children: "list[_Node]"
+
+    def __init__(
+        self,
+        prefix: int,
+        length: int,
+        bans: int = 0,
+        ips: int = 0,
+        children: "list[_Node] | None" = None,
+    ) -> None:
+        self.prefix = prefix
+        self.length = length
+        self.bans = bans
+        self.ips = ips
+        if children is not None:
+            self.children = children
+
+
+class PrefixTrie:
+    """Binary radix trie of the banned addresses of one family, with prefixes compressed.
+
+    A node only exists where two addresses part, so the trie holds fewer
+    than two nodes per address, and each node counts the bans and IPs below
+    it. Addresses are added in increasing order, which builds the trie in
+    linear time, and top() visits each node at most once.
+    """
+
+    def __init__(self, bits: int) -> None:
+        """Create an empty trie of ``bits`` bit addresses, 32 or 128."""
+        self.bits = bits
+        self._network = ipaddress.IPv4Network if bits == 32 else ipaddress.IPv6Network
+        self.root = _Node(0, 0, children=[])
+        # Path from the root to the last address, the only nodes still changing
+        self._stack = [self.root]
+        self._last: int | None = None
+
+    def append(self, address: int, bans: int) -> None:
+        """Add an address greater than all the previous ones, banned ``bans`` times.
+
+        Raises:
+            ValueError: If ``address`` is not greater than the previous one, or
+                the trie was already queried.
+
+        """
+        stack = self._stack
+        if not stack:
+            msg = "Addresses cannot be added to a trie once it was queried"
+            raise ValueError(msg)
+        if self._last is not None and address <= self._last:
+            msg = f"Addresses must be added in increasing order, got {address} after {self._last}"
+            raise ValueError(msg)
+        # Length of the prefix shared with the previous address
+        common = 0 if self._last is None else self.bits - (address ^ self._last).bit_length()
+        last = None
+        # Nodes deeper than the shared prefix are complete, their counts go up one level
+        while stack[-1].length > common:
+            last = stack.pop()
+            if stack[-1].length >= common:
+                stack[-1].bans += last.bans
+                stack[-1].ips += last.ips
+        if last is not None and stack[-1].length < common:
+            shift = self.bits - common
+            fork = _Node(address >> shift << shift, common, last.bans, last.ips, [last])
+            stack[-1].children[-1] = fork
+            stack.append(fork)
+        leaf = _Node(address, self.bits, bans, 1)
+        stack[-1].children.append(leaf)
+        stack.append(leaf)
+        self._last = address
+
+    def _close(self) -> None:
+        """Count the nodes still open into their parents, after which no address can be added."""
+        stack = self._stack
+        while len(stack) > 1:
+            node = stack.pop()
+            stack[-1].bans += node.bans
+            stack[-1].ips += node.ips
+        stack.clear()
+
+    def __len__(self) -> int:
+        """Return the number of addresses."""
+        self._close()
+        return self.root.ips
+
+    def top(self, prefix_length: int, n: int = DEFAULT_TOP) -> list[Subnet]:
+        """Return the ``n`` subnets of ``prefix_length`` bits with the most bans, most first.
+
+        Raises:
+            ValueError: If ``prefix_length`` does not fit the address family.
+
+        """
+        if not 0 <= prefix_length <= self.bits:
+            msg = f"Prefix length {prefix_length} is not between 0 and {self.bits}"
+            raise ValueError(msg)
+        self._close()
+        shift = self.bits - prefix_length
+        return [
+            Subnet(str(self._network((node.prefix >> shift << shift, prefix_length))), node.bans, node.ips)
+            for node in heapq.nlargest(
+                n,
+                self._covering(prefix_length),
+                key=lambda node: (node.bans, node.ips),
+            )
+        ]
+
+    def _covering(self, prefix_length: int) -> Iterator[_Node]:
+        """Yield the highest nodes at least ``prefix_length`` deep, one per banned subnet of that length."""
+        pending = [self.root]
+        while pending:
+            node = pending.pop()
+            if node.length >= prefix_length:
+                # Nothing forks between the parent and the node: the subnet is the node's
+                if node.ips:
+                    yield node
+            else:
+                pending.extend(node.children)
+
+
+class BanClusters:
+    """Subnets and autonomous systems of the banned IPs, as loaded from a SubnetIndex."""
+
+    def __init__(self) -> None:
+        """Start from no bans."""
+        self.ipv4 = PrefixTrie(32)
+        self.ipv6 = PrefixTrie(128)
+        self.asns: dict[str, AsRollup] = {}
+
+    @classmethod
+    def from_sorted(cls, rows: Iterable[tuple[bytes, int, str | None]]) -> "BanClusters":
+        """Build the tries and rollups from packed IPs, their bans and AS, in increasing IP order."""
+        clusters = cls()
+        # Per AS, the last subnet counted: IPs arrive in order, so those of a subnet are consecutive
+        last_subnets: dict[str, bytes] = {}
+        for packed, bans, asn in rows:
+            if packed[:12] == IPV4_MAPPED_PREFIX:
+                clusters.ipv4.append(int.from_bytes(packed[12:]), bans)
+                subnet = packed[: 12 + AS_IPV4_PREFIX // 8]
+            else:
+                clusters.ipv6.append(int.from_bytes(packed), bans)
+                subnet = packed[: AS_IPV6_PREFIX // 8]
+            name = asn or UNKNOWN
+            rollup = clusters.asns.get(name)
+            if rollup is None:
+                rollup = clusters.asns[name] = AsRollup(name)
+            rollup.bans += bans
+            rollup.ips += 1
+            if last_subnets.get(name) != subnet:
+                last_subnets[name] = subnet
+                rollup.subnets += 1
+        return clusters
+
+    def top_subnets(self, prefix_length: int, n: int = DEFAULT_TOP, *, ipv6: bool = False) -> list[Subnet]:
+        """Return the ``n`` IPv4, or IPv6, subnets of ``prefix_length`` with the most bans."""
+        return (self.ipv6 if ipv6 else self.ipv4).top(prefix_length, n)
+
+    def top_asns(self, n: int = DEFAULT_TOP) -> list[AsRollup]:
+        """Return the ``n`` autonomous systems with the most bans."""
+        return heapq.nlargest(n, self.asns.values(), key=lambda rollup: (rollup.bans, rollup.ips))
+
+
+class SubnetIndex:
+    """Persistent ban counts per IP, with its AS, for BanClusters.
+
+    Counts live in a local SQLite file, ordered by packed IP, and each
+    ingestion adds the bans of its events to them, so the index is never
+    rebuilt from the database; it holds the bans ingested since it was
+    created. Methods are blocking; call them through ``asyncio.to_thread``.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open or create the index file at ``path``."""
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS ip_bans ("
+                "ip BLOB PRIMARY KEY, bans INTEGER NOT NULL, asn TEXT) WITHOUT ROWID",
+            )
+
+    def add(self, events: list[BanEvent], metadata: Mapping[str, "IPMetadata"]) -> None:
+        """Count the bans of ``events``, recording the AS of the IPs found in ``metadata``."""
+        bans = Counter(event.ip for event in events if event.is_ban)
+        rows = []
+        for ip, count in bans.items():
+            packed = pack_ip(ip)
+            if packed is None:
+                continue
+            record = metadata.get(ip)
+            rows.append((packed, count, record.as_value if record is not None else None))
+        if not rows:
+            return
+        with self._lock, self._connection:
+            # An IP not enriched this time keeps the AS it had
+            self._connection.executemany(
+                "INSERT INTO ip_bans (ip, bans, asn) VALUES (?, ?, ?) "
+                "ON CONFLICT (ip) DO UPDATE SET bans = bans + excluded.bans, "
+                "asn = coalesce(excluded.asn, asn)",
+                rows,
+            )
+
+    def load(self) -> BanClusters:
+        """Return the subnets and autonomous systems of every IP counted so far."""
+        with self._lock:
+            rows = self._connection.execute("SELECT ip, bans, asn FROM ip_bans ORDER BY ip")
+            clusters = BanClusters.from_sorted(rows)
+        logger.debug("Loaded %d AS rollups from the subnet index", len(clusters.asns))
+        return clusters
+
+    def close(self) -> None:
+        """Close the index file."""
+        with self._lock:
+            self._connection.close()
+
+
+def _print_subnets(title: str, subnets: list[Subnet]) -> None:
+    print(f"\n{title}")  # noqa: T201
+    for subnet in subnets:
+        print(f"  {subnet.bans:>10}  {subnet.ips:>8} IPs  {subnet.network}")  # noqa: T201
+
+
+def main() -> None:
+    """Print the subnets, and optionally the autonomous systems, with the most bans."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=os.getenv("SUBNET_INDEX_PATH"), help="index file, SUBNET_INDEX_PATH by default")
+    parser.add_argument("--ipv4-prefixes", type=int, nargs="*", default=list(DEFAULT_IPV4_PREFIXES))
+    parser.add_argument("--ipv6-prefixes", type=int, nargs="*", default=list(DEFAULT_IPV6_PREFIXES))
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="rows per report")
+    parser.add_argument("--asns", action="store_true", help="also report the autonomous systems")
+    args = parser.parse_args()
+    if not args.path:
+        parser.error("--path or SUBNET_INDEX_PATH is required")
+
+    index = SubnetIndex(args.path)
+    try:
+        clusters = index.load()
+    finally:
+        index.close()
+    print(f"{len(clusters.ipv4)} IPv4 and {len(clusters.ipv6)} IPv6 addresses banned")  # noqa: T201
+    for prefix_length in args.ipv4_prefixes:
+        _print_subnets(f"IPv4 /{prefix_length}", clusters.top_subnets(prefix_length, args.top))
+    for prefix_length in args.ipv6_prefixes:
+        _print_subnets(f"IPv6 /{prefix_length}", clusters.top_subnets(prefix_length, args.top, ipv6=True))
+    if args.asns:
+        print(f"\nAutonomous systems (subnets are /{AS_IPV4_PREFIX} and /{AS_IPV6_PREFIX})")  # noqa: T201
+        for rollup in clusters.top_asns(args.top):
+            print(  # noqa: T201
+                f"  {rollup.bans:>10}  {rollup.ips:>8} IPs  {rollup.subnets:>6} subnets  {rollup.name}",
+            )
+
+
+if __name__ == "__main__":
+    main()
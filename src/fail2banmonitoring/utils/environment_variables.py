@@ -16,6 +16,29 @@ class EnvironmentVariables:
         "port": ("PORT", False),
         "log_path": ("LOG_PATH", True),  # Changed to required
         "export_ip_path": ("EXPORT_IP_PATH", False),
+        "checkpoint_path": ("CHECKPOINT_PATH", False),
+        "parser_workers": ("PARSER_WORKERS", False),
+        "rotated_log_glob": ("ROTATED_LOG_GLOB", False),
+        "enrichment_cache_path": ("ENRICHMENT_CACHE_PATH", False),
+        "enrichment_cache_ttl": ("ENRICHMENT_CACHE_TTL", False),
+        "enrichment_cache_max_entries": ("ENRICHMENT_CACHE_MAX_ENTRIES", False),
+        "ip_api_concurrency": ("IP_API_CONCURRENCY", False),
+        "geoip_databases": ("GEOIP_DATABASES", False),
+        "enrichment_providers": ("ENRICHMENT_PROVIDERS", False),
+        "ip_api_url": ("IP_API_URL", False),
+        "daemon_batch_window": ("DAEMON_BATCH_WINDOW", False),
+        "daemon_batch_bytes": ("DAEMON_BATCH_BYTES", False),
+        "daemon_poll_interval": ("DAEMON_POLL_INTERVAL", False),
+        "db_write_batch_size": ("DB_WRITE_BATCH_SIZE", False),
+        "retention_days": ("RETENTION_DAYS", False),
+        "retention_batch_size": ("RETENTION_BATCH_SIZE", False),
+        "metrics_port": ("METRICS_PORT", False),
+        "metrics_host": ("METRICS_HOST", False),
+        "metrics_textfile": ("METRICS_TEXTFILE", False),
+        "profile_dir": ("PROFILE_DIR", False),
+        "profile_modes": ("PROFILE_MODES", False),
+        "profile_loop_threshold": ("PROFILE_LOOP_THRESHOLD", False),
+        "subnet_index_path": ("SUBNET_INDEX_PATH", False),
     }
 
     def __init_subclass__(cls) -> None:
@@ -76,12 +99,146 @@ def log_path(self) -> str:
         """Return the value of the LOG_PATH environment variable."""
         return self._get_env_var("log_path") or ""
 
+    @cached_property
+    def log_sources(self) -> list[str]:
+        """Return the logs listed in LOG_PATH, comma separated paths or globs, each optionally prefixed with ``<host>=``."""
+        return [source.strip() for source in self.log_path.split(",") if source.strip()]
+
     @cached_property
     def export_ip_path(self) -> str | None:
         """Return the value of the EXPORT_IP_PATH environment variable, or None if not set."""
         return self._get_env_var("export_ip_path")
 
+    @cached_property
+    def checkpoint_path(self) -> str | None:
+        """Return the value of the CHECKPOINT_PATH environment variable, or None if not set."""
+        return self._get_env_var("checkpoint_path")
+
+    @cached_property
+    def parser_workers(self) -> int:
+        """Return the value of the PARSER_WORKERS environment variable, defaulting to 1."""
+        return int(self._get_env_var("parser_workers") or 1)
+
+    @cached_property
+    def rotated_log_glob(self) -> str | None:
+        """Return the value of the ROTATED_LOG_GLOB environment variable, or None if not set."""
+        return self._get_env_var("rotated_log_glob")
+
+    @cached_property
+    def enrichment_cache_path(self) -> str | None:
+        """Return the value of the ENRICHMENT_CACHE_PATH environment variable, or None if not set."""
+        return self._get_env_var("enrichment_cache_path")
+
+    @cached_property
+    def enrichment_cache_ttl(self) -> float | None:
+        """Return the value of the ENRICHMENT_CACHE_TTL environment variable in seconds, or None if not set."""
+        value = self._get_env_var("enrichment_cache_ttl")
+        return float(value) if value else None
+
+    @cached_property
+    def enrichment_cache_max_entries(self) -> int | None:
+        """Return the value of the ENRICHMENT_CACHE_MAX_ENTRIES environment variable, or None if not set."""
+        value = self._get_env_var("enrichment_cache_max_entries")
+        return int(value) if value else None
+
+    @cached_property
+    def ip_api_concurrency(self) -> int | None:
+        """Return the value of the IP_API_CONCURRENCY environment variable, or None if not set."""
+        value = self._get_env_var("ip_api_concurrency")
+        return int(value) if value else None
+
+    @cached_property
+    def geoip_databases(self) -> list[str]:
+        """Return the paths listed in the GEOIP_DATABASES environment variable, comma separated."""
+        value = self._get_env_var("geoip_databases") or ""
+        return [path.strip() for path in value.split(",") if path.strip()]
+
+    @cached_property
+    def enrichment_providers(self) -> list[str]:
+        """Return the providers listed in ENRICHMENT_PROVIDERS, comma separated, in lookup order."""
+        value = self._get_env_var("enrichment_providers") or "geoip,cache,ip-api"
+        return [name.strip() for name in value.split(",") if name.strip()]
+
+    @cached_property
+    def ip_api_url(self) -> str | None:
+        """Return the value of the IP_API_URL environment variable, or None if not set."""
+        return self._get_env_var("ip_api_url")
+
+    @cached_property
+    def daemon_batch_window(self) -> float | None:
+        """Return the value of the DAEMON_BATCH_WINDOW environment variable in seconds, or None if not set."""
+        value = self._get_env_var("daemon_batch_window")
+        return float(value) if value else None
+
+    @cached_property
+    def daemon_batch_bytes(self) -> int | None:
+        """Return the value of the DAEMON_BATCH_BYTES environment variable, or None if not set."""
+        value = self._get_env_var("daemon_batch_bytes")
+        return int(value) if value else None
+
+    @cached_property
+    def daemon_poll_interval(self) -> float | None:
+        """Return the value of the DAEMON_POLL_INTERVAL environment variable in seconds, or None if not set."""
+        value = self._get_env_var("daemon_poll_interval")
+        return float(value) if value else None
+
     @cached_property
     def port(self) -> str | None:
         """Return the value of the Port environment variable, or None if not set."""
         return self._get_env_var("port") or ""
+
+    @cached_property
+    def db_write_batch_size(self) -> int | None:
+        """Return the value of the DB_WRITE_BATCH_SIZE environment variable, or None if not set."""
+        value = self._get_env_var("db_write_batch_size")
+        return int(value) if value else None
+
+    @cached_property
+    def retention_days(self) -> float | None:
+        """Return the value of the RETENTION_DAYS environment variable, or None if not set."""
+        value = self._get_env_var("retention_days")
+        return float(value) if value else None
+
+    @cached_property
+    def retention_batch_size(self) -> int | None:
+        """Return the value of the RETENTION_BATCH_SIZE environment variable, or None if not set."""
+        value = self._get_env_var("retention_batch_size")
+        return int(value) if value else None
+
+    @cached_property
+    def metrics_port(self) -> int | None:
+        """Return the value of the METRICS_PORT environment variable, or None if not set."""
+        value = self._get_env_var("metrics_port")
+        return int(value) if value else None
+
+    @cached_property
+    def metrics_host(self) -> str | None:
+        """Return the value of the METRICS_HOST environment variable, or None if not set."""
+        return self._get_env_var("metrics_host")
+
+    @cached_property
+    def metrics_textfile(self) -> str | None:
+        """Return the value of the METRICS_TEXTFILE environment variable, or None if not set."""
+        return self._get_env_var("metrics_textfile")
+
+    @cached_property
+    def profile_dir(self) -> str | None:
+        """Return the value of the PROFILE_DIR environment variable, or None if not set."""
+        return self._get_env_var("profile_dir")
+
+    @cached_property
+    def profile_modes(self) -> list[str]:
+        """Return the profilers listed in PROFILE_MODES, comma separated, or an empty list if not set."""
+        value = self._get_env_var("profile_modes") or ""
+        return [mode.strip() for mode in value.split(",") if mode.strip()]
+
+    @cached_property
+    def profile_loop_threshold(self) -> float | None:
+        """Return the value of the PROFILE_LOOP_THRESHOLD environment variable in seconds, or None if not set."""
+        value = self._get_env_var("profile_loop_threshold")
+        return float(value) if value else None
+
+    @cached_property
+    def subnet_index_path(self) -> str | None:
+        """Return the value of the SUBNET_INDEX_PATH environment variable, or None if not set."""
+        return self._get_env_var("subnet_index_path")
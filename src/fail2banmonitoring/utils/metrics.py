@@ -0,0 +1,356 @@
+"""Counters, gauges and histograms of every ingestion stage, in the Prometheus text format.
+
+Metrics are disabled until ``REGISTRY.enabled`` is set, and every update
+then returns after a single attribute check. Hooks sit on blocks, requests
+and batches, never on single lines, so even enabled they cost little. The
+daemon serves them on ``/metrics``, see serve_metrics, and one-shot runs
+write them for the node_exporter textfile collector, see write_textfile.
+"""
+
+import bisect
+import logging
+import math
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, ClassVar
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_METRICS_HOST = "127.0.0.1"
+
+Labels = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    """The metrics known to the process, rendered together."""
+
+    def __init__(self) -> None:
+        """Create an empty, disabled registry."""
+        self.enabled = False
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: "Metric") -> None:
+        """Add ``metric`` to the rendered ones."""
+        self.metrics.append(metric)
+
+    def clear(self) -> None:
+        """Reset every metric to no sample."""
+        for metric in self.metrics:
+            metric.clear()
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format."""
+        return "".join(metric.render() for metric in self.metrics)
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    """A named metric, with one series per combination of label values.
+
+    Label values are passed positionally, in the order of ``labelnames``.
+    Updates take a lock, since rotated logs are parsed in other threads.
+    """
+
+    kind: ClassVar[str]
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels = (),
+        *,
+        registry: Registry = REGISTRY,
+    ) -> None:
+        """Register the metric in ``registry``."""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.registry = registry
+        self.lock = threading.Lock()
+        registry.register(self)
+
+    def clear(self) -> None:
+        """Forget every sample."""
+
+    def samples(self) -> Iterator[tuple[str, Labels, tuple[tuple[str, str], ...], float]]:
+        """Yield the suffix, label values, extra labels and value of each sample."""
+        yield from ()
+
+    def _labels(self, values: Labels, extra: tuple[tuple[str, str], ...]) -> str:
+        pairs = [*zip(self.labelnames, values, strict=True), *extra]
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self) -> str:
+        """Return the metric in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}\n",
+            f"# TYPE {self.name} {self.kind}\n",
+        ]
+        lines.extend(
+            f"{self.name}{suffix}{self._labels(labels, extra)} {_format_value(value)}\n"
+            for suffix, labels, extra, value in self.samples()
+        )
+        return "".join(lines)
+
+
+class Counter(Metric):
+    """A total that only goes up, e.g. bytes read, named with a ``_total`` suffix."""
+
+    kind = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels = (),
+        *,
+        registry: Registry = REGISTRY,
+    ) -> None:
+        """Register the counter, without any sample yet."""
+        super().__init__(name, documentation, labelnames, registry=registry)
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, *labels: str) -> None:
+        """Add ``amount`` to the series of ``labels``."""
+        if self.registry.enabled:
+            with self.lock:
+                self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        """Return the total of the series of ``labels``."""
+        return self.values.get(labels, 0.0)
+
+    def clear(self) -> None:
+        """Forget every sample."""
+        self.values.clear()
+
+    def samples(self) -> Iterator[tuple[str, Labels, tuple[tuple[str, str], ...], float]]:
+        """Yield the total of each series."""
+        for labels, value in self.values.items():
+            yield "", labels, (), value
+
+
+class Gauge(Metric):
+    """A value that goes up and down, set directly or computed when rendered."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels = (),
+        *,
+        function: Callable[[], float | None] | None = None,
+        registry: Registry = REGISTRY,
+    ) -> None:
+        """Register the gauge; with ``function``, its single value is what it returns, if not None."""
+        super().__init__(name, documentation, labelnames, registry=registry)
+        self.function = function
+        self.values: dict[Labels, float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        """Set the series of ``labels`` to ``value``."""
+        if self.registry.enabled:
+            self.values[labels] = value
+
+    def clear(self) -> None:
+        """Forget every sample."""
+        self.values.clear()
+
+    def samples(self) -> Iterator[tuple[str, Labels, tuple[tuple[str, str], ...], float]]:
+        """Yield the value of each series."""
+        if self.function is not None:
+            value = self.function()
+            if value is not None:
+                yield "", (), (), value
+            return
+        for labels, value in self.values.items():
+            yield "", labels, (), value
+
+
+class Histogram(Metric):
+    """The distribution of observed values, e.g. latencies, in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels = (),
+        *,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        registry: Registry = REGISTRY,
+    ) -> None:
+        """Register the histogram with the upper bounds ``buckets``."""
+        super().__init__(name, documentation, labelnames, registry=registry)
+        self.buckets = (*sorted(buckets), math.inf)
+        # Per series: the count of each bucket, not cumulative, then the sum
+        self.values: dict[Labels, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Count ``value`` in the series of ``labels``."""
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = ([0] * len(self.buckets), [0.0])
+            counts, total = series
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """Observe the seconds the block takes, in the series of ``labels``."""
+        if not self.registry.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def count(self, *labels: str) -> int:
+        """Return the number of values observed in the series of ``labels``."""
+        series = self.values.get(labels)
+        return sum(series[0]) if series else 0
+
+    def clear(self) -> None:
+        """Forget every sample."""
+        self.values.clear()
+
+    def samples(self) -> Iterator[tuple[str, Labels, tuple[tuple[str, str], ...], float]]:
+        """Yield the cumulative buckets, sum and count of each series."""
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts, strict=True):
+                cumulative += count
+                yield "_bucket", labels, (("le", _format_value(bound)),), cumulative
+            yield "_sum", labels, (), total[0]
+            yield "_count", labels, (), cumulative
+
+
+def _ratio(numerator: Counter, denominator: Callable[[], float]) -> Callable[[], float | None]:
+    """Return a function dividing ``numerator`` by ``denominator``, None while it is zero."""
+
+    def ratio() -> float | None:
+        total = denominator()
+        return numerator.value() / total if total else None
+
+    return ratio
+
+
+LOG_BYTES_READ = Counter("fail2ban_log_bytes_read_total", "Log bytes read by the parser.")
+LOG_LINES_PARSED = Counter("fail2ban_log_lines_parsed_total", "Log lines scanned by the parser.")
+LOG_PARSE_SECONDS = Counter("fail2ban_log_parse_seconds_total", "Seconds spent scanning log lines.")
+LOG_LINES_PER_SECOND = Gauge(
+    "fail2ban_log_lines_per_second",
+    "Lines scanned per second of scanning since the start.",
+    function=_ratio(LOG_LINES_PARSED, LOG_PARSE_SECONDS.value),
+)
+EVENTS_PARSED = Counter("fail2ban_events_parsed_total", "Ban, Restore Ban and Unban events found in the log.")
+BANS_FOUND = Counter("fail2ban_bans_found_total", "Ban and Restore Ban events found in the log.")
+
+ENRICHMENT_REQUEST_SECONDS = Histogram(
+    "fail2ban_enrichment_request_seconds",
+    "Latency of the requests to ip-api, by response status.",
+    ("status",),
+)
+ENRICHMENT_LOOKUP_SECONDS = Histogram(
+    "fail2ban_enrichment_lookup_seconds",
+    "Latency of the lookups of each enrichment provider.",
+    ("provider",),
+)
+ENRICHMENT_RESOLVED = Counter(
+    "fail2ban_enrichment_resolved_total",
+    "IPs resolved by each enrichment provider.",
+    ("provider",),
+)
+ENRICHMENT_FAILED = Counter("fail2ban_enrichment_failed_total", "IPs no enrichment provider could look up.")
+RATE_LIMIT_WAIT_SECONDS = Counter(
+    "fail2ban_rate_limit_wait_seconds_total",
+    "Seconds spent waiting for the ip-api rate limit.",
+)
+CACHE_HITS = Counter("fail2ban_enrichment_cache_hits_total", "IPs found fresh in the enrichment cache.")
+CACHE_MISSES = Counter("fail2ban_enrichment_cache_misses_total", "IPs missing or expired in the enrichment cache.")
+CACHE_HIT_RATIO = Gauge(
+    "fail2ban_enrichment_cache_hit_ratio",
+    "Share of the cache lookups answered from the cache since the start.",
+    function=_ratio(CACHE_HITS, lambda: CACHE_HITS.value() + CACHE_MISSES.value()),
+)
+
+DB_INSERT_SECONDS = Histogram(
+    "fail2ban_db_insert_seconds",
+    "Latency of each batch written to the database, by table.",
+    ("table",),
+)
+DB_ROWS_WRITTEN = Counter("fail2ban_db_rows_written_total", "Rows written to the database, by table.", ("table",))
+
+INGEST_RUNS = Counter("fail2ban_ingest_runs_total", "Ingestion runs, by outcome.", ("outcome",))
+INGEST_LAST_SUCCESS = Gauge(
+    "fail2ban_ingest_last_success_timestamp_seconds",
+    "Unix time of the end of the last successful ingestion.",
+)
+
+
+def write_textfile(path: str, registry: Registry = REGISTRY) -> None:
+    """Write the metrics to ``path`` for the node_exporter textfile collector.
+
+    The file is replaced atomically, so the collector never reads it half written.
+    """
+    directory = Path(path).parent
+    with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as out:
+        out.write(registry.render())
+    Path(out.name).chmod(0o644)
+    Path(out.name).replace(path)
+    logger.debug("Wrote metrics to %s", path)
+
+
+async def serve_metrics(
+    port: int,
+    host: str = DEFAULT_METRICS_HOST,
+    registry: Registry = REGISTRY,
+) -> "web.AppRunner":
+    """Serve the metrics on ``http://host:port/metrics`` until the returned runner is cleaned up."""
+    # Imported here so that parsing, which records metrics, does not load aiohttp
+    from aiohttp import web  # noqa: PLC0415
+
+    async def metrics(_: web.Request) -> web.Response:
+        return web.Response(body=registry.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Serving metrics on http://%s:%d/metrics", host, port)
+    return runner
@@ -0,0 +1,262 @@
+"""Opt-in CPU, memory and event loop profiles of a run, written to a directory.
+
+Enabled by PROFILE_DIR, see ProfilingSession. The parse, enrich and insert
+stages run concurrently and Python allows a single profiler at a time, so
+one cProfile and one tracemalloc session cover the whole run, and their
+reports are split per stage by the modules each stage runs in.
+"""
+
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from traceback import format_stack
+from types import TracebackType
+from typing import Self
+
+logger = logging.getLogger(__name__)
+
+CPU = "cpu"
+MEMORY = "memory"
+LOOP = "loop"
+DEFAULT_MODES = (CPU, MEMORY, LOOP)
+# Seconds the event loop may be busy before it counts as blocked
+DEFAULT_LOOP_THRESHOLD = 0.1
+# Seconds between two memory snapshots, the largest one is reported
+SNAPSHOT_INTERVAL = 10.0
+# Frames kept per allocation traceback
+TRACEMALLOC_FRAMES = 10
+# Lines of each report section
+TOP = 30
+
+# Module path fragments of the code each stage runs
+STAGE_MODULES = {
+    "parse": ("fail2banmonitoring/fail2ban/",),
+    "enrich": ("fail2banmonitoring/services/", "aiohttp/"),
+    "insert": ("fail2banmonitoring/models/", "fail2banmonitoring/db/", "sqlalchemy/"),
+}
+
+
+@dataclass
+class LoopStats:
+    """How long the event loop was blocked, and where."""
+
+    blocked_seconds: float = 0.0
+    max_blocked: float = 0.0
+    blocks: int = 0
+    # Stacks of the loop thread caught while it was blocked, with how often
+    stacks: Counter[str] = field(default_factory=Counter)
+
+
+class LoopMonitor:
+    """Measure event loop lag, and sample the stack of the loop thread while it is blocked.
+
+    A task sleeps ``interval`` seconds at a time and counts any delay beyond
+    ``threshold`` as blocked time. A watchdog thread notices when the task
+    has not run for ``threshold`` and records what the loop thread is doing.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_LOOP_THRESHOLD) -> None:
+        """Prepare a monitor counting delays over ``threshold`` seconds."""
+        self.threshold = threshold
+        self.interval = threshold / 2
+        self.stats = LoopStats()
+        self._beat = time.monotonic()
+        self._loop_thread = threading.get_ident()
+        self._stop = threading.Event()
+        self._task: asyncio.Task[None] | None = None
+        self._watchdog: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Start monitoring the running loop."""
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        """Stop monitoring, counting a block still going on."""
+        self._record_lag()
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+
+    def beat(self) -> None:
+        """Mark the loop as responsive, e.g. after deliberate blocking work."""
+        self._beat = time.monotonic()
+
+    async def _tick(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self._record_lag()
+
+    def _record_lag(self) -> None:
+        """Count the time since the last beat beyond the sleep interval, if over ``threshold``."""
+        lag = time.monotonic() - self._beat - self.interval
+        if lag > self.threshold:
+            self.stats.blocks += 1
+            self.stats.blocked_seconds += lag
+            self.stats.max_blocked = max(self.stats.max_blocked, lag)
+        self.beat()
+
+    def _watch(self) -> None:
+        sampled = 0.0
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            if time.monotonic() - beat <= self.threshold or beat == sampled:
+                continue
+            # One sample per blocking episode
+            sampled = beat
+            frame = sys._current_frames().get(self._loop_thread)  # noqa: SLF001
+            if frame is not None:
+                self.stats.stacks["".join(format_stack(frame))] += 1
+
+    def report(self) -> str:
+        """Return the blocked time and the most frequent blocking stacks."""
+        stats = self.stats
+        lines = [
+            (
+                f"Event loop blocked {stats.blocks} times over {self.threshold:.3f}s, "
+                f"{stats.blocked_seconds:.3f}s in total, {stats.max_blocked:.3f}s at most\n"
+            ),
+        ]
+        for stack, count in stats.stacks.most_common(TOP):
+            lines.append(f"\n--- caught {count} times while blocked ---\n{stack}")
+        return "".join(lines)
+
+
+def _cpu_report(profile: cProfile.Profile) -> str:
+    """Return the top functions by cumulative time, overall then per stage."""
+    out = io.StringIO()
+    stats = pstats.Stats(profile, stream=out)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE)
+    out.write("=== all stages ===\n")
+    stats.print_stats(TOP)
+    for stage, modules in STAGE_MODULES.items():
+        out.write(f"=== {stage} ===\n")
+        stats.print_stats("|".join(re.escape(module) for module in modules), TOP)
+    return out.getvalue()
+
+
+def _memory_report(snapshot: tracemalloc.Snapshot, peak: int) -> str:
+    """Return the top allocation sites of ``snapshot``, overall then per stage."""
+    lines = [f"Peak traced memory: {peak / 1e6:.1f} MB\n"]
+    stages = {"all stages": snapshot}
+    for stage, modules in STAGE_MODULES.items():
+        stages[stage] = snapshot.filter_traces(
+            [
+                tracemalloc.Filter(inclusive=True, filename_pattern=f"*{module}*", all_frames=True)
+                for module in modules
+            ],
+        )
+    for stage, filtered in stages.items():
+        statistics = filtered.statistics("lineno")
+        total = sum(stat.size for stat in statistics)
+        lines.append(f"\n=== {stage}: {total / 1e6:.1f} MB ===\n")
+        lines.extend(f"{stat}\n" for stat in statistics[:TOP])
+    return "".join(lines)
+
+
+class ProfilingSession:
+    """CPU, memory and event loop profiles of everything run inside ``async with``.
+
+    Reports are written to a new ``<time>-<pid>`` directory under
+    ``directory`` when the session ends:
+
+    - ``cpu.pstats``, for ``python -m pstats`` or any pstats viewer, and
+      ``cpu.txt``, the top functions by cumulative time per stage;
+    - ``memory.txt``, the peak traced memory and the top allocation sites per
+      stage, in the largest snapshot taken every ``SNAPSHOT_INTERVAL``;
+    - ``loop.txt``, the time the event loop was blocked and where.
+
+    The profiler sees the worker threads of the parser, not the processes
+    of PARSER_WORKERS.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        modes: tuple[str, ...] = DEFAULT_MODES,
+        loop_threshold: float = DEFAULT_LOOP_THRESHOLD,
+    ) -> None:
+        """Profile what ``modes`` lists, among ``cpu``, ``memory`` and ``loop``."""
+        unknown = set(modes) - set(DEFAULT_MODES)
+        if unknown:
+            msg = f"Unknown profiling modes: {', '.join(sorted(unknown))}"
+            raise ValueError(msg)
+        self.directory = Path(directory) / f"{datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}"  # noqa: DTZ005
+        self.modes = modes
+        self.profile = cProfile.Profile() if CPU in modes else None
+        self.monitor = LoopMonitor(loop_threshold) if LOOP in modes else None
+        self.snapshot: tracemalloc.Snapshot | None = None
+        self._snapshot_size = 0
+        self._snapshots: asyncio.Task[None] | None = None
+
+    def _take_snapshot(self) -> None:
+        """Keep a snapshot of the traced memory if it is the largest so far."""
+        size, _ = tracemalloc.get_traced_memory()
+        if size > self._snapshot_size:
+            self.snapshot = tracemalloc.take_snapshot()
+            self._snapshot_size = size
+        if self.monitor is not None:
+            # Snapshots block the loop, which is not the profiled code's doing
+            self.monitor.beat()
+
+    async def _snapshot_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            self._take_snapshot()
+
+    async def __aenter__(self) -> Self:
+        """Start the profilers."""
+        logger.info("Profiling %s into %s", ", ".join(self.modes), self.directory)
+        if MEMORY in self.modes:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._snapshots = asyncio.create_task(self._snapshot_periodically())
+        if self.monitor is not None:
+            self.monitor.start()
+        if self.profile is not None:
+            self.profile.enable()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Stop the profilers and write their reports, also after a failed run."""
+        if self.profile is not None:
+            self.profile.disable()
+        if self.monitor is not None:
+            await self.monitor.stop()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self.profile is not None:
+            self.profile.dump_stats(self.directory / "cpu.pstats")
+            (self.directory / "cpu.txt").write_text(_cpu_report(self.profile))
+        if self._snapshots is not None:
+            self._snapshots.cancel()
+            await asyncio.gather(self._snapshots, return_exceptions=True)
+            self._take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            if self.snapshot is not None:
+                (self.directory / "memory.txt").write_text(_memory_report(self.snapshot, peak))
+        if self.monitor is not None:
+            (self.directory / "loop.txt").write_text(self.monitor.report())
+        logger.info("Wrote profiles to %s", self.directory)
@@ -0,0 +1,45 @@
+import random
+
+import pytest
+
+from fail2banmonitoring.fail2ban import addresses
+from fail2banmonitoring.fail2ban.addresses import (
+    IPSet,
+    network_range,
+    pack_ip,
+    unpack_ip,
+)
+
+
+def test_packed_ips_sort_by_address_and_round_trip() -> None:
+    """Both families pack to 16 bytes in address order, and CIDR blocks are ranges of them."""
+    ips = ["1.2.3.4", "45.0.0.1", "45.255.255.255", "46.0.0.0", "::1", "2001:db8::1"]
+
+    assert [unpack_ip(pack_ip(ip)) for ip in ips] == ips  # noqa: S101
+    assert pack_ip("unknown") is None  # noqa: S101
+    first, last = network_range("45.0.0.0/8")
+    assert [ip for ip in ips if first <= pack_ip(ip) <= last] == ["45.0.0.1", "45.255.255.255"]  # noqa: S101
+    first, last = network_range("2001:db8::/32")
+    assert [ip for ip in ips if first <= pack_ip(ip) <= last] == ["2001:db8::1"]  # noqa: S101
+    with pytest.raises(ValueError, match="host bits"):
+        network_range("45.0.0.1/8")
+
+
+def test_ip_set_matches_a_set_across_merges(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Membership, additions and iteration agree with a set once values are merged into the arrays."""
+    monkeypatch.setattr(addresses, "MERGE_THRESHOLD", 16)
+    rng = random.Random(0)  # noqa: S311
+    ips = [f"10.0.{rng.randrange(4)}.{rng.randrange(256)}" for _ in range(500)]
+    ips += [f"2001:db8:{rng.randrange(1, 4):x}::{rng.randrange(1, 256):x}" for _ in range(500)]
+    ip_set = IPSet()
+    expected: set[str] = set()
+
+    for ip in ips:
+        assert ip_set.add(ip) == (ip not in expected)  # noqa: S101
+        expected.add(ip)
+        assert ip in ip_set  # noqa: S101
+
+    assert len(ip_set) == len(expected)  # noqa: S101
+    assert set(ip_set) == expected  # noqa: S101
+    assert "10.0.9.9" not in ip_set  # noqa: S101
+    assert "2001:db8:9::1" not in ip_set  # noqa: S101
@@ -0,0 +1,67 @@
+import pathlib
+from datetime import datetime
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy import text
+
+from fail2banmonitoring.db.config import SqlConnectorConfig, SqlEngine
+from fail2banmonitoring.fail2ban.events import BanEvent
+from fail2banmonitoring.models.ban_event import BanEventModel
+from fail2banmonitoring.models.base import in_network
+from fail2banmonitoring.models.ip import IpModel
+
+
+@pytest.mark.asyncio
+async def test_ban_events_are_bulk_inserted(tmp_path: pathlib.Path) -> None:
+    """Every event becomes one ban_event row, repeated bans and partial batches included."""
+    sql_engine = SqlEngine(
+        SqlConnectorConfig(
+            drivername="sqlite+aiosqlite",
+            database=str(tmp_path / "test.db"),
+        ),
+        write_batch_size=2,
+    )
+    await IpModel.create_table(sql_engine)
+    timestamp = datetime(2024, 6, 1, 12, 0, 0)  # noqa: DTZ001
+    events = [
+        BanEvent(timestamp, "sshd", "Ban", "8.8.8.8", None),
+        BanEvent(timestamp, "sshd", "Ban", "8.8.8.8", None),
+        BanEvent(None, "nginx", "Unban", "1.1.1.1", "web01"),
+    ]
+
+    await BanEventModel.insert(events, sql_engine)
+
+    async with sql_engine.engine.connect() as conn:
+        result = await conn.execute(
+            text("SELECT ip_address, COUNT(*) FROM ban_event GROUP BY ip_address"),
+        )
+        assert dict(result.all()) == {"8.8.8.8": 2, "1.1.1.1": 1}  # noqa: S101
+    await sql_engine.engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_network_lookups_use_the_packed_ip_index(tmp_path: pathlib.Path) -> None:
+    """Bans within a CIDR block are found by a range scan of the index on ip_packed."""
+    sql_engine = SqlEngine(
+        SqlConnectorConfig(drivername="sqlite+aiosqlite", database=str(tmp_path / "test.db")),
+    )
+    await IpModel.create_table(sql_engine)
+    events = [
+        BanEvent(None, "sshd", "Ban", ip, None)
+        for ip in ("44.255.255.255", "45.0.0.1", "45.200.1.1", "46.0.0.0", "2a01::1")
+    ]
+    await BanEventModel.insert(events, sql_engine)
+
+    table = BanEventModel.__table__
+    query = sa.select(table.c.ip_address).where(in_network(table.c.ip_packed, "45.0.0.0/8"))
+    async with sql_engine.engine.connect() as conn:
+        result = await conn.execute(query.order_by(table.c.ip_packed))
+        assert list(result.scalars()) == ["45.0.0.1", "45.200.1.1"]  # noqa: S101
+        compiled = query.compile(conn.sync_engine)
+        plan = await conn.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {compiled}",
+            tuple(compiled.params.values()),
+        )
+        assert "INDEX ix_ban_event_ip_packed (ip_packed>? AND ip_packed<?)" in str(plan.all())  # noqa: S101
+    await sql_engine.engine.dispose()
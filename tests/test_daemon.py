@@ -0,0 +1,102 @@
+import asyncio
+import functools
+import pathlib
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from fail2banmonitoring import daemon
+from fail2banmonitoring.db.config import SqlConnectorConfig, SqlEngine
+from fail2banmonitoring.fail2ban.log_parser import Fail2BanLogParser
+from fail2banmonitoring.fail2ban.watch import LogWatchers
+from fail2banmonitoring.services.providers import ProviderChain
+
+
+def _ban_line(ip: str) -> str:
+    return f"2024-06-01 12:00:00,000 fail2ban.actions        [1234]: NOTICE  [sshd] Ban {ip}\n"
+
+
+async def _wait_for_events(sql_engine: SqlEngine, count: int) -> None:
+    """Wait until ``count`` ban events are stored."""
+    for _ in range(100):
+        try:
+            async with sql_engine.engine.connect() as conn:
+                result = await conn.execute(text("SELECT COUNT(*) FROM ban_event"))
+                if result.scalar_one() >= count:
+                    return
+        except OperationalError:
+            # The daemon has not created the tables yet
+            pass
+        await asyncio.sleep(0.05)
+    msg = f"{count} events were not ingested in time"
+    raise AssertionError(msg)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("use_inotify", [True, False])
+async def test_daemon_follows_the_log(
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    use_inotify: bool,  # noqa: FBT001
+) -> None:
+    """Existing and appended bans are ingested, and the daemon stops when asked."""
+    monkeypatch.setattr(
+        daemon,
+        "LogWatchers",
+        functools.partial(LogWatchers, use_inotify=use_inotify),
+    )
+    log_path = tmp_path / "fail2ban.log"
+    log_path.write_text(_ban_line("1.1.1.1"))
+    parser = Fail2BanLogParser(
+        str(log_path),
+        None,
+        checkpoint_path=str(tmp_path / "checkpoint.json"),
+    )
+    sql_engine = SqlEngine(
+        SqlConnectorConfig(drivername="sqlite+aiosqlite", database=str(tmp_path / "test.db")),
+    )
+    stop = asyncio.Event()
+    task = asyncio.create_task(
+        daemon.run_daemon(
+            parser,
+            ProviderChain([]),
+            sql_engine,
+            batch_window=0.1,
+            poll_interval=0.05,
+            stop=stop,
+        ),
+    )
+
+    await _wait_for_events(sql_engine, 1)
+    with log_path.open("a") as log_file:
+        log_file.write(_ban_line("2.2.2.2"))
+    await _wait_for_events(sql_engine, 2)
+    stop.set()
+    await asyncio.wait_for(task, 5)
+
+    assert parser.unread_bytes() == 0  # noqa: S101
+    await sql_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_watchers_share_one_inotify_instance(tmp_path: pathlib.Path) -> None:
+    """Logs are followed through one inotify instance, with one watch per directory."""
+    (tmp_path / "web1").mkdir()
+    paths = [tmp_path / "a.log", tmp_path / "b.log", tmp_path / "web1" / "fail2ban.log"]
+    for path in paths:
+        path.write_text("")
+    watchers = LogWatchers([str(path) for path in paths], poll_interval=60)
+    try:
+        inotify = watchers._inotify  # noqa: SLF001
+        if inotify is None or inotify.fd is None:
+            pytest.skip("inotify is not available")
+        assert len(inotify._watches) == 2  # noqa: S101, SLF001
+        with paths[1].open("a") as log_file:
+            log_file.write(_ban_line("1.1.1.1"))
+        # Far sooner than the polling interval
+        assert await asyncio.wait_for(watchers.wait(), 5)  # noqa: S101
+        watchers.watch([str(paths[2])])
+        assert list(inotify._watches) == [str(paths[2].parent)]  # noqa: S101, SLF001
+    finally:
+        watchers.close()
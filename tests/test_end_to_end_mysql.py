@@ -94,7 +94,8 @@ async def test_end_to_end_mysql(tmp_path) -> None:
     assert "8.8.8.8" in ips  # noqa: S101
 
     async with aiohttp.ClientSession() as session:
-        enriched = await IPMetadata.get_ips_metadata_batch(list(ips), session)
+        batch = await IPMetadata.get_ips_metadata_batch(list(ips), session)
+        enriched = batch.records
 
     await IpModel.insert(enriched, sql_engine)
 
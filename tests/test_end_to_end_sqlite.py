@@ -61,7 +61,8 @@ async def test_end_to_end_sqlite(tmp_path: pathlib.Path) -> None:
 
     # Enrich IPs
     async with aiohttp.ClientSession() as session:
-        enriched = await IPMetadata.get_ips_metadata_batch(list(ips), session)
+        batch = await IPMetadata.get_ips_metadata_batch(list(ips), session)
+        enriched = batch.records
 
     # Create SqlConnectorConfig
     sql_config = SqlConnectorConfig(
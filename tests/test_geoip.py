@@ -0,0 +1,62 @@
+import pathlib
+
+from fail2banmonitoring.models.ip import IpModel
+from fail2banmonitoring.services.geoip import NOT_FOUND_MESSAGE, GeoIPDatabase, MMDBSource
+
+
+def test_csv_ranges_are_looked_up_and_merged(tmp_path: pathlib.Path) -> None:
+    """IPs resolve to their range, and a second database fills missing fields."""
+    city = tmp_path / "city.csv"
+    city.write_text(
+        "start_ip,end_ip,country,countryCode,city,lat,lon\n"
+        "1.0.0.0,1.0.0.255,Australia,AU,Sydney,-33.86,151.2\n"
+        "8.8.4.0,8.8.8.255,United States,US,,37.75,-97.82\n"
+        "2001:db8::,2001:db8::ffff,Spain,ES,Madrid,40.41,-3.7\n",
+    )
+    asn = tmp_path / "asn.csv"
+    asn.write_text(
+        "network,as,isp,country\n"
+        "8.8.8.0/24,AS15169 Google LLC,Google LLC,Nowhere\n",
+    )
+    geoip = GeoIPDatabase([str(city), str(asn)])
+
+    result = geoip.lookup_many(["8.8.8.8", "1.0.0.1", "2001:db8::1", "9.9.9.9"])
+
+    google, sydney, madrid, unknown = result.records
+    assert (google.query, google.country, google.city, google.as_value, google.isp) == (  # noqa: S101
+        "8.8.8.8",
+        "United States",
+        None,
+        "AS15169 Google LLC",
+        "Google LLC",
+    )
+    assert (sydney.city, sydney.lat, sydney.as_value) == ("Sydney", -33.86, None)  # noqa: S101
+    assert madrid.country_code == "ES"  # noqa: S101
+    # Records of the same range are copies, not the shared template
+    neighbour = geoip.lookup("1.0.0.2")
+    assert neighbour is not None  # noqa: S101
+    assert (sydney.query, neighbour.query) == ("1.0.0.1", "1.0.0.2")  # noqa: S101
+    assert neighbour.model_dump(exclude={"query", "fetched_at"}) == sydney.model_dump(  # noqa: S101
+        exclude={"query", "fetched_at"},
+    )
+    assert (unknown.status, unknown.message) == ("fail", NOT_FOUND_MESSAGE)  # noqa: S101
+    assert IpModel.from_metadata(google).as_field == "AS15169 Google LLC"  # noqa: S101
+
+
+def test_mmdb_records_map_to_ip_api_fields() -> None:
+    """City and ASN MaxMind records fill the ip-api fields."""
+    values = MMDBSource._flatten(  # noqa: SLF001
+        {
+            "country": {"iso_code": "FR", "names": {"en": "France"}},
+            "subdivisions": [{"iso_code": "IDF", "names": {"en": "Ile-de-France"}}],
+            "city": {"names": {"en": "Paris"}},
+            "location": {"latitude": 48.85, "longitude": 2.35, "time_zone": "Europe/Paris"},
+            "autonomous_system_number": 3215,
+            "autonomous_system_organization": "Orange",
+        },
+    )
+
+    assert values["city"] == "Paris"  # noqa: S101
+    assert values["regionName"] == "Ile-de-France"  # noqa: S101
+    assert values["as"] == "AS3215 Orange"  # noqa: S101
+    assert values["isp"] == "Orange"  # noqa: S101
@@ -0,0 +1,59 @@
+import pathlib
+from datetime import datetime, timedelta
+
+import aiohttp
+import pytest
+
+from fail2banmonitoring.services.cache import IPMetadataCache
+from fail2banmonitoring.services.ip import IPMetadata
+
+
+def _record(ip: str, age: timedelta = timedelta(0)) -> IPMetadata:
+    return IPMetadata(
+        status="success",
+        query=ip,
+        country="Spain",
+        countryCode="ES",
+        fetched_at=datetime.now() - age,  # noqa: DTZ005
+    )
+
+
+def test_cache_persists_expires_and_evicts(tmp_path: pathlib.Path) -> None:
+    """Records survive a reopen, expire after the TTL and are evicted LRU first."""
+    path = str(tmp_path / "cache.db")
+    cache = IPMetadataCache(path, ttl=3600, max_entries=2, hot_size=1)
+    cache.put_many([_record("1.1.1.1"), _record("2.2.2.2", timedelta(hours=2))])
+    cache.close()
+
+    cache = IPMetadataCache(path, ttl=3600, max_entries=2, hot_size=1)
+    found = cache.get_many(["1.1.1.1", "2.2.2.2", "3.3.3.3"])
+    assert list(found) == ["1.1.1.1"]  # noqa: S101
+    assert found["1.1.1.1"].country_code == "ES"  # noqa: S101
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.expired) == (1, 2, 1)  # noqa: S101
+
+    cache.put_many([_record("3.3.3.3")])
+    assert cache.stats.evictions == 1  # noqa: S101
+    assert set(cache.get_many(["1.1.1.1", "3.3.3.3"])) == {"1.1.1.1", "3.3.3.3"}  # noqa: S101
+    # Refreshing cached IPs does not add to the count
+    cache.put_many([_record("1.1.1.1"), _record("3.3.3.3"), _record("3.3.3.3")])
+    assert cache.stats.evictions == 1  # noqa: S101
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_batch_lookup_skips_the_api_for_cached_ips(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Cached IPs are returned in request order without any HTTP request."""
+    cache = IPMetadataCache(str(tmp_path / "cache.db"))
+    cache.put_many([_record("1.1.1.1"), _record("2.2.2.2")])
+
+    async with aiohttp.ClientSession() as session:
+        result = await IPMetadata.get_ips_metadata_batch(
+            ["2.2.2.2", "1.1.1.1"],
+            session,
+            cache,
+        )
+
+    assert [record.query for record in result.records] == ["2.2.2.2", "1.1.1.1"]  # noqa: S101
+    cache.close()
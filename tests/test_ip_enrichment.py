@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from fail2banmonitoring.services import ip
+from fail2banmonitoring.services.ip import IPMetadata
+from fail2banmonitoring.services.rate_limit import RateLimiter
+
+
+@pytest.mark.asyncio
+async def test_batches_are_chunked_and_follow_rate_limit_headers(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """IPs are sent 100 per request, kept in order, and X-Rl/X-Ttl pause the client."""
+    request_sizes: list[int] = []
+
+    async def batch(request: web.Request) -> web.Response:
+        queries = await request.json()
+        request_sizes.append(len(queries))
+        # The window is exhausted after the first request and resets in 1s
+        remaining = "0" if len(request_sizes) == 1 else "10"
+        return web.json_response(
+            [{"status": "success", "query": q["query"], "as": "AS1"} for q in queries],
+            headers={"X-Rl": remaining, "X-Ttl": "1"},
+        )
+
+    app = web.Application()
+    app.router.add_post("/batch", batch)
+    async with TestServer(app) as server, aiohttp.ClientSession() as session:
+        monkeypatch.setattr(IPMetadata, "API_URL", str(server.make_url("/batch")))
+        ips = [f"10.0.{i // 256}.{i % 256}" for i in range(250)]
+        limiter = RateLimiter(15, 60.0)
+        start = time.monotonic()
+
+        result = await IPMetadata.get_ips_metadata_batch(
+            ips,
+            session,
+            limiter=limiter,
+            concurrency=1,
+        )
+
+    assert sorted(request_sizes) == [50, 100, 100]  # noqa: S101
+    assert [record.query for record in result.records] == ips  # noqa: S101
+    assert time.monotonic() - start >= 0.9  # noqa: S101
+    assert limiter.waited >= 0.9  # noqa: S101
+
+
+@pytest.mark.asyncio
+async def test_failing_chunk_is_retried_then_reported(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A flaky chunk is retried and a broken one is reported without losing the others."""
+    attempts: dict[str, int] = {}
+
+    async def batch(request: web.Request) -> web.Response:
+        queries = [q["query"] for q in await request.json()]
+        attempts[queries[0]] = attempts.get(queries[0], 0) + 1
+        if queries[0] == "10.0.0.100" or (
+            queries[0] == "10.0.0.200" and attempts[queries[0]] == 1
+        ):
+            return web.Response(status=503)
+        return web.json_response([{"status": "success", "query": q} for q in queries])
+
+    app = web.Application()
+    app.router.add_post("/batch", batch)
+    monkeypatch.setattr(ip, "RETRY_BACKOFF", (0.01, 0.05))
+    async with TestServer(app) as server, aiohttp.ClientSession() as session:
+        monkeypatch.setattr(IPMetadata, "API_URL", str(server.make_url("/batch")))
+        ips = [f"10.0.0.{i}" for i in range(250)]
+
+        result = await IPMetadata.get_ips_metadata_batch(ips, session)
+
+    assert [record.query for record in result.records] == ips[:100] + ips[200:]  # noqa: S101
+    assert result.failed_ips == ips[100:200]  # noqa: S101
+    assert attempts == {"10.0.0.0": 1, "10.0.0.100": ip.CHUNK_ATTEMPTS, "10.0.0.200": 2}  # noqa: S101
+
+
+@pytest.mark.asyncio
+async def test_slow_tail_chunk_is_hedged(monkeypatch: pytest.MonkeyPatch) -> None:
+    """A tail request that hangs is sent again and the first answer wins."""
+    requests = 0
+
+    async def batch(request: web.Request) -> web.Response:
+        nonlocal requests
+        requests += 1
+        if requests == 1:
+            await asyncio.sleep(10)
+        queries = await request.json()
+        return web.json_response([{"status": "success", "query": q["query"]} for q in queries])
+
+    app = web.Application()
+    app.router.add_post("/batch", batch)
+    async with TestServer(app) as server, aiohttp.ClientSession() as session:
+        monkeypatch.setattr(IPMetadata, "API_URL", str(server.make_url("/batch")))
+        start = time.monotonic()
+
+        result = await IPMetadata.get_ips_metadata_batch(
+            ["1.1.1.1", "8.8.8.8"],
+            session,
+            hedge_after=0.2,
+        )
+
+    assert [record.query for record in result.records] == ["1.1.1.1", "8.8.8.8"]  # noqa: S101
+    assert requests == 2  # noqa: S101
+    assert time.monotonic() - start < 5  # noqa: S101
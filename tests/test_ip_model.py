@@ -0,0 +1,36 @@
+import pathlib
+
+import pytest
+from sqlalchemy import text
+
+from fail2banmonitoring.db.config import SqlConnectorConfig, SqlEngine
+from fail2banmonitoring.models.ip import IpModel
+from fail2banmonitoring.services.ip import IPMetadata
+
+
+@pytest.mark.asyncio
+async def test_insert_upserts_known_ips(tmp_path: pathlib.Path) -> None:
+    """Inserting an IP again updates its row instead of adding a copy."""
+    sql_engine = SqlEngine(
+        SqlConnectorConfig(
+            drivername="sqlite+aiosqlite",
+            database=str(tmp_path / "test.db"),
+        ),
+    )
+    await IpModel.create_table(sql_engine)
+    google = IPMetadata(status="success", query="8.8.8.8", country="United States", city="Ashburn")
+    cloudflare = IPMetadata(status="success", query="1.1.1.1", country="Australia")
+
+    await IpModel.insert([google, cloudflare, cloudflare], sql_engine)
+    await IpModel.insert(
+        [IPMetadata(status="success", query="8.8.8.8", country="United States", city="Mountain View")],
+        sql_engine,
+    )
+    await IpModel.insert([IPMetadata(status="fail", query="8.8.8.8")], sql_engine)
+
+    async with sql_engine.engine.connect() as conn:
+        result = await conn.execute(
+            text("SELECT ip_address, city, hit_count FROM ip ORDER BY ip_address"),
+        )
+        assert result.all() == [("1.1.1.1", None, 2), ("8.8.8.8", "Mountain View", 3)]  # noqa: S101
+    await sql_engine.dispose()
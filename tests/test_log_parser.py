@@ -0,0 +1,311 @@
+import asyncio
+import gzip
+import lzma
+import pathlib
+import threading
+import time
+from collections.abc import Generator
+from datetime import datetime
+
+import pytest
+
+from fail2banmonitoring.fail2ban import parallel
+from fail2banmonitoring.fail2ban.events import TimestampParser
+from fail2banmonitoring.fail2ban.log_parser import Fail2BanLogParser
+
+
+def _ban_line(ip: str) -> str:
+    return f"2024-06-01 12:00:00,000 fail2ban.actions        [1234]: NOTICE  [sshd] Ban {ip}\n"
+
+
+def _run(log_path: pathlib.Path, checkpoint_path: pathlib.Path) -> set[str]:
+    parser = Fail2BanLogParser(
+        log_path=str(log_path),
+        output_file=None,
+        checkpoint_path=str(checkpoint_path),
+    )
+    ips = parser.read_logs()
+    parser.commit_checkpoint()
+    return ips
+
+
+def test_checkpoint_resumes_after_last_line(tmp_path: pathlib.Path) -> None:
+    """Only lines appended since the previous run are parsed."""
+    log_path = tmp_path / "fail2ban.log"
+    checkpoint_path = tmp_path / "checkpoint.json"
+    log_path.write_text(_ban_line("1.1.1.1"))
+
+    assert _run(log_path, checkpoint_path) == {"1.1.1.1"}  # noqa: S101
+    assert _run(log_path, checkpoint_path) == set()  # noqa: S101
+
+    with log_path.open("a") as log_file:
+        log_file.write(_ban_line("2.2.2.2"))
+        # A partially written line is left for the next run
+        log_file.write(_ban_line("3.3.3.3")[:-1])
+    assert _run(log_path, checkpoint_path) == {"2.2.2.2"}  # noqa: S101
+
+    with log_path.open("a") as log_file:
+        log_file.write("\n")
+    assert _run(log_path, checkpoint_path) == {"3.3.3.3"}  # noqa: S101
+
+
+def test_checkpoint_keeps_ips_to_retry(tmp_path: pathlib.Path) -> None:
+    """IPs whose enrichment failed are handed to the next run, then dropped."""
+    log_path = tmp_path / "fail2ban.log"
+    checkpoint_path = tmp_path / "checkpoint.json"
+    log_path.write_text(_ban_line("1.1.1.1"))
+    parser = Fail2BanLogParser(str(log_path), None, checkpoint_path=str(checkpoint_path))
+    parser.read_events()
+    parser.commit_checkpoint(retry_ips=["1.1.1.1"])
+
+    assert parser.retry_ips() == ["1.1.1.1"]  # noqa: S101
+    assert _run(log_path, checkpoint_path) == set()  # noqa: S101
+    assert parser.retry_ips() == []  # noqa: S101
+
+
+def test_checkpoint_detects_copytruncate(tmp_path: pathlib.Path) -> None:
+    """A truncated or rewritten file is read again from the beginning."""
+    log_path = tmp_path / "fail2ban.log"
+    checkpoint_path = tmp_path / "checkpoint.json"
+    log_path.write_text(_ban_line("1.1.1.1") + _ban_line("2.2.2.2"))
+    _run(log_path, checkpoint_path)
+
+    log_path.write_text(_ban_line("4.4.4.4"))
+    assert _run(log_path, checkpoint_path) == {"4.4.4.4"}  # noqa: S101
+
+    # Same size as before but different content
+    log_path.write_text(_ban_line("5.5.5.5"))
+    assert _run(log_path, checkpoint_path) == {"5.5.5.5"}  # noqa: S101
+
+
+def test_checkpoint_detects_rename_rotation(tmp_path: pathlib.Path) -> None:
+    """After a rename rotation the rest of the old file and the new file are read."""
+    log_path = tmp_path / "fail2ban.log"
+    checkpoint_path = tmp_path / "checkpoint.json"
+    log_path.write_text(_ban_line("1.1.1.1"))
+    _run(log_path, checkpoint_path)
+
+    with log_path.open("a") as log_file:
+        log_file.write(_ban_line("2.2.2.2"))
+    log_path.rename(tmp_path / "fail2ban.log.1")
+    log_path.write_text(_ban_line("3.3.3.3"))
+
+    assert _run(log_path, checkpoint_path) == {"2.2.2.2", "3.3.3.3"}  # noqa: S101
+    assert _run(log_path, checkpoint_path) == set()  # noqa: S101
+
+
+@pytest.mark.asyncio
+async def test_streaming_handles_lines_split_across_chunks(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Chunks smaller than a line still yield every ban, once per ban line."""
+    log_path = tmp_path / "fail2ban.log"
+    ips = ["1.1.1.1", "22.22.22.22", "1.1.1.1", "203.0.113.42"]
+    log_path.write_text(
+        "".join(_ban_line(ip) for ip in ips)
+        + "2024-06-01 12:00:00,000 fail2ban.actions [1234]: NOTICE [sshd] Unban 1.1.1.1\n",
+    )
+    parser = Fail2BanLogParser(log_path=str(log_path), output_file=None, chunk_size=7)
+
+    streamed = [ip async for ip in parser.iter_banned_ips()]
+
+    assert streamed == ips  # noqa: S101
+    assert parser.read_logs() == set(ips)  # noqa: S101
+
+
+@pytest.mark.asyncio
+async def test_cancelled_stream_closes_the_log_once_the_block_is_read(
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Cancelling a stream while its thread reads a block waits for the block before closing the log."""
+    log_path = tmp_path / "fail2ban.log"
+    log_path.write_text("".join(_ban_line(f"10.0.0.{i}") for i in range(50)))
+    parser = Fail2BanLogParser(str(log_path), None, chunk_size=256)
+    reading = threading.Event()
+    iter_new_blocks = parser._iter_new_blocks  # noqa: SLF001
+
+    def slow_iter_new_blocks(path: str) -> Generator[bytes]:
+        for block in iter_new_blocks(path):
+            reading.set()
+            time.sleep(0.2)
+            yield block
+
+    monkeypatch.setattr(parser, "_iter_new_blocks", slow_iter_new_blocks)
+
+    async def consume() -> None:
+        async for _ in parser.iter_event_blocks():
+            pass
+
+    task = asyncio.create_task(consume())
+    await asyncio.to_thread(reading.wait)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+def test_parallel_counts_match_serial(
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Splitting the log across processes gives the same counts as one pass."""
+    monkeypatch.setattr(parallel, "MIN_RANGE_SIZE", 64)
+    log_path = tmp_path / "fail2ban.log"
+    log_path.write_text(
+        "".join(_ban_line(f"10.0.{i % 7}.{i % 13}") for i in range(500)),
+    )
+
+    serial = Fail2BanLogParser(log_path=str(log_path), output_file=None)
+    parallel_parser = Fail2BanLogParser(
+        log_path=str(log_path),
+        output_file=None,
+        workers=4,
+    )
+
+    assert parallel_parser.count_banned_ips() == serial.count_banned_ips()  # noqa: S101
+    assert parallel_parser.read_logs() == serial.read_logs()  # noqa: S101
+
+
+@pytest.mark.asyncio
+async def test_parallel_stream_yields_each_range(
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """The parallel scan is streamed range by range, and resumes after the last range committed."""
+    monkeypatch.setattr(parallel, "MIN_RANGE_SIZE", 64)
+    monkeypatch.setattr(parallel, "MAX_RANGE_SIZE", 1024)
+    log_path = tmp_path / "fail2ban.log"
+    checkpoint_path = tmp_path / "checkpoint.json"
+    ips = [f"10.0.{i // 250}.{i % 250}" for i in range(200)]
+    log_path.write_text("".join(_ban_line(ip) for ip in ips))
+    parser = Fail2BanLogParser(
+        log_path=str(log_path),
+        output_file=None,
+        checkpoint_path=str(checkpoint_path),
+        workers=2,
+    )
+
+    blocks = [events async for events in parser.iter_event_blocks()]
+    assert len(blocks) > 2  # noqa: S101
+    assert [event.ip for events in blocks for event in events] == ips  # noqa: S101
+
+    parser.commit_checkpoint(blocks=2)
+    resumed = Fail2BanLogParser(
+        log_path=str(log_path),
+        output_file=None,
+        checkpoint_path=str(checkpoint_path),
+    )
+    assert [event.ip for event in resumed.read_events()] == [  # noqa: S101
+        event.ip for events in blocks[2:] for event in events
+    ]
+
+
+def test_rotated_files_are_ingested_once(tmp_path: pathlib.Path) -> None:
+    """Plain, gzip and xz rotated logs are read, and never again once ingested."""
+    log_path = tmp_path / "fail2ban.log"
+    checkpoint_path = tmp_path / "checkpoint.json"
+    log_path.write_text(_ban_line("1.1.1.1"))
+    (tmp_path / "fail2ban.log.1").write_text(_ban_line("2.2.2.2"))
+    with gzip.open(tmp_path / "fail2ban.log.2.gz", "wt") as gzip_file:
+        gzip_file.write(_ban_line("3.3.3.3"))
+    with lzma.open(tmp_path / "fail2ban.log.3.xz", "wt") as xz_file:
+        xz_file.write(_ban_line("4.4.4.4"))
+
+    def run() -> set[str]:
+        parser = Fail2BanLogParser(
+            log_path=str(log_path),
+            output_file=None,
+            checkpoint_path=str(checkpoint_path),
+            rotated_glob=f"{log_path}.*",
+        )
+        ips = parser.read_logs()
+        parser.commit_checkpoint()
+        return ips
+
+    assert run() == {"1.1.1.1", "2.2.2.2", "3.3.3.3", "4.4.4.4"}  # noqa: S101
+    assert run() == set()  # noqa: S101
+
+    # logrotate compresses the plain member: same content, new file
+    rotated = tmp_path / "fail2ban.log.1"
+    with gzip.open(tmp_path / "fail2ban.log.2.gz", "wb") as gzip_file:
+        gzip_file.write(rotated.read_bytes())
+    rotated.unlink()
+    assert run() == set()  # noqa: S101
+
+
+def test_events_from_native_and_syslog_formats(tmp_path: pathlib.Path) -> None:
+    """Every event keeps its timestamp, jail, action and host, duplicates included."""
+    log_path = tmp_path / "fail2ban.log"
+    log_path.write_text(
+        _ban_line("1.1.1.1")
+        + _ban_line("1.1.1.1")
+        + "2024-06-01 12:05:00,250 fail2ban.actions [1234]: NOTICE [sshd] Unban 1.1.1.1\n"
+        + "2024-06-01 12:06:00,000 fail2ban.actions [1234]: NOTICE [nginx] Restore Ban 2.2.2.2\n"
+        + "Feb 20 14:05:33 firewall fail2ban.actions [1122]: NOTICE [sshd] Ban 3.3.3.3\n"
+        + "Feb 20 14:05:34 firewall fail2ban.filter [1122]: INFO [sshd] Found 4.4.4.4\n",
+    )
+    parser = Fail2BanLogParser(log_path=str(log_path), output_file=None)
+
+    events = parser.read_events()
+
+    assert [(e.action, e.ip) for e in events] == [  # noqa: S101
+        ("Ban", "1.1.1.1"),
+        ("Ban", "1.1.1.1"),
+        ("Unban", "1.1.1.1"),
+        ("Restore Ban", "2.2.2.2"),
+        ("Ban", "3.3.3.3"),
+    ]
+    assert events[2].timestamp == datetime(2024, 6, 1, 12, 5, 0, 250000)  # noqa: DTZ001, S101
+    assert events[3].jail == "nginx"  # noqa: S101
+    assert events[4].timestamp is not None  # noqa: S101
+    assert events[4].timestamp.strftime("%m-%d %H:%M:%S") == "02-20 14:05:33"  # noqa: S101
+    assert events[4].host == "firewall"  # noqa: S101
+    assert events[0].host is None  # noqa: S101
+    assert parser.count_banned_ips() == {"1.1.1.1": 2, "2.2.2.2": 1, "3.3.3.3": 1}  # noqa: S101
+
+
+def test_syslog_year_is_inferred_from_reference_time() -> None:
+    """Syslog months later than the reference month belong to the previous year."""
+    timestamps = TimestampParser(datetime(2025, 1, 10))  # noqa: DTZ001
+
+    assert timestamps.parse_syslog(b"Jan  9 23:59:59") == datetime(2025, 1, 9, 23, 59, 59)  # noqa: DTZ001, S101
+    assert timestamps.parse_syslog(b"Dec 31 10:00:00") == datetime(2024, 12, 31, 10, 0, 0)  # noqa: DTZ001, S101
+
+
+def test_ipv6_bans_are_normalized(tmp_path: pathlib.Path) -> None:
+    """IPv6 bans are extracted and every spelling of an address counts once."""
+    log_path = tmp_path / "fail2ban.log"
+    log_path.write_text(
+        _ban_line("2001:DB8:0:0::1")
+        + _ban_line("2001:db8::1")
+        + _ban_line("::ffff:203.0.113.7")
+        + _ban_line("203.0.113.7")
+        + _ban_line("999.1.1.1")
+        + _ban_line("not:an::ip::")
+    )
+    parser = Fail2BanLogParser(log_path=str(log_path), output_file=None)
+
+    assert parser.count_banned_ips() == {"2001:db8::1": 2, "203.0.113.7": 2}  # noqa: S101
+
+
+def test_has_new_events_only_searches_for_markers(tmp_path: pathlib.Path) -> None:
+    """Lines without actions are skipped for good, while bans and retries are reported."""
+    log_path = tmp_path / "fail2ban.log"
+    checkpoint_path = tmp_path / "checkpoint.json"
+    found = "2024-06-01 12:00:01,000 fail2ban.filter         [1234]: INFO    [sshd] Found 1.1.1.1\n"
+    log_path.write_text(found)
+    parser = Fail2BanLogParser(str(log_path), None, checkpoint_path=str(checkpoint_path))
+
+    assert not parser.has_new_events()  # noqa: S101
+    parser.commit_checkpoint()
+    assert parser.unread_bytes() == 0  # noqa: S101
+
+    with log_path.open("a") as log_file:
+        log_file.write(found + _ban_line("2.2.2.2"))
+    assert parser.has_new_events()  # noqa: S101
+    assert parser.unread_bytes() > 0  # noqa: S101
+    assert _run(log_path, checkpoint_path) == {"2.2.2.2"}  # noqa: S101
+
+    parser.read_events()
+    parser.commit_checkpoint(retry_ips=["2.2.2.2"])
+    assert parser.has_new_events()  # noqa: S101
@@ -0,0 +1,24 @@
+import pathlib
+
+from benchmarks.loggen import LogProfile, write_log
+from fail2banmonitoring.fail2ban.log_parser import Fail2BanLogParser
+
+
+def test_generated_log_matches_its_summary(tmp_path: pathlib.Path) -> None:
+    """The parser finds the events, bans and distinct IPs the generator reports, in the jails asked for."""
+    log_path = tmp_path / "fail2ban.log"
+    profile = LogProfile(lines=20_000, jails={"sshd": 3, "postfix": 1}, ipv6_ratio=0.5, duplicate_rate=0.8)
+
+    summary = write_log(log_path, profile)
+    events = Fail2BanLogParser(str(log_path), None).read_events()
+
+    bans = [event for event in events if event.is_ban]
+    assert summary.lines == 20_000  # noqa: S101
+    assert summary.bytes == log_path.stat().st_size  # noqa: S101
+    assert (len(events), len(bans)) == (summary.events, summary.bans)  # noqa: S101
+    assert len({event.ip for event in bans}) == summary.distinct_ips  # noqa: S101
+    assert {event.jail for event in events} == {"sshd", "postfix"}  # noqa: S101
+    ipv6 = sum(":" in event.ip for event in bans)
+    assert 0.3 < ipv6 / len(bans) < 0.7  # noqa: S101
+    assert write_log(tmp_path / "again.log", profile) == summary  # noqa: S101
+    assert (tmp_path / "again.log").read_bytes() == log_path.read_bytes()  # noqa: S101
@@ -0,0 +1,106 @@
+import pathlib
+from collections.abc import Iterator
+
+import aiohttp
+import pytest
+
+from fail2banmonitoring.db.config import SqlConnectorConfig, SqlEngine
+from fail2banmonitoring.fail2ban.log_parser import Fail2BanLogParser
+from fail2banmonitoring.pipeline import IngestPipeline
+from fail2banmonitoring.services.providers import ProviderChain
+from fail2banmonitoring.utils import metrics
+
+
+@pytest.fixture
+def enabled_metrics() -> Iterator[metrics.Registry]:
+    """Enable the global registry for one test, starting and ending empty."""
+    metrics.REGISTRY.clear()
+    metrics.REGISTRY.enabled = True
+    yield metrics.REGISTRY
+    metrics.REGISTRY.enabled = False
+    metrics.REGISTRY.clear()
+
+
+def test_render_follows_the_text_format() -> None:
+    """Counters, computed gauges and cumulative histogram buckets are rendered; a disabled registry records nothing."""
+    registry = metrics.Registry()
+    requests = metrics.Counter("requests_total", "Requests.", ("status",), registry=registry)
+    latency = metrics.Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0), registry=registry)
+    metrics.Gauge("double", "Twice the 200s.", function=lambda: 2 * requests.value("200"), registry=registry)
+
+    requests.inc(1, "200")
+    assert "requests_total{" not in registry.render()  # noqa: S101
+
+    registry.enabled = True
+    requests.inc(2, "200")
+    requests.inc(1, 'say "hi"')
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+
+    assert registry.render() == (  # noqa: S101
+        "# HELP requests_total Requests.\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{status="200"} 2\n'
+        'requests_total{status="say \\"hi\\""} 1\n'
+        "# HELP latency_seconds Latency.\n"
+        "# TYPE latency_seconds histogram\n"
+        'latency_seconds_bucket{le="0.1"} 1\n'
+        'latency_seconds_bucket{le="1"} 2\n'
+        'latency_seconds_bucket{le="+Inf"} 3\n'
+        "latency_seconds_sum 5.55\n"
+        "latency_seconds_count 3\n"
+        "# HELP double Twice the 200s.\n"
+        "# TYPE double gauge\n"
+        "double 4\n"
+    )
+
+
+def test_counters_are_named_with_a_total_suffix() -> None:
+    """Every counter of the process follows the Prometheus naming convention."""
+    counters = [metric.name for metric in metrics.REGISTRY.metrics if isinstance(metric, metrics.Counter)]
+
+    assert counters  # noqa: S101
+    assert [name for name in counters if not name.endswith("_total")] == []  # noqa: S101
+
+
+@pytest.mark.asyncio
+async def test_pipeline_metrics_are_served_and_written(
+    tmp_path: pathlib.Path,
+    enabled_metrics: metrics.Registry,
+) -> None:
+    """An ingestion counts parsed lines, bans and written rows, served on /metrics and written to a textfile."""
+    log_path = tmp_path / "fail2ban.log"
+    log_path.write_text(
+        "2024-06-01 12:00:00,000 fail2ban.filter  [1]: INFO    [sshd] Found 10.0.0.1\n"
+        "2024-06-01 12:00:01,000 fail2ban.actions [1]: NOTICE  [sshd] Ban 10.0.0.1\n"
+        "2024-06-01 12:00:02,000 fail2ban.actions [1]: NOTICE  [sshd] Ban 10.0.0.2\n"
+        "2024-06-01 12:10:00,000 fail2ban.actions [1]: NOTICE  [sshd] Unban 10.0.0.1\n",
+    )
+    sql_engine = SqlEngine(
+        SqlConnectorConfig(drivername="sqlite+aiosqlite", database=str(tmp_path / "test.db")),
+    )
+    parser = Fail2BanLogParser(str(log_path), None)
+    await IngestPipeline(parser, ProviderChain([]), sql_engine).run()
+    await sql_engine.dispose()
+
+    assert metrics.LOG_BYTES_READ.value() == log_path.stat().st_size  # noqa: S101
+    assert metrics.LOG_LINES_PARSED.value() == 4  # noqa: S101
+    assert (metrics.EVENTS_PARSED.value(), metrics.BANS_FOUND.value()) == (3, 2)  # noqa: S101
+    assert metrics.DB_ROWS_WRITTEN.value("ip") == 2  # noqa: S101
+    assert metrics.DB_ROWS_WRITTEN.value("ban_event") == 3  # noqa: S101
+    assert metrics.DB_INSERT_SECONDS.count("ban_event") == 1  # noqa: S101
+    assert metrics.INGEST_RUNS.value("success") == 1  # noqa: S101
+
+    runner = await metrics.serve_metrics(0)
+    try:
+        port = runner.addresses[0][1]
+        async with aiohttp.ClientSession() as session, session.get(f"http://127.0.0.1:{port}/metrics") as response:
+            served = await response.text()
+    finally:
+        await runner.cleanup()
+    assert "fail2ban_bans_found_total 2\n" in served  # noqa: S101
+    assert 'fail2ban_db_rows_written_total{table="ban_event"} 3\n' in served  # noqa: S101
+
+    textfile = tmp_path / "fail2ban.prom"
+    metrics.write_textfile(str(textfile))
+    assert textfile.read_text() == enabled_metrics.render()  # noqa: S101
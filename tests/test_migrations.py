@@ -0,0 +1,86 @@
+import pathlib
+
+import pytest
+import sqlalchemy as sa
+
+from fail2banmonitoring.db.config import SqlConnectorConfig, SqlEngine
+from fail2banmonitoring.models.ban_event import BanEventModel
+from fail2banmonitoring.models.ip import IpModel
+from fail2banmonitoring.models.migrations import MIGRATIONS, migrate
+from fail2banmonitoring.services.ip import IPMetadata
+
+# The ip table as created before upserts, without hit_count, last_seen nor indexes
+LEGACY_IP_TABLE = """
+CREATE TABLE ip (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    country VARCHAR(30), country_code VARCHAR(30), region VARCHAR(30),
+    region_name VARCHAR(30), city VARCHAR(30), zip VARCHAR(30), lat FLOAT, lon FLOAT,
+    timezone VARCHAR(50), isp VARCHAR(50), org VARCHAR(50), "as" VARCHAR(50),
+    ip_address VARCHAR(50), created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL
+)
+"""
+
+
+def _engine(tmp_path: pathlib.Path) -> SqlEngine:
+    return SqlEngine(
+        SqlConnectorConfig(drivername="sqlite+aiosqlite", database=str(tmp_path / "test.db")),
+    )
+
+
+@pytest.mark.asyncio
+async def test_legacy_ip_table_is_migrated(tmp_path: pathlib.Path) -> None:
+    """Duplicate IPs are merged, indexes added, stored bans rolled up and IPs packed, each version applied once."""
+    sql_engine = _engine(tmp_path)
+    async with sql_engine.engine.begin() as conn:
+        await conn.exec_driver_sql(LEGACY_IP_TABLE)
+        await conn.exec_driver_sql(
+            "INSERT INTO ip (city, ip_address, created_at) VALUES "
+            "('Ashburn', '8.8.8.8', '2024-06-01 10:00:00'), "
+            "('Sydney', '1.1.1.1', '2024-06-01 11:00:00'), "
+            "('Mountain View', '8.8.8.8', '2024-06-02 10:00:00')",
+        )
+        await conn.run_sync(BanEventModel.__table__.create)
+        await conn.exec_driver_sql(
+            "INSERT INTO ban_event (timestamp, jail, action, ip_address) "
+            "VALUES ('2024-06-02 10:00:00.000000', 'sshd', 'Ban', '8.8.8.8')",
+        )
+
+    assert await migrate(sql_engine) == len(MIGRATIONS)  # noqa: S101
+    assert await migrate(sql_engine) == len(MIGRATIONS)  # noqa: S101
+    await IpModel.insert([IPMetadata(status="success", query="1.1.1.1")], sql_engine)
+
+    async with sql_engine.engine.connect() as conn:
+        result = await conn.exec_driver_sql(
+            "SELECT ip_address, city, hit_count, created_at FROM ip ORDER BY ip_address",
+        )
+        assert result.all() == [  # noqa: S101
+            ("1.1.1.1", "Sydney", 2, "2024-06-01 11:00:00"),
+            ("8.8.8.8", "Mountain View", 2, "2024-06-01 10:00:00"),
+        ]
+        indexes = await conn.run_sync(lambda sync: sa.inspect(sync).get_indexes("ip"))
+        packed = await conn.exec_driver_sql("SELECT hex(ip_packed) FROM ban_event")
+        assert packed.scalar_one() == "00000000000000000000FFFF08080808"  # noqa: S101
+        rollups = await conn.exec_driver_sql("SELECT value, bans FROM ban_rollup WHERE dimension = 'city'")
+        assert rollups.all() == [("Mountain View", 1)]  # noqa: S101
+        versions = await conn.exec_driver_sql("SELECT version FROM schema_version")
+        assert [version for (version,) in versions] == [m.version for m in MIGRATIONS]  # noqa: S101
+    assert {index["name"] for index in indexes} == {  # noqa: S101
+        "ix_ip_created_at",
+        "ix_ip_ip_address",
+        "ix_ip_ip_packed",
+        "ix_ip_last_seen_country",
+    }
+    await sql_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_new_database_is_created_up_to_date(tmp_path: pathlib.Path) -> None:
+    """On a new database the migrations change nothing and are only recorded."""
+    sql_engine = _engine(tmp_path)
+
+    assert await migrate(sql_engine) == len(MIGRATIONS)  # noqa: S101
+
+    async with sql_engine.engine.connect() as conn:
+        columns = await conn.run_sync(lambda sync: sa.inspect(sync).get_columns("ip"))
+    assert {"hit_count", "last_seen"} <= {column["name"] for column in columns}  # noqa: S101
+    await sql_engine.dispose()
@@ -0,0 +1,151 @@
+import asyncio
+import pathlib
+from typing import Any
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from fail2banmonitoring.db.config import SqlConnectorConfig, SqlEngine
+from fail2banmonitoring.fail2ban.events import BanEvent
+from fail2banmonitoring.fail2ban.log_parser import Fail2BanLogParser
+from fail2banmonitoring.models.ban_event import BanEventModel
+from fail2banmonitoring.pipeline import IngestPipeline
+from fail2banmonitoring.services.providers import ProviderChain
+
+
+def _write_log(path: pathlib.Path, count: int) -> None:
+    path.write_text(
+        "".join(
+            f"2024-06-01 12:00:00,000 fail2ban.actions        [1234]: NOTICE  [sshd] Ban 10.0.{i // 256}.{i % 256}\n"
+            for i in range(count)
+        ),
+    )
+
+
+def _setup(tmp_path: pathlib.Path, count: int) -> tuple[Fail2BanLogParser, SqlEngine]:
+    log_path = tmp_path / "fail2ban.log"
+    _write_log(log_path, count)
+    parser = Fail2BanLogParser(
+        str(log_path),
+        None,
+        checkpoint_path=str(tmp_path / "checkpoint.json"),
+        chunk_size=1024,
+    )
+    sql_engine = SqlEngine(
+        SqlConnectorConfig(drivername="sqlite+aiosqlite", database=str(tmp_path / "test.db")),
+    )
+    return parser, sql_engine
+
+
+@pytest.mark.asyncio
+async def test_pipeline_ingests_every_event(tmp_path: pathlib.Path) -> None:
+    """Events and IP records of every batch are stored, then the checkpoint is committed."""
+    parser, sql_engine = _setup(tmp_path, 500)
+
+    stats = await IngestPipeline(parser, ProviderChain([]), sql_engine, batch_size=64).run()
+
+    async with sql_engine.engine.connect() as conn:
+        events = (await conn.execute(text("SELECT COUNT(*) FROM ban_event"))).scalar_one()
+        ips = (await conn.execute(text("SELECT COUNT(*) FROM ip"))).scalar_one()
+    assert (events, ips) == (500, 500)  # noqa: S101
+    assert stats.events == 500  # noqa: S101
+    # At least 64 events each, made of whole blocks of about 12 lines
+    assert stats.batches == 7  # noqa: S101
+    assert parser.unread_bytes() == 0  # noqa: S101
+    await sql_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_hit_count_counts_every_ban(tmp_path: pathlib.Path) -> None:
+    """Every ban counts as a hit, including those of IPs enriched in an earlier batch of the run."""
+    parser, sql_engine = _setup(tmp_path, 0)
+    log_path = tmp_path / "fail2ban.log"
+    line = "2024-06-01 12:00:00,000 fail2ban.actions        [1234]: NOTICE  [sshd] Ban 10.0.0.{}\n"
+    log_path.write_text("".join(line.format(i % 10) for i in range(200)))
+
+    await IngestPipeline(parser, ProviderChain([]), sql_engine, batch_size=16).run()
+    with log_path.open("a") as log_file:
+        log_file.writelines(line.format(i % 5) for i in range(50))
+    await IngestPipeline(parser, ProviderChain([]), sql_engine, batch_size=16).run()
+
+    async with sql_engine.engine.connect() as conn:
+        hits = (
+            await conn.execute(text("SELECT ip_address, hit_count FROM ip ORDER BY ip_address"))
+        ).all()
+    assert hits == [(f"10.0.0.{i}", 30 if i < 5 else 20) for i in range(10)]  # noqa: S101
+    await sql_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_slow_writer_pauses_the_parser(
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A blocked writer stops the parser once the queues are full, and nothing is committed."""
+    parser, sql_engine = _setup(tmp_path, 500)
+    release = asyncio.Event()
+    write = BanEventModel.write
+
+    async def blocked_write(conn: AsyncConnection, events: list[BanEvent], **kwargs: Any) -> None:  # noqa: ANN401
+        await release.wait()
+        await write(conn, events, **kwargs)
+
+    monkeypatch.setattr(BanEventModel, "write", blocked_write)
+    pipeline = IngestPipeline(
+        parser,
+        ProviderChain([]),
+        sql_engine,
+        batch_size=10,
+        queue_size=1,
+        enrich_batch_size=1,
+    )
+    task = asyncio.create_task(pipeline.run())
+    for _ in range(20):
+        await asyncio.sleep(0.05)
+
+    # One batch in the writer, one in each queue and one in the enrichment stage and parser
+    assert pipeline.stats.batches <= 5  # noqa: S101
+    assert parser.unread_bytes() > 0  # noqa: S101
+    release.set()
+    stats = await task
+    assert stats.events == 500  # noqa: S101
+    assert parser.unread_bytes() == 0  # noqa: S101
+    await sql_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_failed_run_resumes_after_the_last_batch_stored(
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Batches stored before a failure are not stored again, the failed one is stored once."""
+    parser, sql_engine = _setup(tmp_path, 500)
+    write = BanEventModel.write
+    calls = 0
+
+    async def failing_write(conn: AsyncConnection, events: list[BanEvent], **kwargs: Any) -> None:  # noqa: ANN401
+        nonlocal calls
+        calls += 1
+        # After the IPs of the batch were written in the same transaction
+        if calls == 3:
+            msg = "database went away"
+            raise RuntimeError(msg)
+        await write(conn, events, **kwargs)
+
+    monkeypatch.setattr(BanEventModel, "write", failing_write)
+    with pytest.raises(ExceptionGroup):
+        await IngestPipeline(parser, ProviderChain([]), sql_engine, batch_size=64).run()
+    assert 0 < parser.unread_bytes() < (tmp_path / "fail2ban.log").stat().st_size  # noqa: S101
+
+    stats = await IngestPipeline(parser, ProviderChain([]), sql_engine, batch_size=64).run()
+
+    assert 0 < stats.events <= 500 - 2 * 64  # noqa: S101
+    async with sql_engine.engine.connect() as conn:
+        events = (await conn.execute(text("SELECT COUNT(*) FROM ban_event"))).scalar_one()
+        bans = (
+            await conn.execute(text("SELECT SUM(bans) FROM ban_rollup WHERE dimension = 'jail'"))
+        ).scalar_one()
+        hits = (await conn.execute(text("SELECT SUM(hit_count) FROM ip"))).scalar_one()
+    assert (events, bans, hits) == (500, 500, 500)  # noqa: S101
+    await sql_engine.dispose()
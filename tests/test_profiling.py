@@ -0,0 +1,69 @@
+import pathlib
+import time
+
+import pytest
+
+from fail2banmonitoring.db.config import SqlConnectorConfig, SqlEngine
+from fail2banmonitoring.fail2ban.log_parser import Fail2BanLogParser
+from fail2banmonitoring.pipeline import IngestPipeline
+from fail2banmonitoring.services.providers import ProviderChain
+from fail2banmonitoring.utils.profiling import ProfilingSession
+
+
+def _block_the_loop() -> None:
+    time.sleep(0.3)
+
+
+def _write_log(path: pathlib.Path) -> None:
+    path.write_text(
+        "".join(
+            f"2024-06-01 12:00:00,000 fail2ban.actions [1]: NOTICE [sshd] Ban 10.0.0.{i}\n"
+            for i in range(100)
+        ),
+    )
+
+
+@pytest.mark.asyncio
+async def test_session_writes_cpu_and_loop_reports(tmp_path: pathlib.Path) -> None:
+    """A profiled ingestion leaves pstats and per-stage reports, and blocking calls are caught with their stack."""
+    log_path = tmp_path / "fail2ban.log"
+    _write_log(log_path)
+    sql_engine = SqlEngine(
+        SqlConnectorConfig(drivername="sqlite+aiosqlite", database=str(tmp_path / "test.db")),
+    )
+
+    async with ProfilingSession(str(tmp_path), ("cpu", "loop"), loop_threshold=0.05) as session:
+        await IngestPipeline(Fail2BanLogParser(str(log_path), None), ProviderChain([]), sql_engine).run()
+        _block_the_loop()
+    await sql_engine.dispose()
+
+    reports = {path.name: path for path in session.directory.iterdir()}
+    assert set(reports) == {"cpu.pstats", "cpu.txt", "loop.txt"}  # noqa: S101
+    cpu = reports["cpu.txt"].read_text()
+    assert "=== parse ===" in cpu  # noqa: S101
+    assert "scan_events" in cpu  # noqa: S101
+    assert session.monitor is not None  # noqa: S101
+    assert session.monitor.stats.max_blocked >= 0.25  # noqa: S101
+    assert "_block_the_loop" in reports["loop.txt"].read_text()  # noqa: S101
+
+
+@pytest.mark.asyncio
+async def test_session_writes_memory_report(tmp_path: pathlib.Path) -> None:
+    """Allocations are reported overall and per stage, with the peak."""
+    log_path = tmp_path / "fail2ban.log"
+    _write_log(log_path)
+
+    async with ProfilingSession(str(tmp_path), ("memory",)) as session:
+        events = Fail2BanLogParser(str(log_path), None).read_events()
+
+    report = (session.directory / "memory.txt").read_text()
+    assert len(events) == 100  # noqa: S101
+    assert report.startswith("Peak traced memory:")  # noqa: S101
+    assert "=== parse:" in report  # noqa: S101
+    assert "events.py" in report.split("=== parse:")[1]  # noqa: S101
+
+
+def test_unknown_mode_is_rejected(tmp_path: pathlib.Path) -> None:
+    """A typo in PROFILE_MODES fails instead of silently profiling nothing."""
+    with pytest.raises(ValueError, match="gpu"):
+        ProfilingSession(str(tmp_path), ("cpu", "gpu"))
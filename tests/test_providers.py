@@ -0,0 +1,65 @@
+import pathlib
+
+import aiohttp
+import pytest
+
+from fail2banmonitoring.services import ip
+from fail2banmonitoring.services.cache import IPMetadataCache
+from fail2banmonitoring.services.geoip import NOT_FOUND_MESSAGE, GeoIPDatabase
+from fail2banmonitoring.services.providers import (
+    CacheProvider,
+    GeoIPProvider,
+    IPAPIProvider,
+    ProviderChain,
+)
+from fail2banmonitoring.services.standin import IPAPIStandIn
+
+
+@pytest.mark.asyncio
+async def test_chain_falls_back_from_local_db_to_cache_to_ip_api(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Each provider only gets the IPs the previous ones left, and the cache keeps ip-api's answers."""
+    csv_path = tmp_path / "geoip.csv"
+    csv_path.write_text("network,country,countryCode\n1.0.0.0/24,Australia,AU\n")
+    cache = IPMetadataCache(str(tmp_path / "cache.db"))
+    ips = ["1.0.0.1", "8.8.8.8", "9.9.9.9", "10.0.0.1"]
+
+    async with IPAPIStandIn() as standin, aiohttp.ClientSession() as session:
+        chain = ProviderChain(
+            [
+                GeoIPProvider(GeoIPDatabase([str(csv_path)])),
+                CacheProvider(cache),
+                IPAPIProvider(session, url=standin.url),
+            ],
+        )
+        first = await chain.lookup(ips)
+        second = await chain.lookup(ips)
+        await chain.close()
+
+    assert [record.query for record in first.records] == ips  # noqa: S101
+    assert first.records[0].country == "Australia"  # noqa: S101
+    assert first.records[1].as_value is not None  # noqa: S101
+    assert first.records[3].message == "private range"  # noqa: S101
+    assert [record.query for record in second.records] == ips  # noqa: S101
+    assert standin.requests == 1  # noqa: S101
+    assert chain.stats == {"geoip": 2, "ip-api": 3, "cache": 3}  # noqa: S101
+
+
+@pytest.mark.asyncio
+async def test_chain_reports_failed_and_uncovered_ips(monkeypatch: pytest.MonkeyPatch) -> None:
+    """IPs a failing provider could not look up are failed, others only not found."""
+    monkeypatch.setattr(ip, "RETRY_BACKOFF", (0.01, 0.05))
+
+    async with (
+        IPAPIStandIn(error_rate=1.0) as standin,
+        aiohttp.ClientSession() as session,
+    ):
+        chain = ProviderChain([IPAPIProvider(session, url=standin.url)])
+        result = await chain.lookup(["8.8.8.8"])
+        empty = await ProviderChain([]).lookup(["9.9.9.9"])
+
+    assert result.records == []  # noqa: S101
+    assert result.failed_ips == ["8.8.8.8"]  # noqa: S101
+    assert standin.errors == ip.CHUNK_ATTEMPTS  # noqa: S101
+    assert empty.records[0].message == NOT_FOUND_MESSAGE  # noqa: S101
@@ -0,0 +1,47 @@
+import pathlib
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import text
+
+from fail2banmonitoring.db.config import SqlConnectorConfig, SqlEngine
+from fail2banmonitoring.models.ip import IpModel
+from fail2banmonitoring.models.retention import apply_retention
+
+
+@pytest.mark.asyncio
+async def test_retention_deletes_old_rows_in_batches(tmp_path: pathlib.Path) -> None:
+    """Events and IPs older than the retention age are deleted, recent ones and rollups kept."""
+    sql_engine = SqlEngine(
+        SqlConnectorConfig(drivername="sqlite+aiosqlite", database=str(tmp_path / "test.db")),
+    )
+    await apply_retention(sql_engine, timedelta(days=30))
+    await IpModel.create_table(sql_engine)
+    async with sql_engine.engine.begin() as conn:
+        for age in (90, 60, 45, 40, 35, 1, 0):
+            await conn.execute(
+                text(
+                    "INSERT INTO ban_event (jail, action, ip_address, created_at) "
+                    "VALUES ('sshd', 'Ban', :ip, datetime('now', :age))",
+                ),
+                {"ip": f"10.0.0.{age}", "age": f"-{age} days"},
+            )
+            await conn.execute(
+                text("INSERT INTO ip (ip_address, last_seen) VALUES (:ip, datetime('now', :age))"),
+                {"ip": f"10.0.0.{age}", "age": f"-{age} days"},
+            )
+        await conn.execute(
+            text("INSERT INTO ban_rollup VALUES ('2020-01-01 00:00:00.000000', 'jail', 'sshd', 1)"),
+        )
+
+    await apply_retention(sql_engine, None)
+    await apply_retention(sql_engine, timedelta(days=30), batch_size=2)
+
+    async with sql_engine.engine.connect() as conn:
+        events = await conn.execute(text("SELECT ip_address FROM ban_event ORDER BY id"))
+        assert events.scalars().all() == ["10.0.0.1", "10.0.0.0"]  # noqa: S101
+        ips = await conn.execute(text("SELECT ip_address FROM ip ORDER BY id"))
+        assert ips.scalars().all() == ["10.0.0.1", "10.0.0.0"]  # noqa: S101
+        rollups = await conn.execute(text("SELECT COUNT(*) FROM ban_rollup"))
+        assert rollups.scalar_one() == 1  # noqa: S101
+    await sql_engine.dispose()
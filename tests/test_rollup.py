@@ -0,0 +1,46 @@
+import pathlib
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from fail2banmonitoring.db.config import SqlConnectorConfig, SqlEngine
+from fail2banmonitoring.fail2ban.events import BanEvent
+from fail2banmonitoring.models.ban_event import BanEventModel
+from fail2banmonitoring.models.ip import IpModel
+from fail2banmonitoring.services.ip import IPMetadata
+
+
+@pytest.mark.asyncio
+async def test_rollups_add_up_across_inserts(tmp_path: pathlib.Path) -> None:
+    """Bans are counted per hour and dimension, unbans are not, unknown IPs count as Unknown."""
+    sql_engine = SqlEngine(
+        SqlConnectorConfig(drivername="sqlite+aiosqlite", database=str(tmp_path / "test.db")),
+    )
+    await IpModel.create_table(sql_engine)
+    metadata = {"8.8.8.8": IPMetadata(status="success", query="8.8.8.8", country="United States")}
+    events = [
+        BanEvent(datetime(2024, 6, 1, 12, 5), "sshd", "Ban", "8.8.8.8", None),  # noqa: DTZ001
+        BanEvent(datetime(2024, 6, 1, 12, 55), "nginx", "Restore Ban", "1.1.1.1", None),  # noqa: DTZ001
+        BanEvent(datetime(2024, 6, 1, 13, 0), "sshd", "Unban", "8.8.8.8", None),  # noqa: DTZ001
+    ]
+
+    await BanEventModel.insert(events, sql_engine, metadata=metadata)
+    await BanEventModel.insert(events[:1], sql_engine, metadata=metadata)
+
+    async with sql_engine.engine.connect() as conn:
+        result = await conn.execute(
+            text(
+                "SELECT dimension, value, bans FROM ban_rollup "
+                "WHERE bucket = '2024-06-01 12:00:00.000000' AND dimension IN ('jail', 'country')",
+            ),
+        )
+        assert sorted(result.all()) == [  # noqa: S101
+            ("country", "United States", 2),
+            ("country", "Unknown", 1),
+            ("jail", "nginx", 1),
+            ("jail", "sshd", 2),
+        ]
+        hours = await conn.execute(text("SELECT COUNT(DISTINCT bucket) FROM ban_rollup"))
+        assert hours.scalar_one() == 1  # noqa: S101
+    await sql_engine.dispose()
@@ -0,0 +1,91 @@
+import pathlib
+
+import pytest
+from sqlalchemy import text
+
+from fail2banmonitoring.db.config import SqlConnectorConfig, SqlEngine
+from fail2banmonitoring.fail2ban.sources import MultiLogParser, expand_sources
+from fail2banmonitoring.pipeline import IngestPipeline
+from fail2banmonitoring.services.providers import ProviderChain
+
+
+def _ban_line(ip: str) -> str:
+    return f"2024-06-01 12:00:00,000 fail2ban.actions        [1234]: NOTICE  [sshd] Ban {ip}\n"
+
+
+def test_sources_take_their_host_from_the_entry_or_directory(tmp_path: pathlib.Path) -> None:
+    """Globs are expanded, hosts come from ``host=`` or the directory matched by a wildcard."""
+    for host in ("web1", "web2"):
+        (tmp_path / host).mkdir()
+        (tmp_path / host / "fail2ban.log").write_text("")
+    (tmp_path / "local.log").write_text("")
+
+    sources = expand_sources(
+        [f"{tmp_path}/*/fail2ban.log", f"mail={tmp_path}/local.log", f"{tmp_path}/web1/fail2ban.log"],
+    )
+
+    assert [(pathlib.Path(s.path).relative_to(tmp_path).as_posix(), s.host) for s in sources] == [  # noqa: S101
+        ("web1/fail2ban.log", "web1"),
+        ("web2/fail2ban.log", "web2"),
+        ("local.log", "mail"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_logs_are_ingested_with_their_host_and_own_checkpoint(tmp_path: pathlib.Path) -> None:
+    """Every log is read from its own checkpoint, and rows are tagged with the host of their log."""
+    logs = {}
+    for index, host in enumerate(("web1", "web2")):
+        (tmp_path / host).mkdir()
+        logs[host] = tmp_path / host / "fail2ban.log"
+        logs[host].write_text(_ban_line(f"10.0.0.{index + 1}"))
+    parser = MultiLogParser(
+        [f"{tmp_path}/*/fail2ban.log"],
+        None,
+        checkpoint_path=str(tmp_path / "checkpoint.json"),
+    )
+    sql_engine = SqlEngine(
+        SqlConnectorConfig(drivername="sqlite+aiosqlite", database=str(tmp_path / "test.db")),
+    )
+
+    await IngestPipeline(parser, ProviderChain([]), sql_engine).run()
+    with logs["web2"].open("a") as log_file:
+        log_file.write(_ban_line("10.0.0.3"))
+    assert parser.unread_bytes() == len(_ban_line("10.0.0.3"))  # noqa: S101
+    stats = await IngestPipeline(parser, ProviderChain([]), sql_engine).run()
+
+    assert stats.events == 1  # noqa: S101
+    assert len(list(tmp_path.glob("checkpoint.json.*"))) == 2  # noqa: S101
+    async with sql_engine.engine.connect() as conn:
+        events = await conn.execute(text("SELECT ip_address, host FROM ban_event ORDER BY ip_address"))
+        ips = await conn.execute(text("SELECT ip_address, host FROM ip ORDER BY ip_address"))
+        expected = [("10.0.0.1", "web1"), ("10.0.0.2", "web2"), ("10.0.0.3", "web2")]
+        assert [tuple(row) for row in events] == expected  # noqa: S101
+        assert [tuple(row) for row in ips] == expected  # noqa: S101
+    await sql_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_ips_to_retry_are_kept_by_the_log_that_banned_them(tmp_path: pathlib.Path) -> None:
+    """Each log keeps the failed IPs it banned or had left to retry, and drops them once retried."""
+    logs = {}
+    for index, host in enumerate(("web1", "web2")):
+        (tmp_path / host).mkdir()
+        logs[host] = tmp_path / host / "fail2ban.log"
+        logs[host].write_text(_ban_line(f"10.0.0.{index + 1}"))
+    parser = MultiLogParser(
+        [f"{tmp_path}/*/fail2ban.log"],
+        None,
+        checkpoint_path=str(tmp_path / "checkpoint.json"),
+    )
+
+    def retry_ips() -> dict[str, list[str]]:
+        return {host: parser._parsers[str(path)].retry_ips() for host, path in logs.items()}  # noqa: SLF001
+
+    [_ async for _ in parser.iter_event_blocks()]
+    parser.commit_checkpoint(["10.0.0.1", "10.0.0.2"])
+    assert retry_ips() == {"web1": ["10.0.0.1"], "web2": ["10.0.0.2"]}  # noqa: S101
+
+    [_ async for _ in parser.iter_event_blocks()]
+    parser.commit_checkpoint(["10.0.0.2"])
+    assert retry_ips() == {"web1": [], "web2": ["10.0.0.2"]}  # noqa: S101
@@ -0,0 +1,22 @@
+import subprocess
+import sys
+
+# Not needed by a run that finds nothing new in the log
+HEAVY_MODULES = ("aiohttp", "sqlalchemy", "pydantic", "tenacity")
+
+
+def test_entry_point_does_not_import_heavy_modules() -> None:
+    """The database and HTTP stacks are only imported once there is something to ingest."""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, fail2banmonitoring.__main__; print(' '.join(sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {name.partition(".")[0] for name in result.stdout.split()}
+
+    assert not modules.intersection(HEAVY_MODULES)  # noqa: S101
@@ -0,0 +1,64 @@
+import ipaddress
+import pathlib
+import random
+from collections import Counter
+
+from fail2banmonitoring.fail2ban.events import BanEvent
+from fail2banmonitoring.services.ip import IPMetadata
+from fail2banmonitoring.subnets import PrefixTrie, SubnetIndex
+
+
+def _ban(ip: str) -> BanEvent:
+    return BanEvent(None, "sshd", "Ban", ip, None)
+
+
+def test_index_accumulates_bans_per_subnet_and_as(tmp_path: pathlib.Path) -> None:
+    """Bans added over several runs are reported per subnet and per AS after a reopen."""
+    path = str(tmp_path / "subnets.db")
+    index = SubnetIndex(path)
+    index.add(
+        [_ban("45.1.2.3"), _ban("45.1.2.3"), _ban("45.1.2.9"), _ban("45.1.7.1"), _ban("2001:db8::1")],
+        {
+            "45.1.2.3": IPMetadata(status="success", query="45.1.2.3", **{"as": "AS1 Example"}),
+            "45.1.7.1": IPMetadata(status="success", query="45.1.7.1", **{"as": "AS1 Example"}),
+        },
+    )
+    index.close()
+    index = SubnetIndex(path)
+    # Not enriched this time: the AS recorded before is kept
+    index.add([_ban("45.1.2.3"), BanEvent(None, "sshd", "Unban", "9.9.9.9", None)], {})
+    clusters = index.load()
+    index.close()
+
+    assert [(s.network, s.bans, s.ips) for s in clusters.top_subnets(24)] == [  # noqa: S101
+        ("45.1.2.0/24", 4, 2),
+        ("45.1.7.0/24", 1, 1),
+    ]
+    assert [(s.network, s.bans) for s in clusters.top_subnets(16)] == [("45.1.0.0/16", 5)]  # noqa: S101
+    assert [(s.network, s.bans) for s in clusters.top_subnets(48, ipv6=True)] == [  # noqa: S101
+        ("2001:db8::/48", 1),
+    ]
+    assert [(r.name, r.bans, r.ips, r.subnets) for r in clusters.top_asns()] == [  # noqa: S101
+        ("AS1 Example", 4, 2, 2),
+        ("Unknown", 2, 2, 2),
+    ]
+
+
+def test_trie_matches_counting_by_prefix() -> None:
+    """The trie reports the same top subnets as counting every address by prefix."""
+    rng = random.Random(7)  # noqa: S311
+    bans = {
+        rng.randrange(1 << 24) >> rng.randrange(0, 12) << 8 | rng.randrange(4): rng.randrange(1, 50)
+        for _ in range(2000)
+    }
+    trie = PrefixTrie(32)
+    for address in sorted(bans):
+        trie.append(address, bans[address])
+    assert len(trie) == len(bans)  # noqa: S101
+    for prefix_length in (0, 8, 16, 24, 32):
+        counts: Counter[str] = Counter()
+        for address, count in bans.items():
+            counts[str(ipaddress.IPv4Network((address, prefix_length), strict=False))] += count
+        top = trie.top(prefix_length, 5)
+        assert [subnet.bans for subnet in top] == sorted(counts.values(), reverse=True)[:5]  # noqa: S101
+        assert all(counts[subnet.network] == subnet.bans for subnet in top)  # noqa: S101